@@ -1,6 +1,13 @@
-from openai import OpenAI
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
+from collections import OrderedDict
+import hashlib
 import requests
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+import threading
+import asyncio
+import time
 import os
 import json
 
@@ -13,6 +20,282 @@ config = os.getenv("config")
 config = dict(json.loads(config))
 base_url = os.getenv("base_url")
 max_retry = int(os.getenv("max_retry"))
+# 每個 API 密鑰同時進行的最大請求數
+max_concurrency_per_key = int(os.getenv("llm_max_concurrency_per_key", 4))
+# 範例報告書為網址時，重新驗證 ETag 的間隔秒數
+sample_report_refresh_interval = int(os.getenv("sample_report_refresh_interval", 300))
+# Mermaid 語法回應快取設定
+llm_cache_ttl = int(os.getenv("llm_cache_ttl", 86400))  # 快取有效秒數
+llm_cache_max_entries = int(os.getenv("llm_cache_max_entries", 256))  # 最多保留的回應數
+llm_cache_path = os.getenv("llm_cache_path", "")  # 快取檔案路徑，未設定時只保存在記憶體
+llm_cache_save_delay = float(os.getenv("llm_cache_save_delay", 5))  # 新增回應後延遲多少秒寫入快取檔案 (期間的新增合併為一次寫入)
+
+
+class AsyncLLMClientPool:
+    """
+    多組 API 密鑰共用的非同步 LLM 客戶端池
+
+    每個密鑰只建立一次 AsyncOpenAI 客戶端，並以 Semaphore 限制每個密鑰的同時請求數，
+    讓多個生成請求可以並行，且不會阻塞 FastAPI 的事件迴圈。
+    """
+
+    def __init__(self, api_keys, base_url, max_concurrency_per_key=4):
+        self.api_keys = api_keys
+        self.clients = [AsyncOpenAI(api_key=api_key, base_url=base_url) for api_key in api_keys]
+        self.semaphores = [asyncio.Semaphore(max_concurrency_per_key) for _ in api_keys]
+        self.in_flight = [0] * len(api_keys)
+
+    def _pick_key_index(self, preferred_index):
+        """優先使用指定的密鑰，若已滿載則改用目前請求數最少的密鑰"""
+        if not self.semaphores[preferred_index].locked():
+            return preferred_index
+        return min(range(len(self.clients)), key=lambda index: self.in_flight[index])
+
+    @asynccontextmanager
+    async def client(self, preferred_index=0):
+        """
+        取出一個客戶端，離開時自動釋放該密鑰的名額
+
+        使用方式:
+            async with client_pool.client() as client:
+                response = await client.chat.completions.create(...)
+        """
+        index = self._pick_key_index(preferred_index % len(self.clients))
+        # 等待中的請求也計入，讓後續請求分散到其他密鑰
+        self.in_flight[index] += 1
+        try:
+            async with self.semaphores[index]:
+                yield self.clients[index]
+        finally:
+            self.in_flight[index] -= 1
+
+
+# 依 (密鑰, base_url) 共用客戶端池，避免每個請求重新建立客戶端
+_client_pools = {}
+
+
+def get_client_pool(api_keys, base_url):
+    key = (tuple(api_keys), base_url)
+    if key not in _client_pools:
+        _client_pools[key] = AsyncLLMClientPool(api_keys, base_url, max_concurrency_per_key)
+    return _client_pools[key]
+
+
+class SampleReportIndex:
+    """
+    範例報告書 (Sample_Report.json) 的記憶體索引
+
+    載入一次後以 (產業類別, 章節標題, 子章節標題) 為鍵建立 few-shot 訊息列表，
+    查詢時不需要重新下載或掃描整份檔案。
+    - 來源為本機檔案時，以檔案修改時間 (mtime) 判斷是否需要重新載入
+    - 來源為網址時，每隔 refresh_interval 秒以 ETag 重新驗證一次
+    - 非同步查詢 (aget) 在執行緒中下載與重建索引，不阻塞事件迴圈，同時只會有一個重新載入
+    """
+
+    def __init__(self, source, refresh_interval=300):
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self._index = {}
+        self._mtime = None
+        self._etag = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._refresh_lock = None
+
+    def _is_url(self):
+        return self.source.startswith(("http://", "https://"))
+
+    def _build(self, json_messages):
+        """將範例報告書轉換成 {(category, chapterTitle, subChapterTitle): messages} 索引"""
+        index = {}
+        for category, category_data in json_messages.items():
+            for chapter in category_data.get("chapters", []):
+                for sub_chapter in chapter["subChapters"]:
+                    key = (category, chapter["chapterTitle"], sub_chapter["subChapterTitle"])
+                    # 同名章節以第一筆為準 (與逐筆搜尋的結果一致)
+                    if key in index:
+                        continue
+                    messages = [{"role": "system", "content": sub_chapter["system_prompt"]}]
+                    for training_data in sub_chapter["data"]:
+                        messages.append({"role": "user", "content": training_data["input"]})
+                        messages.append({"role": "assistant", "content": training_data["output"]})
+                    index[key] = messages
+        return index
+
+    def _needs_refresh(self):
+        """是否需要檢查來源 (網址依間隔時間，本機檔案依修改時間)"""
+        if self._is_url():
+            return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_interval
+        return os.path.getmtime(self.source) != self._mtime
+
+    def _refresh(self):
+        """檢查來源是否有更新，有更新時重建索引 (會阻塞，非同步環境中須在執行緒中執行)"""
+        if self._is_url():
+            headers = {"If-None-Match": self._etag} if self._etag else {}
+            self._loaded_at = time.monotonic()
+            response = requests.get(self.source, headers=headers, timeout=30)
+            if response.status_code == 304:
+                return
+            response.raise_for_status()
+            index = self._build(response.json())
+            with self._lock:
+                self._index = index
+            self._etag = response.headers.get("ETag")
+        else:
+            mtime = os.path.getmtime(self.source)
+            with open(self.source, "r", encoding="utf-8") as file:
+                index = self._build(json.load(file))
+            with self._lock:
+                self._index = index
+            self._mtime = mtime
+
+    def _lookup(self, category, chapter_title, sub_chapter_title):
+        with self._lock:
+            messages = self._index.get((category, chapter_title, sub_chapter_title), [])
+        return list(messages)
+
+    def get(self, category, chapter_title, sub_chapter_title):
+        """取得指定章節的 few-shot 訊息列表，找不到時返回空列表 (同步版本，供非事件迴圈的程式使用)"""
+        if self._needs_refresh():
+            self._refresh()
+        return self._lookup(category, chapter_title, sub_chapter_title)
+
+    async def aget(self, category, chapter_title, sub_chapter_title):
+        """取得指定章節的 few-shot 訊息列表，找不到時返回空列表 (非同步版本)"""
+        if self._needs_refresh():
+            if self._refresh_lock is None:
+                self._refresh_lock = asyncio.Lock()
+            async with self._refresh_lock:
+                # 等待期間其他請求可能已完成重新載入
+                if self._needs_refresh():
+                    await asyncio.to_thread(self._refresh)
+        return self._lookup(category, chapter_title, sub_chapter_title)
+
+
+# 依來源共用範例報告書索引
+_sample_report_indexes = {}
+
+
+def get_sample_report_index(source):
+    if source not in _sample_report_indexes:
+        _sample_report_indexes[source] = SampleReportIndex(source, sample_report_refresh_interval)
+    return _sample_report_indexes[source]
+
+
+class LLMResponseCache:
+    """
+    LLM 回應快取
+
+    以正規化後的輸入內容雜湊為鍵，保存 LLM 的回應，相同的請求直接返回快取結果。
+    - 超過 ttl 秒的回應視為過期
+    - 超過 max_entries 筆時刪除最久未使用的回應 (LRU)
+    - 設定 persist_path 時會將快取寫入本機檔案，服務重啟後仍可使用
+    - 寫入檔案延遲 save_delay 秒合併進行，並在執行緒中寫入暫存檔後改名，不阻塞事件迴圈
+    """
+
+    def __init__(self, ttl=86400, max_entries=256, persist_path="", save_delay=5.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.persist_path = persist_path
+        self.save_delay = save_delay
+        # key -> (建立時間, 回應內容 dict)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_task = None
+        self._load()
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        將輸入內容正規化後計算雜湊
+
+        字串只統一換行符號並去除每行行尾空白 (保留縮排與換行，Mermaid 等程式碼的行結構不同時鍵值也不同)，
+        字典依鍵排序
+        """
+        normalized = []
+        for part in parts:
+            if isinstance(part, str):
+                lines = part.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+                normalized.append("\n".join(line.rstrip() for line in lines).rstrip("\n"))
+            else:
+                normalized.append(part)
+        return hashlib.sha256(json.dumps(normalized, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def _load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as file:
+                for key, (created_at, value) in json.load(file).items():
+                    self._entries[key] = (created_at, value)
+            self._evict()
+        except Exception as e:
+            print(f"載入 LLM 回應快取失敗: {e}")
+
+    def _write(self, entries):
+        """將快取寫入暫存檔後改名 (會阻塞，非同步環境中須在執行緒中執行)"""
+        try:
+            temp_path = f"{self.persist_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump(entries, file, ensure_ascii=False)
+            os.replace(temp_path, self.persist_path)
+        except Exception as e:
+            print(f"寫入 LLM 回應快取失敗: {e}")
+
+    async def _save_later(self):
+        await asyncio.sleep(self.save_delay)
+        # 先清除排程再取快照，寫入期間的新增會排定下一次寫入
+        self._save_task = None
+        with self._lock:
+            entries = dict(self._entries)
+        await asyncio.to_thread(self._write, entries)
+
+    def _schedule_save(self):
+        """排定寫入快取檔案，沒有事件迴圈時直接寫入"""
+        if not self.persist_path:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            with self._lock:
+                entries = dict(self._entries)
+            self._write(entries)
+            return
+        if self._save_task is None:
+            self._save_task = loop.create_task(self._save_later())
+
+    def _evict(self):
+        """刪除過期的回應，並將數量限制在 max_entries 內"""
+        now = time.time()
+        for key in [key for key, (created_at, _) in self._entries.items() if now - created_at > self.ttl]:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """取得快取的回應，不存在或已過期時返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created_at, value = entry
+            if time.time() - created_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            self._evict()
+        self._schedule_save()
+
+
+# Mermaid 語法回應快取
+mermaid_response_cache = LLMResponseCache(llm_cache_ttl, llm_cache_max_entries, llm_cache_path, llm_cache_save_delay)
+
 
 class GeminiGenerator:
     def __init__(self, api_keys, model_name, generation_config, base_url, max_retry):
@@ -27,24 +310,17 @@ class GeminiGenerator:
         # 設定最大重試次數
         self.max_retry = max_retry
         
-        self.client = OpenAI(
-            api_key=self.current_api_key,
-            base_url=self.base_url
-        )
+        self.client_pool = get_client_pool(self.api_keys, self.base_url)
 
 
     def switch_api_key(self):
         current_key_index = self.api_keys.index(self.current_api_key)
         next_key_index = (current_key_index + 1) % self.api_count
         self.current_api_key = self.api_keys[next_key_index]
-        self.client = OpenAI(
-            api_key=self.current_api_key,
-            base_url=self.base_url
-        )
         print(f"切換到新的API密鑰: {next_key_index + 1}")
 
 
-    def get_messages(self, category: str, chapter_title: str, sub_chapter_title: str, url: str):
+    async def get_messages(self, category: str, chapter_title: str, sub_chapter_title: str, url: str):
         """
         獲取特定類別、章節和子章節的訓練數據
 
@@ -52,47 +328,14 @@ class GeminiGenerator:
         category (str): 產業類別，例如：金融業
         chapter_title (str): 章節標題，例如：關於本報告書
         sub_chapter_title (str): 子章節標題，例如：關於本報告書
+        url (str): 範例報告書的網址或本機檔案路徑
 
         返回:
         list: 包含 system prompt 和訓練數據的消息列表
         """
         try:
-            # 從 URL 獲取資料
-            url = url
-            response = requests.get(url)
-            response.raise_for_status()  # 檢查請求是否成功
-            json_messages = response.json()
-            
-            # 獲取指定類別的數據
-            category_data = json_messages.get(category, {})
-            chapters = category_data.get("chapters", [])
-            
-            # 查找指定章節
-            for chapter in chapters:
-                if chapter["chapterTitle"] == chapter_title:
-                    # 搜尋指定子章節
-                    for sub_chapter in chapter["subChapters"]:
-                        if sub_chapter["subChapterTitle"] == sub_chapter_title:
-                            messages = []
-                            # 添加 system prompt
-                            messages.append({
-                                "role": "system",
-                                "content": sub_chapter["system_prompt"]
-                            })
-                            # 添加訓練數據
-                            for training_data in sub_chapter["data"]:
-                                messages.append({
-                                    "role": "user",
-                                    "content": training_data["input"]
-                                })
-                                messages.append({
-                                    "role": "assistant",
-                                    "content": training_data["output"]
-                                })
-                            return messages
-            
-            # 如果沒有找到匹配的資料，返回空列表
-            return []
+            # 從已載入的索引取得資料 (來源有更新時才會重新載入)
+            return await get_sample_report_index(url).aget(category, chapter_title, sub_chapter_title)
         except Exception as e:
             print(f"獲取訓練數據時出現錯誤: {e}")
             return []
@@ -100,11 +343,12 @@ class GeminiGenerator:
 
     async def generate_text(self, messages, prompt, retry_count=0):
         try:
-            response = self.client.chat.completions.create(
-                model = self.model_name,
-                messages = messages + [{"role": "user", "content": prompt}],
-                **self.generation_config
-            )
+            async with self.client_pool.client(self.api_keys.index(self.current_api_key)) as client:
+                response = await client.chat.completions.create(
+                    model = self.model_name,
+                    messages = messages + [{"role": "user", "content": prompt}],
+                    **self.generation_config
+                )
             return response.choices[0].message
         except Exception as e:
             print(f"生成文本時發生錯誤: {e}")
@@ -116,6 +360,43 @@ class GeminiGenerator:
                 return None
 
 
+    async def generate_text_stream(self, messages, prompt, retry_count=0):
+        """
+        以串流方式生成文本，逐段產出 LLM 回傳的文字
+
+        尚未產出任何文字前發生錯誤時會切換 API 密鑰重試；
+        呼叫端關閉此產生器 (例如客戶端中斷連線) 時會一併關閉上游的串流請求。
+        """
+        started = False
+        try:
+            async with self.client_pool.client(self.api_keys.index(self.current_api_key)) as client:
+                stream = await client.chat.completions.create(
+                    model = self.model_name,
+                    messages = messages + [{"role": "user", "content": prompt}],
+                    stream = True,
+                    **self.generation_config
+                )
+                try:
+                    async for chunk in stream:
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            started = True
+                            yield delta
+                finally:
+                    # 中止上游請求
+                    await stream.close()
+        except Exception as e:
+            print(f"串流生成文本時發生錯誤: {e}")
+            if not started and retry_count < self.max_retry:
+                self.switch_api_key()
+                async for delta in self.generate_text_stream(messages, prompt, retry_count + 1):
+                    yield delta
+            else:
+                raise
+
+
     # 透過 LLM 將輸入的文字轉換成 Mermaid 語法
     async def llm_to_mermaid(self, llm_input, reference_data=None, retry_count=0):
         """
@@ -126,24 +407,32 @@ class GeminiGenerator:
         try:
             if reference_data is None:
                 reference_data = "flowchart TD\n    %% 定義顏色和樣式\n    classDef topLevel fill:#008080, color:#fff, stroke:#005050, stroke-width:1px, rx:5px, ry:5px\n    classDef committee fill:#004080, color:#fff, stroke:#002060, stroke-width:1px, rx:5px, ry:5px\n    classDef subgroup fill:#a8e0a8, color:#000, stroke:#70c070, stroke-width:1px, rx:5px, ry:5px\n    classDef socialGroup fill:#ffbb33, color:#000, stroke:#e09b20, stroke-width:1px, rx:5px, ry:5px\n    classDef governanceGroup fill:#66b3ff, color:#000, stroke:#3399ff, stroke-width:1px, rx:5px, ry:5px\n    classDef item fill:#f0f0f0, color:#000, stroke:#ccc, stroke-width:1px, rx:3px, ry:3px\n\n    %% 節點定義與連接\n    A[董事會]:::topLevel --> B[總經理室]:::topLevel\n    B --> C[金寶永續發展委員會]:::committee\n    C --> D[金寶 ESG 工作小組]\n\n    D --> E[fa:fa-leaf 環境永續 小組]:::subgroup\n    D --> F[fa:fa-handshake 社會共融 小組]:::socialGroup\n    D --> G[fa:fa-bullseye 永續治理 小組]:::governanceGroup\n\n    E --> E1[供應鏈管理]:::item\n    E --> E2[責任礦產管理]:::item\n    E --> E3[限禁用物質管理]:::item\n    E --> E4[供應鏈永續管理]:::item\n    E --> E5[綠色採購]:::item\n    E --> E6[在地採購]:::item\n    E --> E7[永續生產]:::item\n    E --> E8[溫室氣體管理]:::item\n    E --> E9[能源管理]:::item\n    E --> E10[綠色產品設計]:::item\n    E --> E11[水資源管理]:::item\n    E --> E12[廢棄物管理]:::item\n\n    F --> F1[員工照顧]:::item\n    F --> F2[友善工作環境]:::item\n    F --> F3[薪酬與福利]:::item\n    F --> F4[勞資關係]:::item\n    F --> F5[教育訓練]:::item\n    F --> F6[社會參與]:::item\n    F --> F7[弱勢關懷]:::item\n    F --> F8[公益活動]:::item\n    F --> F9[社區參與]:::item\n\n    G --> G1[公司治理]:::item\n    G --> G2[經濟績效]:::item\n    G --> G3[誠信經營]:::item\n    G --> G4[法規遵循]:::item\n    G --> G5[資訊安全]:::item\n    G --> G6[智慧財產權]:::item"
+            # 相同的輸入直接使用快取的回應
+            cache_key = LLMResponseCache.make_key(llm_input, reference_data, self.model_name, self.generation_config)
+            cached_response = mermaid_response_cache.get(cache_key)
+            if cached_response is not None:
+                return ChatCompletion.model_validate(cached_response)
+
             prompt_input_content = f"文字描述: ```{llm_input}```\n\nMermaid 語法參考範例: ```{reference_data}```"
-            response = self.client.chat.completions.create(
-                model = self.model_name,
-                messages = [
-                    {"role": "system", "content": "你是一位擁有極高美感與藝術修養的視覺設計師。我將提供文字描述以及 Mermaid 語法的參考範例。請根據我提供的文字內容中描述的設計元素、佈局和層次結構，生成與文字對應的 Mermaid 語法。請遵循以下要求：\n\n1. 仔細理解文字描述：請詳細閱讀並理解我提供的文字內容，抓住其中的設計思路、主要元素、佈局安排和層次關係。\n2. 參考 Mermaid 範例：參照提供的 Mermaid 語法範例，確保輸出語法格式正確，並根據情境選擇合適的圖表類型（例如：flowchart、sequence diagram、class diagram 等）。\n3. 生成對應語法：根據文字描述中的內容，生成能夠完整反映設計元素、佈局和層次結構的 Mermaid 語法。\n4. 保持語法精確與清晰：確保生成的 Mermaid 語法邏輯清晰、易讀，並正確展現設計意圖。\n\n請開始根據我後續提供的文字描述和參考範例生成對應的 Mermaid 語法。"},
-                    {"role": "user", "content": f"input: {prompt_input_content}"},
-                ],
-                **self.generation_config
-            )
+            async with self.client_pool.client(self.api_keys.index(self.current_api_key)) as client:
+                response = await client.chat.completions.create(
+                    model = self.model_name,
+                    messages = [
+                        {"role": "system", "content": "你是一位擁有極高美感與藝術修養的視覺設計師。我將提供文字描述以及 Mermaid 語法的參考範例。請根據我提供的文字內容中描述的設計元素、佈局和層次結構，生成與文字對應的 Mermaid 語法。請遵循以下要求：\n\n1. 仔細理解文字描述：請詳細閱讀並理解我提供的文字內容，抓住其中的設計思路、主要元素、佈局安排和層次關係。\n2. 參考 Mermaid 範例：參照提供的 Mermaid 語法範例，確保輸出語法格式正確，並根據情境選擇合適的圖表類型（例如：flowchart、sequence diagram、class diagram 等）。\n3. 生成對應語法：根據文字描述中的內容，生成能夠完整反映設計元素、佈局和層次結構的 Mermaid 語法。\n4. 保持語法精確與清晰：確保生成的 Mermaid 語法邏輯清晰、易讀，並正確展現設計意圖。\n\n請開始根據我後續提供的文字描述和參考範例生成對應的 Mermaid 語法。"},
+                        {"role": "user", "content": f"input: {prompt_input_content}"},
+                    ],
+                    **self.generation_config
+                )
             # 每次請求後，切換 API 密鑰
             self.switch_api_key()
+            mermaid_response_cache.set(cache_key, response.model_dump())
             return response
         
         except Exception as e:
             print(f"生成對應的 GRI 準則時發生錯誤: {e}")
             if retry_count < self.max_retry:
                 self.switch_api_key()
-                return await self.llm_to_mermaid(prompt_input_content, reference_data, retry_count + 1)
+                return await self.llm_to_mermaid(llm_input, reference_data, retry_count + 1)
             else:
                 print(f"已達到最大重試次數 {self.max_retry}，無法生成回應，請聯絡客服")
                 return None
@@ -158,7 +447,7 @@ async def main():
     chapter_title = "長官的話"
     sub_chapter_title = "長官的話"
     url = "http://localhost:8001/api/Sample_Report.json"
-    messages = generator.get_messages(category, chapter_title, sub_chapter_title, url)
+    messages = await generator.get_messages(category, chapter_title, sub_chapter_title, url)
     # print(messages)
     # 生成文本
     prompt = "公司名稱：綠色金控\n\n報告期間：2024年\n\n報告書範疇：本報告書涵蓋的範疇包括 綠色金融控股公司及其全資子公司（綠色銀行、綠色證券、綠色人壽、綠色 投信、綠色 投顧）之企業永續發展實踐與成果。報告書中提到的「綠色金控」、或「本公司」皆指包含以上所有營運個體之整體。\n\n報告書撰寫原則：依據GRI，SASB，TCFD\n\n聯絡資訊：Green Financial Holding Co., Ltd. 地址：106台北市大安區敦化南路一段233號10樓 電話：(02)2709-2888 傳真：(02)2709-2899 信箱：green@greenfinancial.com.tw 網站\n：www.greenfinancial.com.tw"
@@ -168,5 +457,4 @@ async def main():
 
 if __name__ == "__main__":
     # 運行異步函數
-    import asyncio
     asyncio.run(main())
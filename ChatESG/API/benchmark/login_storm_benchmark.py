@@ -0,0 +1,130 @@
+# 登入尖峰效能測試
+# 大量同時登入時，量測其他需要查詢資料庫的 API (/api/user/profile/Personal_Information) 的延遲是否維持穩定
+# 使用方式 (需先啟動 chatESG_FastAPI.py):
+#   python benchmark/login_storm_benchmark.py --logins 200 --concurrency 50
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import string
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import aiomysql
+import bcrypt
+import requests
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_pool import load_db_config
+
+# 資料庫配置 (與 chatESG_FastAPI.py 相同，從 .env 的 db_host / db_port / db_user / db_password / db_name 讀取)
+load_dotenv()
+DB_CONFIG, _ = load_db_config()
+
+BASE_URL = "http://127.0.0.1:8000"
+LOGIN_URL = f"{BASE_URL}/api/login"
+PROBE_URL = f"{BASE_URL}/api/user/profile/Personal_Information"  # 需要取得資料庫連線的 API
+BCRYPT_ROUNDS = 12
+TEST_PASSWORD = "benchmark-password"
+
+
+async def create_test_user():
+    """建立測試用的使用者，返回 (使用者ID bytes, 使用者名稱)"""
+    suffix = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+    user_id = uuid.uuid4().bytes
+    user_name = f"bench_login_{suffix}"
+    hashed_password = bcrypt.hashpw(TEST_PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+    conn = await aiomysql.connect(**DB_CONFIG)
+    try:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                INSERT INTO Users (UserID, UserName, UserPassword, UserEmail)
+                VALUES (%s, %s, %s, %s)
+            """, (user_id, user_name, hashed_password, f"{user_name}@example.com"))
+        await conn.commit()
+    finally:
+        conn.close()
+    return user_id, user_name
+
+
+async def delete_test_user(user_id):
+    conn = await aiomysql.connect(**DB_CONFIG)
+    try:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM Users WHERE UserID = %s", (user_id,))
+        await conn.commit()
+    finally:
+        conn.close()
+
+
+def probe(user_id, stop_event, interval):
+    """持續呼叫需要查詢資料庫的 API 直到 stop_event 被設定，回傳每次的延遲 (毫秒)"""
+    latencies = []
+    session = requests.Session()
+    while not stop_event.is_set():
+        start_time = time.perf_counter()
+        session.post(PROBE_URL, json={"user_id": uuid.UUID(bytes=user_id).hex}).raise_for_status()
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        time.sleep(interval)
+    return latencies
+
+
+def login_storm(user_name, logins, concurrency):
+    """以 concurrency 個執行緒同時登入，回傳 (每次登入的延遲 (毫秒), 失敗次數)"""
+    def login_once(_):
+        start_time = time.perf_counter()
+        response = requests.post(LOGIN_URL, json={"username": user_name, "password": TEST_PASSWORD})
+        return (time.perf_counter() - start_time) * 1000, response.status_code
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(login_once, range(logins)))
+    return [latency for latency, _ in results], sum(1 for _, code in results if code != 200)
+
+
+def measure_probe(user_id, duration, interval, storm=None):
+    """量測探測 API 的延遲；有 storm 時在登入尖峰期間量測"""
+    stop_event = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        probe_future = executor.submit(probe, user_id, stop_event, interval)
+        storm_result = storm() if storm else time.sleep(duration)
+        stop_event.set()
+        return probe_future.result(), storm_result
+
+
+def report(name, latencies):
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{name:>12} {len(latencies):>8} {statistics.median(latencies):>10.1f} {p95:>10.1f} {latencies[-1]:>10.1f}")
+
+
+async def main(logins, concurrency, interval):
+    user_id, user_name = await create_test_user()
+    try:
+        baseline, _ = await asyncio.to_thread(measure_probe, user_id, 5, interval)
+        during_storm, (login_latencies, failures) = await asyncio.to_thread(
+            measure_probe, user_id, 0, interval, lambda: login_storm(user_name, logins, concurrency)
+        )
+    finally:
+        await delete_test_user(user_id)
+
+    print(f"{'量測':>12} {'次數':>8} {'p50(ms)':>10} {'p95(ms)':>10} {'最大(ms)':>10}")
+    report("無登入", baseline)
+    report("登入尖峰", during_storm)
+    report("登入請求", login_latencies)
+    print(f"登入失敗次數 (含 503 排隊逾時): {failures}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="測試大量同時登入時其他 API 的延遲")
+    parser.add_argument("--logins", type=int, default=200, help="登入請求總數")
+    parser.add_argument("--concurrency", type=int, default=50, help="同時登入的數量")
+    parser.add_argument("--interval", type=float, default=0.05, help="探測 API 的呼叫間隔秒數")
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.concurrency, args.interval))
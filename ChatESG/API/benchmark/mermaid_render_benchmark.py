@@ -0,0 +1,77 @@
+# Mermaid 渲染效能測試
+# 比較「每張圖啟動一次 mmdc」與「常駐瀏覽器渲染」的 p50/p95 延遲
+# 使用方式 (在 API 目錄下執行，需要 .env):
+#   python benchmark/mermaid_render_benchmark.py --count 20 --concurrency 1
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mermaid import MermaidRenderPool, MermaidBrowserRenderer, mermaid_render_timeout, mermaid_js_source
+
+SAMPLE_MERMAID = """flowchart TD
+    A[董事會] --> B[總經理室]
+    B --> C[永續發展委員會]
+    C --> D[ESG 工作小組]
+    D --> E[環境永續 小組]
+    D --> F[社會共融 小組]
+    D --> G[永續治理 小組]
+    E --> E1[溫室氣體管理]
+    E --> E2[能源管理]
+    F --> F1[員工照顧]
+    F --> F2[社會參與]
+    G --> G1[公司治理]
+    G --> G2[資訊安全]"""
+
+
+async def measure(renderer, count, concurrency, output_dir):
+    """渲染 count 張圖並回傳每張的延遲 (毫秒)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def render_one(index):
+        async with semaphore:
+            start_time = time.perf_counter()
+            await renderer.render(SAMPLE_MERMAID, os.path.join(output_dir, f"{index}.png"), "png")
+            latencies.append((time.perf_counter() - start_time) * 1000)
+
+    await asyncio.gather(*(render_one(index) for index in range(count)))
+    return latencies
+
+
+def report(name, latencies):
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{name:>10} {statistics.median(latencies):>10.1f} {p95:>10.1f} {statistics.mean(latencies):>10.1f}")
+
+
+async def main(count, concurrency):
+    with tempfile.TemporaryDirectory() as output_dir:
+        print(f"{'方式':>10} {'p50(ms)':>10} {'p95(ms)':>10} {'平均(ms)':>10}")
+
+        # 渲染逾時與 mermaid.js 來源使用 .env 的設定 (mermaid_render_timeout / mermaid_js_source)，排隊上限放寬以容納所有測試圖片
+        mmdc_pool = MermaidRenderPool(max_workers=concurrency, max_queue=count, queue_timeout=600, render_timeout=mermaid_render_timeout)
+        report("mmdc", await measure(mmdc_pool, count, concurrency, output_dir))
+
+        browser_renderer = MermaidBrowserRenderer(pages=concurrency, queue_timeout=600, render_timeout=mermaid_render_timeout,
+                                                  mermaid_js=mermaid_js_source)
+        start_time = time.perf_counter()
+        await browser_renderer.start()
+        print(f"(瀏覽器啟動時間: {(time.perf_counter() - start_time) * 1000:.1f} ms，不計入渲染延遲)")
+        try:
+            report("browser", await measure(browser_renderer, count, concurrency, output_dir))
+        finally:
+            await browser_renderer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比較 mmdc 與常駐瀏覽器的 Mermaid 渲染延遲")
+    parser.add_argument("--count", type=int, default=20, help="每種方式渲染的圖片數")
+    parser.add_argument("--concurrency", type=int, default=1, help="同時渲染的數量")
+    args = parser.parse_args()
+    asyncio.run(main(args.count, args.concurrency))
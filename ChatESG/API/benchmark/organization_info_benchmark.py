@@ -0,0 +1,127 @@
+# 組織資訊 API 效能測試
+# 測試 /api/organizations/info 的延遲與成員數量的關係
+# 使用方式 (需先啟動 chatESG_FastAPI.py):
+#   python benchmark/organization_info_benchmark.py --members 10 50 100 300 --rounds 20
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import string
+import sys
+import time
+import uuid
+
+import aiomysql
+import requests
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_pool import load_db_config
+
+# 資料庫配置 (與 chatESG_FastAPI.py 相同，從 .env 的 db_host / db_port / db_user / db_password / db_name 讀取)
+load_dotenv()
+DB_CONFIG, _ = load_db_config()
+
+API_URL = "http://127.0.0.1:8000/api/organizations/info"
+ROLES_PER_ORGANIZATION = 5
+ROLES_PER_MEMBER = 2
+
+
+async def create_test_organization(member_count):
+    """
+    建立測試用的組織、成員與角色
+
+    Args:
+        member_count: 成員數量
+
+    Returns:
+        tuple: (組織ID bytes, 使用者ID bytes 列表)
+    """
+    suffix = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+    organization_id = uuid.uuid4().bytes
+    user_ids = [uuid.uuid4().bytes for _ in range(member_count)]
+    role_ids = [uuid.uuid4().bytes for _ in range(ROLES_PER_ORGANIZATION)]
+
+    conn = await aiomysql.connect(**DB_CONFIG)
+    try:
+        async with conn.cursor() as cur:
+            await cur.executemany("""
+                INSERT INTO Users (UserID, UserName, UserPassword, UserEmail)
+                VALUES (%s, %s, %s, %s)
+            """, [
+                (user_id, f"bench_{suffix}_{i}", "benchmark", f"bench_{suffix}_{i}@example.com")
+                for i, user_id in enumerate(user_ids)
+            ])
+            await cur.execute("""
+                INSERT INTO Organizations (OrganizationID, OrganizationName, OrganizationCode, OwnerID, PurchaseType, MaxMembers)
+                VALUES (%s, %s, %s, %s, 'Test', %s)
+            """, (organization_id, f"benchmark_{suffix}", suffix, user_ids[0], member_count))
+            await cur.executemany("""
+                INSERT INTO OrganizationMembers (OrganizationID, UserID)
+                VALUES (%s, %s)
+            """, [(organization_id, user_id) for user_id in user_ids])
+            await cur.executemany("""
+                INSERT INTO Roles (RoleID, OrganizationID, RoleName)
+                VALUES (%s, %s, %s)
+            """, [(role_id, organization_id, f"role_{i}") for i, role_id in enumerate(role_ids)])
+            await cur.executemany("""
+                INSERT INTO UserRoles (UserID, RoleID, OrganizationID)
+                VALUES (%s, %s, %s)
+            """, [
+                (user_id, role_id, organization_id)
+                for user_id in user_ids
+                for role_id in random.sample(role_ids, ROLES_PER_MEMBER)
+            ])
+        await conn.commit()
+    finally:
+        conn.close()
+    return organization_id, user_ids
+
+
+async def delete_test_organization(organization_id, user_ids):
+    """刪除測試資料 (成員與角色會隨組織一併刪除)"""
+    conn = await aiomysql.connect(**DB_CONFIG)
+    try:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM Organizations WHERE OrganizationID = %s", (organization_id,))
+            await cur.executemany("DELETE FROM Users WHERE UserID = %s", [(user_id,) for user_id in user_ids])
+        await conn.commit()
+    finally:
+        conn.close()
+
+
+def measure(organization_id, rounds):
+    """連續呼叫 API 並回傳每次的延遲 (毫秒)"""
+    payload = {"organization_id": uuid.UUID(bytes=organization_id).hex}
+    # 暖機
+    requests.post(API_URL, json=payload).raise_for_status()
+    latencies = []
+    for _ in range(rounds):
+        start_time = time.perf_counter()
+        response = requests.post(API_URL, json=payload)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        response.raise_for_status()
+    return latencies
+
+
+async def main(member_counts, rounds):
+    print(f"{'成員數':>8} {'平均(ms)':>10} {'p50(ms)':>10} {'p95(ms)':>10}")
+    for member_count in member_counts:
+        organization_id, user_ids = await create_test_organization(member_count)
+        try:
+            latencies = await asyncio.to_thread(measure, organization_id, rounds)
+        finally:
+            await delete_test_organization(organization_id, user_ids)
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"{member_count:>8} {statistics.mean(latencies):>10.2f} {statistics.median(latencies):>10.2f} {p95:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="測試 /api/organizations/info 延遲與成員數量的關係")
+    parser.add_argument("--members", type=int, nargs="+", default=[10, 50, 100, 300], help="測試的成員數量")
+    parser.add_argument("--rounds", type=int, default=20, help="每種成員數量的呼叫次數")
+    args = parser.parse_args()
+    asyncio.run(main(args.members, args.rounds))
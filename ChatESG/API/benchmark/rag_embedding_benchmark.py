@@ -0,0 +1,82 @@
+# RAG 嵌入模型效能測試
+# 測試不同嵌入後端在 CPU 上對 rag_file/db 的查詢吞吐量 (queries/sec)
+# 使用方式:
+#   python benchmark/rag_embedding_benchmark.py --backend torch int8 onnx --threads 4 --rounds 5
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from dotenv import load_dotenv
+
+# 與 rag_main.py 相同，從 .env 讀取 rag_db_path / rag_cpu_threads / rag_embedding_onnx_file
+load_dotenv()
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB_PATH = os.getenv("rag_db_path", os.path.join(API_DIR, "rag_file", "db"))
+QUESTIONS_PATH = os.path.join(API_DIR, "rag_file", "GRI_準則.txt")
+
+
+def load_questions():
+    """使用 GRI 準則清單作為測試問題"""
+    with open(QUESTIONS_PATH, "r", encoding="utf-8") as file:
+        return [line.strip().replace("：", " ") for line in file if line.strip()]
+
+
+def run_backend(backend, device, threads, rounds, db_path):
+    """在目前的程序中測試單一後端 (rag_main 於載入時讀取環境變數)"""
+    os.environ["rag_embedding_device"] = device
+    os.environ["rag_embedding_backend"] = backend
+    os.environ["rag_cpu_threads"] = str(threads)
+    os.environ["rag_db_path"] = db_path
+    sys.path.insert(0, API_DIR)
+
+    load_start = time.perf_counter()
+    from rag_main import find_most_relevant_answer, find_most_relevant_answers, retriever
+    retriever.warmup()
+    load_time = time.perf_counter() - load_start
+
+    questions = load_questions()
+
+    # 逐筆查詢
+    start_time = time.perf_counter()
+    for _ in range(rounds):
+        for question in questions:
+            find_most_relevant_answer(question)
+    single_qps = len(questions) * rounds / (time.perf_counter() - start_time)
+
+    # 批次查詢
+    start_time = time.perf_counter()
+    for _ in range(rounds):
+        find_most_relevant_answers(questions)
+    batch_qps = len(questions) * rounds / (time.perf_counter() - start_time)
+
+    print(f"{backend:>8} {device:>6} {threads:>8} {load_time:>10.2f} {single_qps:>12.2f} {batch_qps:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="測試嵌入後端在 CPU 上的查詢吞吐量")
+    parser.add_argument("--backend", nargs="+", default=["torch", "int8", "onnx"], help="要測試的嵌入後端")
+    parser.add_argument("--device", default="cpu", help="運算裝置 (auto / cuda / mps / cpu)")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("rag_cpu_threads", 0)), help="CPU 執行緒數，0 表示使用預設值")
+    parser.add_argument("--rounds", type=int, default=5, help="每個後端重複查詢的輪數")
+    parser.add_argument("--db-path", default=DEFAULT_DB_PATH, help="向量資料庫路徑")
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_backend(args.single, args.device, args.threads, args.rounds, args.db_path)
+    else:
+        print(f"{'後端':>8} {'裝置':>6} {'執行緒':>8} {'載入(s)':>10} {'逐筆(q/s)':>12} {'批次(q/s)':>12}")
+        # 每個後端使用獨立的程序，避免模型與執行緒設定互相影響
+        for backend in args.backend:
+            subprocess.run([
+                sys.executable, os.path.abspath(__file__),
+                "--single", backend,
+                "--device", args.device,
+                "--threads", str(args.threads),
+                "--rounds", str(args.rounds),
+                "--db-path", args.db_path
+            ], check=False)
@@ -0,0 +1,309 @@
+import asyncio
+import os
+import time
+
+
+# 區塊鎖定租約設定
+BLOCK_LOCK_LEASE_SECONDS = int(os.getenv("block_lock_lease_seconds", 30))  # 租約有效秒數，用戶端須在到期前續約 (心跳)
+BLOCK_LOCK_SWEEP_INTERVAL = int(os.getenv("block_lock_sweep_interval", 5))  # 清除過期鎖定並同步其他程序鎖定的間隔秒數
+BLOCK_LOCK_CLEANUP_EVERY = int(os.getenv("block_lock_cleanup_every", 60))  # 每幾次清除才檢查一次缺少鎖定者或續約時間的異常鎖定
+
+
+class BlockLockError(Exception):
+    """
+    區塊鎖定操作失敗
+
+    reason:
+        not_found: 找不到指定的區塊
+        locked: 區塊已被其他用戶鎖定 (locked_by 為鎖定者)
+        not_locked: 區塊未被鎖定
+        not_owner: 區塊由其他用戶鎖定，無權解鎖
+        expired: 租約已過期或已被其他用戶取得，須重新鎖定
+    """
+
+    def __init__(self, reason: str, locked_by: bytes = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.locked_by = locked_by
+
+
+class BlockLockManager:
+    """
+    區塊鎖定租約管理
+
+    鎖定以短期租約表示，用戶端定期呼叫 heartbeat 續約，停止續約 (關閉頁面、斷線) 的鎖定在租約到期後自動釋放。
+    - 鎖定表保存在記憶體中，只供頁面顯示鎖定狀態 (check_page_lock) 使用，可能落後其他程序最多一個清除間隔
+    - 鎖定、續約、解鎖一律以 SELECT ... FOR UPDATE 讀取 ReportContentBlocks 後決定 (LockedAt 為最後一次續約時間)，多個 API 程序時以資料庫為準
+    - 背景清除程序定期解除資料庫中過期的鎖定，並重新載入鎖定表以同步其他程序的鎖定
+    """
+
+    def __init__(self, db_pool, lease_seconds=BLOCK_LOCK_LEASE_SECONDS, sweep_interval=BLOCK_LOCK_SWEEP_INTERVAL,
+                 cleanup_every=BLOCK_LOCK_CLEANUP_EVERY):
+        """
+        Args:
+            db_pool: 資料庫連接池
+            lease_seconds: 租約有效秒數
+            sweep_interval: 清除過期鎖定的間隔秒數
+            cleanup_every: 每幾次清除才解除缺少鎖定者或續約時間的鎖定
+        """
+        self.db_pool = db_pool
+        self.lease_seconds = lease_seconds
+        self.sweep_interval = sweep_interval
+        self.cleanup_every = max(1, cleanup_every)
+        self._leases = {}  # 區塊ID -> (資產ID, 鎖定者ID, 到期時間)
+        self._changed = None  # 重新載入期間本程序修改過的區塊ID
+        self._task = None
+
+        # 統計資料
+        self.acquired = 0
+        self.conflicts = 0
+        self.heartbeats = 0
+        self.released = 0
+        self.expired = 0
+        self.sweeps = 0
+        self.last_sweep_ms = 0.0
+
+    def _set(self, block_id: bytes, asset_id: bytes, user_id: bytes, elapsed: float = 0.0):
+        if self._changed is not None:
+            self._changed.add(block_id)
+        self._leases[block_id] = (asset_id, user_id, time.monotonic() + self.lease_seconds - elapsed)
+
+    def _remove(self, block_id: bytes):
+        if self._changed is not None:
+            self._changed.add(block_id)
+        self._leases.pop(block_id, None)
+
+    def get(self, block_id: bytes, asset_id: bytes = None):
+        """
+        從記憶體取得區塊目前的鎖定者 (不查詢資料庫)
+
+        Args:
+            block_id: 區塊ID (UUID bytes)
+            asset_id: 資產ID (UUID bytes)，提供時區塊須屬於此資產
+
+        Returns:
+            bytes: 鎖定者ID，未鎖定或租約已過期時返回 None
+        """
+        lease = self._leases.get(block_id)
+        if not lease or (asset_id and lease[0] != asset_id):
+            return None
+        if lease[2] <= time.monotonic():
+            return None
+        return lease[1]
+
+    async def _select_for_update(self, cur, block_id: bytes, asset_id: bytes):
+        """
+        鎖定區塊資料列並取得目前有效的鎖定者
+
+        Returns:
+            tuple: (是否存在, 鎖定者ID 或 None, 距離最後一次續約的秒數)
+        """
+        await cur.execute("""
+            SELECT IsLocked, LockedBy, TIMESTAMPDIFF(MICROSECOND, LockedAt, NOW(6))
+            FROM ReportContentBlocks
+            WHERE BlockID = %s AND AssetID = %s
+            FOR UPDATE
+        """, (block_id, asset_id))
+        row = await cur.fetchone()
+        if not row:
+            return False, None, 0.0
+        is_locked, locked_by, elapsed = row
+        elapsed = elapsed / 1_000_000 if elapsed is not None else None
+        if not is_locked or not locked_by or elapsed is None or elapsed >= self.lease_seconds:
+            return True, None, 0.0
+        return True, locked_by, elapsed
+
+    async def _renew(self, cur, block_id: bytes, asset_id: bytes, user_id: bytes):
+        await cur.execute("""
+            UPDATE ReportContentBlocks
+            SET IsLocked = TRUE,
+                LockedBy = %s,
+                LockedAt = NOW(6)
+            WHERE BlockID = %s AND AssetID = %s
+        """, (user_id, block_id, asset_id))
+
+    async def acquire(self, block_id: bytes, asset_id: bytes, user_id: bytes):
+        """
+        鎖定區塊並取得租約，已由同一用戶鎖定時視為續約
+
+        Raises:
+            BlockLockError: not_found / locked
+        """
+        async with self.db_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                try:
+                    await conn.begin()
+                    found, holder, elapsed = await self._select_for_update(cur, block_id, asset_id)
+                    if not found:
+                        raise BlockLockError("not_found")
+                    if holder and holder != user_id:
+                        self._set(block_id, asset_id, holder, elapsed)
+                        self.conflicts += 1
+                        raise BlockLockError("locked", holder)
+                    await self._renew(cur, block_id, asset_id, user_id)
+                    await conn.commit()
+                except Exception:
+                    await conn.rollback()
+                    raise
+
+        self._set(block_id, asset_id, user_id)
+        self.acquired += 1
+
+    async def heartbeat(self, block_id: bytes, asset_id: bytes, user_id: bytes):
+        """
+        續約區塊鎖定
+
+        Raises:
+            BlockLockError: not_found / expired (租約已過期或已被其他用戶取得，須重新鎖定)
+        """
+        async with self.db_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                try:
+                    await conn.begin()
+                    found, holder, elapsed = await self._select_for_update(cur, block_id, asset_id)
+                    if not found:
+                        raise BlockLockError("not_found")
+                    if holder != user_id:
+                        if holder:
+                            self._set(block_id, asset_id, holder, elapsed)
+                        else:
+                            self._remove(block_id)
+                        raise BlockLockError("expired", holder)
+                    await self._renew(cur, block_id, asset_id, user_id)
+                    await conn.commit()
+                except Exception:
+                    await conn.rollback()
+                    raise
+
+        self._set(block_id, asset_id, user_id)
+        self.heartbeats += 1
+
+    async def release(self, block_id: bytes, asset_id: bytes, user_id: bytes):
+        """
+        解除區塊鎖定
+
+        Raises:
+            BlockLockError: not_found / not_locked / not_owner
+        """
+        async with self.db_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                try:
+                    await conn.begin()
+                    found, holder, elapsed = await self._select_for_update(cur, block_id, asset_id)
+                    if not found:
+                        raise BlockLockError("not_found")
+                    if not holder:
+                        self._remove(block_id)
+                        raise BlockLockError("not_locked")
+                    if holder != user_id:
+                        self._set(block_id, asset_id, holder, elapsed)
+                        raise BlockLockError("not_owner", holder)
+                    await cur.execute("""
+                        UPDATE ReportContentBlocks
+                        SET IsLocked = FALSE,
+                            LockedBy = NULL,
+                            LockedAt = NULL
+                        WHERE BlockID = %s AND AssetID = %s
+                    """, (block_id, asset_id))
+                    await conn.commit()
+                except Exception:
+                    await conn.rollback()
+                    raise
+
+        self._remove(block_id)
+        self.released += 1
+
+    async def sweep(self):
+        """解除資料庫中租約已過期的鎖定，並重新載入記憶體中的鎖定表"""
+        start_time = time.perf_counter()
+        self._changed = set()
+        try:
+            async with self.db_pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    # 過期租約：(IsLocked, LockedAt) 為 idx_block_lock 的範圍掃描
+                    await cur.execute("""
+                        UPDATE ReportContentBlocks
+                        SET IsLocked = FALSE,
+                            LockedBy = NULL,
+                            LockedAt = NULL
+                        WHERE IsLocked = TRUE
+                        AND LockedAt < NOW(6) - INTERVAL %s SECOND
+                    """, (self.lease_seconds,))
+                    self.expired += cur.rowcount
+                    await conn.commit()
+
+                    # 缺少鎖定者或續約時間的鎖定只會來自舊資料或手動修改，較少檢查
+                    if self.sweeps % self.cleanup_every == 0:
+                        await cur.execute("""
+                            UPDATE ReportContentBlocks
+                            SET IsLocked = FALSE,
+                                LockedBy = NULL,
+                                LockedAt = NULL
+                            WHERE IsLocked = TRUE
+                            AND (LockedBy IS NULL OR LockedAt IS NULL)
+                        """)
+                        self.expired += cur.rowcount
+                        await conn.commit()
+
+                    await cur.execute("""
+                        SELECT BlockID, AssetID, LockedBy, TIMESTAMPDIFF(MICROSECOND, LockedAt, NOW(6))
+                        FROM ReportContentBlocks
+                        WHERE IsLocked = TRUE
+                    """)
+                    rows = await cur.fetchall()
+                    await conn.commit()
+
+            # 以資料庫的鎖定取代記憶體中的鎖定表，但保留重新載入期間本程序的修改
+            now = time.monotonic()
+            leases = {
+                block_id: lease for block_id, lease in self._leases.items()
+                if block_id in self._changed
+            }
+            for block_id, asset_id, locked_by, elapsed in rows:
+                if block_id in self._changed or not locked_by or elapsed is None:
+                    continue
+                leases[block_id] = (asset_id, locked_by, now + self.lease_seconds - elapsed / 1_000_000)
+            self._leases = leases
+        finally:
+            self._changed = None
+        self.sweeps += 1
+        self.last_sweep_ms = round((time.perf_counter() - start_time) * 1000, 2)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"清除過期區塊鎖定失敗: {e}")
+
+    async def start(self):
+        """載入目前的鎖定並啟動背景清除程序 (在目前的事件迴圈中執行)"""
+        try:
+            await self.sweep()
+        except Exception as e:
+            print(f"載入區塊鎖定失敗: {e}")
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """停止背景清除程序"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def metrics(self) -> dict:
+        """取得鎖定統計資料"""
+        now = time.monotonic()
+        return {
+            "active_leases": sum(1 for lease in self._leases.values() if lease[2] > now),
+            "lease_seconds": self.lease_seconds,
+            "sweep_interval": self.sweep_interval,
+            "acquired": self.acquired,
+            "conflicts": self.conflicts,
+            "heartbeats": self.heartbeats,
+            "released": self.released,
+            "expired": self.expired,
+            "sweeps": self.sweeps,
+            "last_sweep_ms": self.last_sweep_ms
+        }
@@ -5,26 +5,39 @@
 # 真實的 API 調用
 # 密碼加密
 
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, status, Request
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional
 import jwt
 from datetime import datetime, timedelta, timezone
-import bcrypt
 import uvicorn
 import aiomysql
 import uuid
 import json
 import random
 import string
+import asyncio
 from contextlib import asynccontextmanager
 from ai_generate import GeminiGenerator
 from dotenv import load_dotenv
 import os
 # 圖片生成
-from mermaid import mermaid_to_image
+from mermaid import image_cache, start_mermaid_renderer, close_mermaid_renderer
+# 資料庫連接池
+from db_pool import DatabasePool, load_db_config
+# 背景工作佇列
+from job_queue import job_handler, enqueue_job, get_job, report_job_progress, JobWorker, JOB_MAX_ATTEMPTS_LIMIT
+# 權限索引快取
+from permission_cache import PermissionIndexCache, has_permission
+# 密碼雜湊 (在執行緒池中計算，不阻塞事件迴圈)
+from password_hasher import password_hasher
+# 使用者名稱與頭像快取
+from user_directory import UserDirectoryCache
+# 區塊鎖定租約
+from block_lock import BlockLockManager, BlockLockError
 
 # 載入 .env 檔案
 load_dotenv()
@@ -37,15 +50,8 @@ base_url = os.getenv("base_url")
 max_retry = int(os.getenv("max_retry"))
 
 
-# 資料庫配置
-DB_CONFIG = {
-    'host': 'localhost',
-    'port': 3306,
-    'user': 'root',  # 請根據實際情況修改
-    'password': '',  # 請根據實際情況修改
-    'db': 'chatesg_new',
-    'charset': 'utf8mb4'
-}
+# 資料庫配置 (db_host / db_port / db_user / db_password / db_name，唯讀副本為 db_read_host / db_read_port)
+DB_CONFIG, READ_DB_CONFIG = load_db_config()
 
 # 新增 salt 輪數設置
 BCRYPT_ROUNDS = 12
@@ -59,24 +65,58 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 DEFAULT_USER_AVATAR = "https://raw.githubusercontent.com/wade0426/ChatESG_new/refs/heads/main/userPhoto/user-icons.png"
 DEFAULT_ORGANIZATION_LOGO = "https://raw.githubusercontent.com/wade0426/ChatESG_new/refs/heads/main/userPhoto/organization.png"
 
-# 資料庫連接池
-async def get_db_pool():
-    pool = await aiomysql.create_pool(**DB_CONFIG)
-    return pool
+# 範例報告書來源 (本機檔案或網址)，預設使用 API 目錄下的 Sample_Report.json
+SAMPLE_REPORT_SOURCE = os.getenv("sample_report_source", os.path.join(os.path.dirname(os.path.abspath(__file__)), "Sample_Report.json"))
+
+# 圖片網址前綴 (對應 Mermaid 圖片輸出目錄)
+IMAGE_BASE_URL = os.getenv("image_base_url", "https://4090p8001.huanna.live/images")
+
+# 資料庫連接池配置
+DB_POOL_CONFIG = {
+    'minsize': int(os.getenv("db_pool_minsize", 5)),
+    'maxsize': int(os.getenv("db_pool_maxsize", 20)),
+    'pool_recycle': int(os.getenv("db_pool_recycle", 3600)),  # 閒置超過此秒數的連線會被回收
+    'health_check_interval': int(os.getenv("db_pool_health_check_interval", 30)),  # 閒置超過此秒數先 ping 再使用
+    'acquire_timeout': int(os.getenv("db_pool_acquire_timeout", 10)),  # 等待可用連線的最長秒數
+    'long_hold_threshold': float(os.getenv("db_pool_long_hold_threshold", 5))  # 佔用連線超過此秒數記錄為長時間佔用
+}
+
+# 批量寫入時每批的資料筆數
+BULK_INSERT_BATCH_SIZE = int(os.getenv("bulk_insert_batch_size", 500))
+
+# 全域共用的資料庫連接池 (所有 API 共用，由 lifespan 建立與關閉)
+db_pool = DatabasePool(DB_CONFIG, read_db_config=READ_DB_CONFIG, **DB_POOL_CONFIG)
 
-# 全域變數儲存連接池
-db_pool = None
+# 背景工作程序 (job_workers 為 API 程序內的並行數，0 表示只由獨立的 job_worker.py 執行)
+JOB_WORKERS = int(os.getenv("job_workers", 1))
+# 可建立的背景工作類型 (含準則檢驗服務 chatESG_FastAPI_v2 的工作)
+JOB_TYPES = ["generate_text", "generate_mermaid_image", "gri_verification_criteria_by_chapter"]
+job_worker = JobWorker(db_pool, JOB_WORKERS)
+
+# 全域共用的權限索引快取 (寫入 RolePermissionMappings 後須呼叫 permission_cache.invalidate)
+permission_cache = PermissionIndexCache(db_pool)
+
+# 全域共用的使用者名稱與頭像快取 (修改使用者名稱或頭像後須呼叫 user_directory.invalidate)
+user_directory = UserDirectoryCache(DEFAULT_USER_AVATAR)
+
+# 全域共用的區塊鎖定管理 (檢查鎖定狀態使用記憶體中的鎖定表，由 lifespan 啟動背景清除程序)
+block_lock_manager = BlockLockManager(db_pool)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 啟動時執行
-    global db_pool
-    db_pool = await get_db_pool()
+    await db_pool.init()
+    await start_mermaid_renderer()
+    await block_lock_manager.start()
+    if JOB_WORKERS > 0:
+        await job_worker.start()
     yield
     # 關閉時執行
-    if db_pool:
-        db_pool.close()
-        await db_pool.wait_closed()
+    await job_worker.stop()
+    await block_lock_manager.stop()
+    await close_mermaid_renderer()
+    password_hasher.close()
+    await db_pool.close()
 
 # 創建 FastAPI 應用
 app = FastAPI(lifespan=lifespan)
@@ -122,13 +162,18 @@ class OrganizationResponse(BaseModel):
     organization_id: Optional[str] = None
 
 
-def verify_password(plain_password, hashed_password):
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+async def verify_password(plain_password, hashed_password):
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="目前登入人數過多，請稍後再試")
 
 
-def get_password_hash(password):
-    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
-    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+async def get_password_hash(password):
+    try:
+        return await password_hasher.hash(password, BCRYPT_ROUNDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="目前請求人數過多，請稍後再試")
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -144,6 +189,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 @app.post("/api/login")
 async def login(form_data: LoginUser):
+    # 只在查詢與更新時佔用連線，bcrypt 驗證期間不持有連線，避免登入尖峰佔滿連接池
     async with db_pool.acquire() as conn:
         async with conn.cursor() as cur:
             # 查詢用戶信息，包含帳戶狀態
@@ -155,32 +201,35 @@ async def login(form_data: LoginUser):
             )
             user = await cur.fetchone()
             
-            if not user:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="帳號或密碼錯誤"
-                )
-            
-            # 檢查帳戶狀態
-            if user[5] == 'locked':
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="帳戶已被鎖定，請聯繫管理員"
-                )
-            elif user[5] == 'disabled':
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="帳戶已被禁用"
-                )
-            
-            # 驗證密碼
-            if not verify_password(form_data.password, user[2]):
-                # 更新登錄嘗試次數
-                new_attempts = user[6] + 1
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="帳號或密碼錯誤"
+        )
+    
+    # 檢查帳戶狀態
+    if user[5] == 'locked':
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="帳戶已被鎖定，請聯繫管理員"
+        )
+    elif user[5] == 'disabled':
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="帳戶已被禁用"
+        )
+    
+    # 驗證密碼
+    if not await verify_password(form_data.password, user[2]):
+        async with db_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                # 更新登錄嘗試次數 (驗證期間可能有其他登入失敗，以資料庫中的次數累加)
                 await cur.execute(
-                    "UPDATE Users SET LoginAttempts = %s WHERE UserID = %s",
-                    (new_attempts, user[0])
+                    "UPDATE Users SET LoginAttempts = LoginAttempts + 1 WHERE UserID = %s",
+                    (user[0],)
                 )
+                await cur.execute("SELECT LoginAttempts FROM Users WHERE UserID = %s", (user[0],))
+                new_attempts = (await cur.fetchone())[0]
                 await conn.commit()
                 
                 # 如果登錄嘗試次數過多，鎖定帳戶
@@ -194,14 +243,16 @@ async def login(form_data: LoginUser):
                         status_code=status.HTTP_401_UNAUTHORIZED,
                         detail="登錄嘗試次數過多，帳戶已被鎖定"
                     )
-                
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="帳號或密碼錯誤"
-                )
-            
-            # 登錄成功，重置登錄嘗試次數並更新最後登錄時間
-            current_time = datetime.now(timezone.utc)
+        
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="帳號或密碼錯誤"
+        )
+    
+    # 登錄成功，重置登錄嘗試次數並更新最後登錄時間
+    current_time = datetime.now(timezone.utc)
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cur:
             await cur.execute(
                 """UPDATE Users 
                    SET LoginAttempts = 0, 
@@ -211,30 +262,33 @@ async def login(form_data: LoginUser):
                 (current_time, current_time, user[0])
             )
             await conn.commit()
-            
-            # 生成訪問令牌
-            access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-            access_token = create_access_token(
-                data={"sub": user[1]},  # user[1] 是 UserName
-                expires_delta=access_token_expires
-            )
-            
-            # 將 BINARY(16) 格式的 UUID 轉換為字符串
-            user_id_str = uuid.UUID(bytes=user[0]).hex if user[0] else None
-            organization_id_str = uuid.UUID(bytes=user[4]).hex if user[4] else None
-            
-            return {
-                "status": "success",
-                "access_token": access_token,
-                "token_type": "bearer",
-                "userID": user_id_str,
-                "username": user[1],
-                "organizationID": organization_id_str
-            }
+    
+    # 生成訪問令牌
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": user[1]},  # user[1] 是 UserName
+        expires_delta=access_token_expires
+    )
+    
+    # 將 BINARY(16) 格式的 UUID 轉換為字符串
+    user_id_str = uuid.UUID(bytes=user[0]).hex if user[0] else None
+    organization_id_str = uuid.UUID(bytes=user[4]).hex if user[4] else None
+    
+    return {
+        "status": "success",
+        "access_token": access_token,
+        "token_type": "bearer",
+        "userID": user_id_str,
+        "username": user[1],
+        "organizationID": organization_id_str
+    }
 
 
 @app.post("/api/register")
 async def register(user: User):
+    # 先計算密碼雜湊再取得連線，bcrypt 計算期間不佔用連接池
+    hashed_password = await get_password_hash(user.password)
+
     async with db_pool.acquire() as conn:
         async with conn.cursor() as cur:
             # 檢查使用者名是否已存在
@@ -255,7 +309,6 @@ async def register(user: User):
             
             # 創建新用戶
             user_id = uuid.uuid4().bytes  # 轉換為BINARY(16)格式
-            hashed_password = get_password_hash(user.password)
             current_time = datetime.now(timezone.utc)  # 使用timezone.utc
             
             await cur.execute("""
@@ -461,33 +514,39 @@ async def change_password(user_data: dict):
             )
             user = await cur.fetchone()
             
-            if not user:
-                raise HTTPException(status_code=404, detail="未找到使用者")
-            
-            # 檢查帳戶狀態
-            if user[1] == 'locked':
-                raise HTTPException(status_code=400, detail="帳戶已被鎖定，無法修改密碼")
-            elif user[1] == 'disabled':
-                raise HTTPException(status_code=400, detail="帳戶已被禁用")
-            
-            stored_password = user[0]
-            if not verify_password(current_password, stored_password):
-                raise HTTPException(status_code=400, detail="當前密碼錯誤")
-            
-            # 更新新密碼和密碼修改時間
-            current_time = datetime.now(timezone.utc)
-            hashed_new_password = get_password_hash(new_password)
+    if not user:
+        raise HTTPException(status_code=404, detail="未找到使用者")
+    
+    # 檢查帳戶狀態
+    if user[1] == 'locked':
+        raise HTTPException(status_code=400, detail="帳戶已被鎖定，無法修改密碼")
+    elif user[1] == 'disabled':
+        raise HTTPException(status_code=400, detail="帳戶已被禁用")
+    
+    # bcrypt 驗證與雜湊期間不持有連線
+    stored_password = user[0]
+    if not await verify_password(current_password, stored_password):
+        raise HTTPException(status_code=400, detail="當前密碼錯誤")
+    hashed_new_password = await get_password_hash(new_password)
+    
+    # 更新新密碼和密碼修改時間 (密碼在驗證期間被修改時不覆寫)
+    current_time = datetime.now(timezone.utc)
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cur:
             await cur.execute(
                 """UPDATE Users 
                    SET UserPassword = %s,
                        PasswordChangedAt = %s,
                        UpdatedAt = %s
-                   WHERE UserID = %s""",
-                (hashed_new_password, current_time, current_time, user_id)
+                   WHERE UserID = %s AND UserPassword = %s""",
+                (hashed_new_password, current_time, current_time, user_id, stored_password)
             )
+            if cur.rowcount == 0:
+                await conn.rollback()
+                raise HTTPException(status_code=409, detail="密碼已被修改，請重新操作")
             await conn.commit()
-            
-            return {"status": "success", "message": "密碼修改成功"}
+    
+    return {"status": "success", "message": "密碼修改成功"}
 
 
 @app.post("/api/user/profile/Change_Username")
@@ -526,6 +585,7 @@ async def change_username(user_data: dict):
                     (new_username, user_id)
                 )
                 await conn.commit()
+                user_directory.invalidate(user_id)
                 
                 return {"status": "success", "message": "用戶名修改成功"}
                 
@@ -632,6 +692,7 @@ async def join_organization(join_data: dict):
                                     INSERT INTO UserRoles (UserID, RoleID, OrganizationID)
                                     VALUES (%s, %s, %s)
                                 """, (application[0], default_role[0], application[1]))
+                                await refresh_review_inbox(cur, organization_id=application[1])
                     
                     await conn.commit()
                     return {
@@ -794,13 +855,9 @@ async def get_organization_info(data: dict):
     except (ValueError, AttributeError):
         raise HTTPException(status_code=400, detail="無效的組織ID格式")
     
-    async with db_pool.acquire() as conn:
+    async with db_pool.acquire_read() as conn:
         async with conn.cursor() as cur:
             try:
-                # 開始事務並設置隔離級別為REPEATABLE READ
-                await conn.begin()
-                await cur.execute("SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ")
-                
                 # 獲取組織基本信息
                 await cur.execute("""
                     SELECT 
@@ -821,12 +878,10 @@ async def get_organization_info(data: dict):
                     FROM Organizations o
                     LEFT JOIN Users u ON o.OwnerID = u.UserID
                     WHERE o.OrganizationID = %s AND o.IsDeleted = FALSE
-                    FOR UPDATE
                 """, (organization_id,))
                 
                 org = await cur.fetchone()
                 if not org:
-                    await conn.rollback()
                     raise HTTPException(status_code=404, detail="未找到組織")
                 
                 # 獲取組織成員列表及其角色
@@ -841,32 +896,36 @@ async def get_organization_info(data: dict):
                     JOIN Users u ON om.UserID = u.UserID
                     WHERE om.OrganizationID = %s
                     ORDER BY om.CreatedAt ASC, u.UserID ASC
-                    FOR UPDATE
                 """, (organization_id,))
                 
                 members = await cur.fetchall()
+
+                # 一次取得組織內所有成員的角色，避免每個成員各查詢一次
+                await cur.execute("""
+                    SELECT ur.UserID, r.RoleName, r.Color
+                    FROM UserRoles ur
+                    JOIN Roles r ON r.RoleID = ur.RoleID
+                    WHERE ur.OrganizationID = %s
+                    ORDER BY r.CreatedAt ASC, r.RoleName ASC, r.RoleID ASC
+                """, (organization_id,))
+
+                # 依使用者分組 (保持角色排序，重複的角色映射只保留一筆，與原本的 SELECT DISTINCT 相同)
+                member_roles = {}
+                seen_roles = set()
+                for user_id, role_name, role_color in await cur.fetchall():
+                    if (user_id, role_name, role_color) in seen_roles:
+                        continue
+                    seen_roles.add((user_id, role_name, role_color))
+                    member_roles.setdefault(user_id, []).append({"roleName": role_name, "roleColor": role_color})
+
                 members_list = []
-                
                 for member in members:
-                    # 使用 FOR UPDATE 鎖定查詢結果
-                    await cur.execute("""
-                        SELECT DISTINCT r.RoleName, r.Color
-                        FROM UserRoles ur
-                        JOIN Roles r ON r.RoleID = ur.RoleID
-                        WHERE ur.UserID = %s AND ur.OrganizationID = %s
-                        ORDER BY r.CreatedAt ASC, r.RoleName ASC, r.RoleID ASC
-                        FOR UPDATE
-                    """, (member[0], organization_id))
-                    
-                    roles = await cur.fetchall()
-                    roles_info = [{"roleName": role[0], "roleColor": role[1]} for role in roles]
-                    
                     members_list.append({
                         "userID": uuid.UUID(bytes=member[0]).hex,
                         "name": member[1],
                         "avatarUrl": member[2] or DEFAULT_USER_AVATAR,
                         "email": member[3],
-                        "roles": roles_info,
+                        "roles": member_roles.get(member[0], []),
                         "joinedAt": member[4].isoformat() if member[4] else None
                     })
                 
@@ -876,14 +935,10 @@ async def get_organization_info(data: dict):
                     FROM Roles
                     WHERE OrganizationID = %s
                     ORDER BY CreatedAt ASC, RoleName ASC, RoleID ASC
-                    FOR UPDATE
                 """, (organization_id,))
                 
                 available_roles = [{"roleName": role[0], "roleColor": role[1]} for role in await cur.fetchall()]
                 
-                # 提交事務
-                await conn.commit()
-                
                 return {
                     "status": "success",
                     "data": {
@@ -909,8 +964,6 @@ async def get_organization_info(data: dict):
                 }
                 
             except Exception as e:
-                # 如果發生錯誤，回滾事務
-                await conn.rollback()
                 raise HTTPException(status_code=500, detail=f"獲取組織信息失敗: {str(e)}")
 
 
@@ -1027,6 +1080,7 @@ async def update_member_roles(data: dict):
                         VALUES (%s, %s, %s)
                     """, (user_id_binary, role_id, organization_id_binary))
                 
+                await refresh_review_inbox(cur, organization_id=organization_id_binary)
                 await conn.commit()
                 return {"status": "success", "message": "成員身份組更新成功"}
                 
@@ -1231,8 +1285,10 @@ async def delete_role(data: dict):
                         DELETE FROM Roles 
                         WHERE RoleID = %s AND OrganizationID = %s
                     """, (role[0], organization_id_binary))
+                    await refresh_review_inbox(cur, organization_id=organization_id_binary)
 
                     await conn.commit()
+                    permission_cache.invalidate()  # 刪除角色會連帶刪除其在所有資產的權限映射
                     return {"status": "success", "message": "角色刪除成功"}
 
                 except Exception as e:
@@ -1302,6 +1358,7 @@ async def delete_member(data: dict):
                         SET OrganizationID = NULL 
                         WHERE UserID = %s
                     """, (user_id_binary,))
+                    await refresh_review_inbox(cur, organization_id=organization_id_binary)
 
                     await conn.commit()
                     return {"status": "success", "message": "成員已成功從組織中移除"}
@@ -1329,12 +1386,9 @@ async def get_asset_content(data: dict):
         asset_id_binary = uuid.UUID(asset_id).bytes
         organization_id_binary = uuid.UUID(organization_id).bytes
 
-        async with db_pool.acquire() as conn:
+        async with db_pool.acquire_read() as conn:
             async with conn.cursor() as cur:
                 try:
-                    # 開始事務
-                    await conn.begin()
-
                     # 檢查資產是否存在且屬於該組織
                     await cur.execute("""
                         SELECT 
@@ -1348,7 +1402,6 @@ async def get_asset_content(data: dict):
                         FROM OrganizationAssets
                         WHERE AssetID = %s 
                         AND OrganizationID = %s
-                        FOR UPDATE
                     """, (asset_id_binary, organization_id_binary))
 
                     asset = await cur.fetchone()
@@ -1376,26 +1429,46 @@ async def get_asset_content(data: dict):
                         }
                     }
 
-                    await conn.commit()
                     return response_data
 
                 except json.JSONDecodeError:
-                    await conn.rollback()
                     raise HTTPException(status_code=500, detail="資產內容格式錯誤")
                 except Exception as e:
-                    await conn.rollback()
                     raise HTTPException(status_code=500, detail=f"獲取資產內容失敗: {str(e)}")
 
     except ValueError as e:
         raise HTTPException(status_code=400, detail="無效的ID格式")
 
 
+# 批量寫入的輔助函數
+async def bulk_insert(cur, sql: str, rows: list, batch_size: int = None) -> int:
+    """
+    以多筆 VALUES 的方式批量寫入資料，每批最多 batch_size 筆
+
+    Args:
+        cur: 數據庫游標
+        sql: INSERT ... VALUES (%s, ...) 格式的 SQL (VALUES 內只能使用 %s，否則 executemany 會退回逐筆寫入)
+        rows: 要寫入的資料列表
+        batch_size: 每批的資料筆數，預設為 BULK_INSERT_BATCH_SIZE
+
+    Returns:
+        int: 影響的資料筆數
+    """
+    batch_size = batch_size or BULK_INSERT_BATCH_SIZE
+    affected_rows = 0
+    for start in range(0, len(rows), batch_size):
+        # executemany 會將同一批資料合併成一條多筆 VALUES 的 INSERT
+        affected_rows += await cur.executemany(sql, rows[start:start + batch_size]) or 0
+    return affected_rows
+
+
 # 檢查區塊權限的輔助函數
 async def check_block_permission(
     cur,
     permissionChapter_id_binary: bytes,
     role_ids: list,
-    asset_id: bytes
+    asset_id: bytes,
+    for_update: bool = False
 ) -> bool:
     """
     檢查用戶是否有權限訪問指定的區塊
@@ -1405,38 +1478,102 @@ async def check_block_permission(
         permissionChapter_id_binary: 章節權限識別標籤(UUID)
         role_ids: 用戶角色ID列表
         asset_id: 資產ID (UUID bytes)
+        for_update: 是否以 FOR UPDATE 鎖定權限設置，只有後續會寫入時才需要
         
     Returns:
         bool: 是否有權限
     """
-    # 查詢該區塊的權限設置
-    await cur.execute("""
-        SELECT RoleID, ActionType
-        FROM RolePermissionMappings
-        WHERE PermissionChapterID = %s
-        AND AssetID = %s
-        FOR UPDATE
-    """, (permissionChapter_id_binary, asset_id))
-    
-    permissions = await cur.fetchall()
-    if not permissions:
-        return False
-    
-    # 檢查用戶的角色是否有權限
-    for role_id in role_ids:
-        role_id_binary = uuid.UUID(role_id).bytes
-        for permission in permissions:
-            if permission[0] == role_id_binary and permission[1] in ['read', 'read_write']:
-                return True
-    
-    return False
+    role_ids_binary = {uuid.UUID(role_id).bytes for role_id in role_ids}
+
+    # 後續會寫入時直接從資料庫讀取，只鎖定此章節與用戶角色的權限設置，不影響同一資產其他章節的寫入
+    if for_update:
+        if not role_ids_binary:
+            return False
+        placeholders = ", ".join(["%s"] * len(role_ids_binary))
+        await cur.execute(f"""
+            SELECT ActionType
+            FROM RolePermissionMappings
+            WHERE PermissionChapterID = %s
+            AND AssetID = %s
+            AND RoleID IN ({placeholders})
+            FOR UPDATE
+        """, (permissionChapter_id_binary, asset_id, *role_ids_binary))
+        return any(row[0] in ('read', 'read_write') for row in await cur.fetchall())
+
+    # 唯讀檢查使用快取的權限索引
+    index = await permission_cache.get_index(asset_id)
+    return has_permission(index, permissionChapter_id_binary, role_ids_binary)
+
+
+# 區塊內容查詢 (同時 JOIN 最後修改者與鎖定者，一次查詢取得完整的區塊資訊)
+BLOCK_VIEW_SELECT = """
+    SELECT 
+        b.BlockID,
+        b.AssetID,
+        b.content,
+        b.LastModified,
+        b.ModifiedBy,
+        b.IsLocked,
+        b.LockedBy,
+        b.LockedAt,
+        b.status,
+        modifier.UserName,
+        modifier.AvatarUrl,
+        locker.UserName,
+        locker.AvatarUrl
+    FROM ReportContentBlocks b
+    LEFT JOIN Users modifier ON modifier.UserID = b.ModifiedBy
+    LEFT JOIN Users locker ON locker.UserID = b.LockedBy
+"""
+
+
+def build_block_view(block) -> dict:
+    """
+    將 BLOCK_VIEW_SELECT 查詢的一列轉換成區塊內容
+
+    Args:
+        block: BLOCK_VIEW_SELECT 查詢結果的一列
+
+    Returns:
+        dict: 區塊內容和相關信息
+    """
+    # 最後修改者的信息 (使用者已被刪除時為 None)
+    modified_by_info = None
+    if block[4] and block[9] is not None:
+        modified_by_info = {
+            "id": uuid.UUID(bytes=block[4]).hex,
+            "name": block[9],
+            "avatarUrl": block[10] or DEFAULT_USER_AVATAR
+        }
+
+    # 鎖定者的信息
+    locked_by_info = None
+    if block[6] and block[11] is not None:
+        locked_by_info = {
+            "id": uuid.UUID(bytes=block[6]).hex,
+            "name": block[11],
+            "avatarUrl": block[12] or DEFAULT_USER_AVATAR
+        }
+
+    return {
+        "blockID": uuid.UUID(bytes=block[0]).hex,
+        "assetID": uuid.UUID(bytes=block[1]).hex if block[1] else None,
+        "content": json.loads(block[2]) if block[2] else None,
+        "lastModified": block[3].isoformat() if block[3] else None,
+        "modifiedBy": modified_by_info,
+        "isLocked": block[5],
+        "lockedBy": locked_by_info,
+        "lockedAt": block[7].isoformat() if block[7] else None,
+        "status": block[8]
+    }
 
 
 # 獲取區塊內容的輔助函數
 async def get_block_content(
     cur,
     block_id: bytes,
-    asset_id: bytes
+    asset_id: bytes = None,
+    for_update: bool = False
 ) -> dict:
     """
     獲取區塊的內容和相關信息
@@ -1444,125 +1581,127 @@ async def get_block_content(
     Args:
         cur: 數據庫游標
         block_id: 區塊ID (UUID bytes)
-        asset_id: 資產ID (UUID bytes)
+        asset_id: 資產ID (UUID bytes)，None 表示不限制所屬資產
+        for_update: 是否以 FOR UPDATE 鎖定區塊，只有後續會寫入時才需要
         
     Returns:
         dict: 區塊內容和相關信息
     """
-    await cur.execute("""
-        SELECT 
-            content,
-            LastModified,
-            ModifiedBy,
-            IsLocked,
-            LockedBy,
-            LockedAt,
-            status
-        FROM ReportContentBlocks
-        WHERE BlockID = %s
-        AND AssetID = %s
-        FOR UPDATE
-    """, (block_id, asset_id))
-    
+    conditions = "WHERE b.BlockID = %s"
+    params = [block_id]
+    if asset_id is not None:
+        conditions += " AND b.AssetID = %s"
+        params.append(asset_id)
+
+    if for_update:
+        # 只鎖定區塊本身，避免 JOIN 的使用者資料也被鎖定
+        await cur.execute(f"""
+            SELECT b.BlockID FROM ReportContentBlocks b
+            {conditions}
+            FOR UPDATE
+        """, params)
+
+    await cur.execute(f"{BLOCK_VIEW_SELECT} {conditions}", params)
     block = await cur.fetchone()
     if not block:
         raise HTTPException(status_code=404, detail="找不到指定的區塊")
-    
-    # 獲取最後修改者的信息
-    modified_by_info = None
-    if block[2]:  # ModifiedBy
-        await cur.execute("""
-            SELECT UserName, AvatarUrl
-            FROM Users
-            WHERE UserID = %s
-        """, (block[2],))
-        modifier = await cur.fetchone()
-        if modifier:
-            modified_by_info = {
-                "id": uuid.UUID(bytes=block[2]).hex,
-                "name": modifier[0],
-                "avatarUrl": modifier[1] or DEFAULT_USER_AVATAR
-            }
-    
-    # 獲取鎖定者的信息
-    locked_by_info = None
-    if block[4]:  # LockedBy
-        await cur.execute("""
-            SELECT UserName, AvatarUrl
-            FROM Users
-            WHERE UserID = %s
-        """, (block[4],))
-        locker = await cur.fetchone()
-        if locker:
-            locked_by_info = {
-                "id": uuid.UUID(bytes=block[4]).hex,
-                "name": locker[0],
-                "avatarUrl": locker[1] or DEFAULT_USER_AVATAR
-            }
-    
-    return {
-        "content": json.loads(block[0]) if block[0] else None,
-        "lastModified": block[1].isoformat() if block[1] else None,
-        "modifiedBy": modified_by_info,
-        "isLocked": block[3],
-        "lockedBy": locked_by_info,
-        "lockedAt": block[5].isoformat() if block[5] else None,
-        "status": block[6]
-    }
+
+    return build_block_view(block)
 
 
-# 鎖定區塊的輔助函數
-async def lock_block(
+# 一次獲取多個區塊內容的輔助函數
+async def get_block_contents(
     cur,
-    block_id: bytes,
-    user_id: bytes,
-    asset_id: bytes
-) -> None:
+    block_ids: list,
+    asset_id: bytes = None
+) -> dict:
     """
-    鎖定指定的區塊
+    以單一查詢獲取多個區塊的內容和相關信息 (例如整個子章節的區塊)
     
     Args:
         cur: 數據庫游標
-        block_id: 區塊ID (UUID bytes)
-        user_id: 用戶ID (UUID bytes)
-        asset_id: 資產ID (UUID bytes)
+        block_ids: 區塊ID列表 (UUID bytes)
+        asset_id: 資產ID (UUID bytes)，None 表示不限制所屬資產
+        
+    Returns:
+        dict: 區塊ID(hex) -> 區塊內容，找不到的區塊不會出現在結果中
     """
-    current_time = datetime.now(timezone.utc)
-    await cur.execute("""
-        UPDATE ReportContentBlocks
-        SET IsLocked = TRUE,
-            LockedBy = %s,
-            LockedAt = %s
-        WHERE BlockID = %s
-        AND AssetID = %s
-        AND (IsLocked = FALSE OR LockedAt < %s)
-    """, (
-        user_id,
-        current_time,
-        block_id,
-        asset_id,
-        current_time - timedelta(minutes=30)  # 自動解鎖30分鐘前的鎖定
-    ))
-
-
-# 解鎖區塊的輔助函數
-async def unlock_block(cur, block_id: bytes, asset_id: bytes) -> None:
+    block_ids = list(dict.fromkeys(block_ids))
+    if not block_ids:
+        return {}
+
+    placeholders = ", ".join(["%s"] * len(block_ids))
+    conditions = f"WHERE b.BlockID IN ({placeholders})"
+    params = list(block_ids)
+    if asset_id is not None:
+        conditions += " AND b.AssetID = %s"
+        params.append(asset_id)
+
+    await cur.execute(f"{BLOCK_VIEW_SELECT} {conditions}", params)
+    blocks = await cur.fetchall()
+    return {view["blockID"]: view for view in map(build_block_view, blocks)}
+
+
+# 取得資產大綱中的區塊
+def collect_outline_blocks(asset_content: dict, chapter_title: str = None) -> list:
     """
-    解鎖指定的區塊
-    
+    從報告書/公司基本表的章節結構中取出所有區塊及其章節權限識別標籤
+
+    Args:
+        asset_content: 資產內容 (OrganizationAssets.Content)
+        chapter_title: 只取出指定章節的區塊，None 表示整份資產
+
+    Returns:
+        list: [(區塊ID(hex), 章節權限識別標籤(hex) 或 None), ...]，依大綱順序排列
+    """
+    outline_blocks = []
+    for chapter in asset_content.get("chapters", []):
+        if chapter_title is not None and chapter.get("chapterTitle") != chapter_title:
+            continue
+        for sub_chapter in chapter.get("subChapters", []):
+            # 報告書的區塊在子章節，公司基本表的區塊在子子章節
+            for node in [sub_chapter, *sub_chapter.get("subSubChapters", [])]:
+                if node.get("BlockID"):
+                    permission_id = node.get("access_permissions")
+                    outline_blocks.append((
+                        uuid.UUID(node["BlockID"]).hex,
+                        uuid.UUID(permission_id).hex if permission_id else None
+                    ))
+    return outline_blocks
+
+
+# 一次取得多個區塊並依角色權限過濾的輔助函數
+async def get_permitted_block_contents(
+    cur,
+    asset_id: bytes,
+    outline_blocks: list,
+    role_ids: list
+) -> tuple:
+    """
+    以權限索引在記憶體中過濾後，一次查詢取得使用者可讀取的區塊
+
     Args:
         cur: 數據庫游標
-        block_id: 區塊ID (UUID bytes)
         asset_id: 資產ID (UUID bytes)
+        outline_blocks: [(區塊ID(hex), 章節權限識別標籤(hex)), ...]
+        role_ids: 用戶角色ID列表
+
+    Returns:
+        tuple: (區塊ID(hex) -> 區塊內容, 權限不足的區塊ID列表)
     """
-    await cur.execute("""
-        UPDATE ReportContentBlocks
-        SET IsLocked = FALSE,
-            LockedBy = NULL,
-            LockedAt = NULL
-        WHERE BlockID = %s
-        AND AssetID = %s
-    """, (block_id, asset_id))
+    index = await permission_cache.get_index(asset_id)
+    role_ids_binary = {uuid.UUID(role_id).bytes for role_id in role_ids}
+
+    permitted_block_ids = []
+    denied_block_ids = []
+    for block_id, permission_id in outline_blocks:
+        if permission_id and has_permission(index, bytes.fromhex(permission_id), role_ids_binary):
+            permitted_block_ids.append(block_id)
+        else:
+            denied_block_ids.append(block_id)
+
+    blocks = await get_block_contents(cur, [bytes.fromhex(block_id) for block_id in permitted_block_ids], asset_id)
+    return blocks, denied_block_ids
 
 
 # 取得公司基本表的區塊內容(Block)
@@ -1609,18 +1748,15 @@ async def get_company_table_blocks(data: dict):
         except ValueError as ve:
             raise HTTPException(status_code=400, detail=f"無效的 UUID 格式: {str(ve)}")
         
-        async with db_pool.acquire() as conn:
+        async with db_pool.acquire_read() as conn:
             async with conn.cursor() as cur:
                 try:
-                    # 開始事務
-                    await conn.begin()
-                    
                     # 檢查權限
-                    has_permission = await check_block_permission(
+                    allowed = await check_block_permission(
                         cur, permissionChapter_id_binary, role_ids, asset_id_binary
                     )
                     
-                    if not has_permission:
+                    if not allowed:
                         raise HTTPException(status_code=403, detail="權限不足")
                     
                     # 獲取區塊內容
@@ -1628,15 +1764,12 @@ async def get_company_table_blocks(data: dict):
                         cur, block_id_binary, asset_id_binary
                     )
                     
-                    await conn.commit()
-
                     return {
                         "status": "success",
                         "data": block_data
                     }
                     
                 except Exception as e:
-                    await conn.rollback()
                     print(f"數據庫操作失敗: {str(e)}")
                     raise HTTPException(status_code=500, detail=f"獲取區塊內容失敗: {str(e)}")
                     
@@ -1743,72 +1876,82 @@ async def update_company_table_block(data: dict):
         raise HTTPException(status_code=500, detail=f"處理請求時發生錯誤: {str(e)}")
 
 
-# 鎖定區塊
-@app.post("/api/organizations/lock_block")
-async def lock_block_api(data: dict):
-    try:
-        # 獲取必要參數
-        block_id = data.get("block_id")
-        asset_id = data.get("asset_id")
-        user_id = data.get("user_id")
+# 區塊鎖定失敗原因對應的 HTTP 狀態碼與訊息
+BLOCK_LOCK_ERRORS = {
+    "not_found": (404, "找不到指定的區塊"),
+    "locked": (400, "區塊已被其他用戶鎖定"),
+    "not_locked": (400, "區塊未被鎖定"),
+    "not_owner": (403, "無權解鎖此區塊"),
+    "expired": (409, "區塊鎖定已過期，請重新鎖定")
+}
 
-        if not all([block_id, asset_id, user_id]):
-            raise HTTPException(status_code=400, detail="缺少必要參數")
 
-        # 將字符串格式的ID轉換為BINARY(16)格式
-        block_id_binary = uuid.UUID(block_id).bytes
-        asset_id_binary = uuid.UUID(asset_id).bytes
-        user_id_binary = uuid.UUID(user_id).bytes
+def parse_block_lock_request(data: dict):
+    """
+    取得鎖定相關 API 的 block_id、asset_id、user_id 並轉換為 BINARY(16) 格式
 
-        async with db_pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                try:
-                    # 開始事務
-                    await conn.begin()
+    Raises:
+        HTTPException: 缺少必要參數
+        ValueError: 無效的ID格式
+    """
+    block_id = data.get("block_id")
+    asset_id = data.get("asset_id")
+    user_id = data.get("user_id")
 
-                    # 檢查區塊是否存在
-                    await cur.execute("""
-                        SELECT IsLocked, LockedBy, LockedAt
-                        FROM ReportContentBlocks
-                        WHERE BlockID = %s AND AssetID = %s
-                        FOR UPDATE
-                    """, (block_id_binary, asset_id_binary))
+    if not all([block_id, asset_id, user_id]):
+        raise HTTPException(status_code=400, detail="缺少必要參數")
 
-                    block_data = await cur.fetchone()
-                    if not block_data:
-                        raise HTTPException(status_code=404, detail="找不到指定的區塊")
+    return uuid.UUID(block_id).bytes, uuid.UUID(asset_id).bytes, uuid.UUID(user_id).bytes
 
-                    is_locked, locked_by, locked_at = block_data
 
-                    # 檢查區塊是否已被鎖定
-                    current_time = datetime.now(timezone.utc)
-                    if is_locked:
-                        # 如果鎖定時間超過30分鐘，自動解鎖
-                        if locked_at and (current_time - locked_at) > timedelta(minutes=30):
-                            is_locked = False
-                        else:
-                            # 如果是被同一用戶鎖定，允許繼續編輯
-                            if locked_by != user_id_binary:
-                                raise HTTPException(status_code=400, detail="區塊已被其他用戶鎖定")
+# 鎖定區塊 (取得租約，用戶端須每隔 heartbeatInterval 秒呼叫 heartbeat_block_lock 續約)
+@app.post("/api/organizations/lock_block")
+async def lock_block_api(data: dict):
+    try:
+        block_id_binary, asset_id_binary, user_id_binary = parse_block_lock_request(data)
 
-                    # 鎖定區塊
-                    await cur.execute("""
-                        UPDATE ReportContentBlocks
-                        SET IsLocked = TRUE,
-                            LockedBy = %s,
-                            LockedAt = %s
-                        WHERE BlockID = %s AND AssetID = %s
-                    """, (user_id_binary, current_time, block_id_binary, asset_id_binary))
+        try:
+            await block_lock_manager.acquire(block_id_binary, asset_id_binary, user_id_binary)
+        except BlockLockError as e:
+            status_code, detail = BLOCK_LOCK_ERRORS[e.reason]
+            raise HTTPException(status_code=status_code, detail=detail)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"鎖定區塊失敗: {str(e)}")
 
-                    await conn.commit()
-                    return {
-                        "status": "success",
-                        "message": "區塊已成功鎖定"
-                    }
+        return {
+            "status": "success",
+            "message": "區塊已成功鎖定",
+            "leaseSeconds": block_lock_manager.lease_seconds,
+            "heartbeatInterval": max(1, block_lock_manager.lease_seconds // 3)
+        }
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="無效的ID格式")
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"處理請求時發生錯誤: {str(e)}")
 
-                except Exception as e:
-                    await conn.rollback()
-                    raise HTTPException(status_code=500, detail=f"鎖定區塊失敗: {str(e)}")
+
+# 續約區塊鎖定 (心跳)
+@app.post("/api/organizations/heartbeat_block_lock")
+async def heartbeat_block_lock(data: dict):
+    try:
+        block_id_binary, asset_id_binary, user_id_binary = parse_block_lock_request(data)
+
+        try:
+            await block_lock_manager.heartbeat(block_id_binary, asset_id_binary, user_id_binary)
+        except BlockLockError as e:
+            status_code, detail = BLOCK_LOCK_ERRORS[e.reason]
+            raise HTTPException(status_code=status_code, detail=detail)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"續約區塊鎖定失敗: {str(e)}")
+
+        return {
+            "status": "success",
+            "message": "區塊鎖定已續約",
+            "leaseSeconds": block_lock_manager.lease_seconds
+        }
 
     except ValueError as e:
         raise HTTPException(status_code=400, detail="無效的ID格式")
@@ -1822,62 +1965,20 @@ async def lock_block_api(data: dict):
 @app.post("/api/organizations/unlock_block")
 async def unlock_block(data: dict):
     try:
-        # 獲取必要參數
-        block_id = data.get("block_id")
-        asset_id = data.get("asset_id")
-        user_id = data.get("user_id")
+        block_id_binary, asset_id_binary, user_id_binary = parse_block_lock_request(data)
 
-        if not all([block_id, asset_id, user_id]):
-            raise HTTPException(status_code=400, detail="缺少必要參數")
+        try:
+            await block_lock_manager.release(block_id_binary, asset_id_binary, user_id_binary)
+        except BlockLockError as e:
+            status_code, detail = BLOCK_LOCK_ERRORS[e.reason]
+            raise HTTPException(status_code=status_code, detail=detail)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"解鎖區塊失敗: {str(e)}")
 
-        # 將字符串格式的ID轉換為BINARY(16)格式
-        block_id_binary = uuid.UUID(block_id).bytes
-        asset_id_binary = uuid.UUID(asset_id).bytes
-        user_id_binary = uuid.UUID(user_id).bytes
-
-        async with db_pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                try:
-                    # 開始事務
-                    await conn.begin()
-
-                    # 檢查區塊是否存在且被鎖定
-                    await cur.execute("""
-                        SELECT IsLocked, LockedBy
-                        FROM ReportContentBlocks
-                        WHERE BlockID = %s AND AssetID = %s
-                        FOR UPDATE
-                    """, (block_id_binary, asset_id_binary))
-                    block_data = await cur.fetchone()
-                    if not block_data:
-                        raise HTTPException(status_code=404, detail="找不到指定的區塊")
-
-                    is_locked, locked_by = block_data
-
-                    # 檢查區塊是否已被鎖定，以及是否由當前用戶鎖定
-                    if not is_locked:
-                        raise HTTPException(status_code=400, detail="區塊未被鎖定")
-                    if locked_by != user_id_binary:
-                        raise HTTPException(status_code=403, detail="無權解鎖此區塊")
-
-                    # 解鎖區塊
-                    await cur.execute("""
-                        UPDATE ReportContentBlocks
-                        SET IsLocked = FALSE,
-                            LockedBy = NULL,
-                            LockedAt = NULL
-                        WHERE BlockID = %s AND AssetID = %s
-                    """, (block_id_binary, asset_id_binary))
-
-                    await conn.commit()
-                    return {
-                        "status": "success",
-                        "message": "區塊已成功解鎖"
-                    }
-
-                except Exception as e:
-                    await conn.rollback()
-                    raise HTTPException(status_code=500, detail=f"解鎖區塊失敗: {str(e)}")
+        return {
+            "status": "success",
+            "message": "區塊已成功解鎖"
+        }
 
     except ValueError as e:
         raise HTTPException(status_code=400, detail="無效的ID格式")
@@ -1887,7 +1988,7 @@ async def unlock_block(data: dict):
         raise HTTPException(status_code=500, detail=f"處理請求時發生錯誤: {str(e)}")
 
 
-# 檢查頁面鎖定狀態
+# 檢查頁面鎖定狀態 (使用記憶體中的鎖定表，不查詢資料庫)
 @app.post("/api/organizations/check_page_lock")
 async def check_page_lock(data: dict):
     # 輸入 asset_id
@@ -1903,52 +2004,34 @@ async def check_page_lock(data: dict):
         asset_id_binary = uuid.UUID(asset_id).bytes
         block_id_binary = uuid.UUID(block_id).bytes if block_id else None
 
-        async with db_pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                try:
-                    # 檢查區塊是否被鎖定
-                    await cur.execute("""
-                        SELECT IsLocked, LockedBy, 
-                               (SELECT Username FROM Users WHERE UserID = LockedBy) as LockedByUsername,
-                               (SELECT AvatarUrl FROM Users WHERE UserID = LockedBy) as LockedByAvatarUrl
-                        FROM ReportContentBlocks 
-                        WHERE AssetID = %s AND BlockID = %s
-                    """, (asset_id_binary, block_id_binary))
-                    
-                    result = await cur.fetchone()
-                    if not result:
-                        return {
-                            "status": "success",
-                            "isLocked": False,
-                            "lockedBy": None
-                        }
-
-                    is_locked, locked_by, locked_by_username, locked_by_avatar = result
-                    
-                    if is_locked and locked_by:
-                        return {
-                            "status": "success",
-                            "isLocked": True,
-                            "lockedBy": {
-                                "id": str(uuid.UUID(bytes=locked_by)),
-                                "name": locked_by_username,
-                                "avatarUrl": locked_by_avatar
-                            }
-                        }
-                    else:
-                        return {
-                            "status": "success",
-                            "isLocked": False,
-                            "lockedBy": None
-                        }
+        locked_by = block_lock_manager.get(block_id_binary, asset_id_binary) if block_id_binary else None
+        if not locked_by:
+            return {
+                "status": "success",
+                "isLocked": False,
+                "lockedBy": None
+            }
 
-                except Exception as e:
-                    raise HTTPException(status_code=500, detail=f"檢查鎖定狀態失敗: {str(e)}")
+        locker = user_directory.peek(locked_by)
+        if locker is None:
+            async with db_pool.acquire_read() as conn:
+                async with conn.cursor() as cur:
+                    locker = await user_directory.get(cur, locked_by)
+        locker = locker or {}
+        return {
+            "status": "success",
+            "isLocked": True,
+            "lockedBy": {
+                "id": str(uuid.UUID(bytes=locked_by)),
+                "name": locker.get("name"),
+                "avatarUrl": locker.get("avatarUrl")
+            }
+        }
 
     except ValueError as e:
         raise HTTPException(status_code=400, detail="無效的ID格式")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"處理請求時發生錯誤: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"檢查鎖定狀態失敗: {str(e)}")
 
 
 # 建立公司基本表
@@ -1969,6 +2052,24 @@ async def create_company_table(data: dict):
         creator_id_binary = uuid.UUID(creator_id).bytes
         organization_id_binary = uuid.UUID(organization_id).bytes
 
+        # 獲取模板內容 (在開始事務前完成，避免下載期間佔用連線)
+        import aiohttp
+        async with aiohttp.ClientSession() as session:
+            async with session.get(template_url, headers={
+                'Accept': 'application/json',
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            }) as response:
+                if response.status != 200:
+                    raise HTTPException(status_code=400, detail=f"無法獲取模板內容: HTTP {response.status}")
+                try:
+                    template_data = await response.json(content_type=None)
+                except Exception as e:
+                    raise HTTPException(status_code=400, detail=f"模板內容解析失敗: {str(e)}")
+
+        # 驗證模板格式
+        if not isinstance(template_data, dict) or "chapters" not in template_data:
+            raise HTTPException(status_code=400, detail="無效的模板格式")
+
         async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 try:
@@ -1983,24 +2084,6 @@ async def create_company_table(data: dict):
                     if not await cur.fetchone():
                         raise HTTPException(status_code=404, detail="找不到指定的組織")
 
-                    # 獲取模板內容
-                    import aiohttp
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(template_url, headers={
-                            'Accept': 'application/json',
-                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                        }) as response:
-                            if response.status != 200:
-                                raise HTTPException(status_code=400, detail=f"無法獲取模板內容: HTTP {response.status}")
-                            try:
-                                template_data = await response.json(content_type=None)
-                            except Exception as e:
-                                raise HTTPException(status_code=400, detail=f"模板內容解析失敗: {str(e)}")
-
-                    # 驗證模板格式
-                    if not isinstance(template_data, dict) or "chapters" not in template_data:
-                        raise HTTPException(status_code=400, detail="無效的模板格式")
-
                     # 生成資產ID
                     asset_id = uuid.uuid4().bytes
 
@@ -2079,25 +2162,24 @@ async def create_company_table(data: dict):
                     ))
 
                     # 然後批量創建內容區塊
-                    for block_data in blocks_to_create:
-                        await cur.execute("""
-                            INSERT INTO ReportContentBlocks (
-                                BlockID, AssetID, status, content, ModifiedBy
-                            ) VALUES (%s, %s, %s, %s, %s)
-                        """, block_data)
+                    await bulk_insert(cur, """
+                        INSERT INTO ReportContentBlocks (
+                            BlockID, AssetID, status, content, ModifiedBy
+                        ) VALUES (%s, %s, %s, %s, %s)
+                    """, blocks_to_create)
 
                     # 最後批量創建權限映射
-                    for permission_data in permissions_to_create:
-                        await cur.execute("""
-                            INSERT INTO RolePermissionMappings (
-                                RoleID, PermissionChapterID, AssetID, ResourceType, ActionType
-                            ) VALUES (%s, %s, %s, %s, %s)
-                            ON DUPLICATE KEY UPDATE
-                            ResourceType = VALUES(ResourceType),
-                            ActionType = VALUES(ActionType)
-                        """, permission_data)
+                    await bulk_insert(cur, """
+                        INSERT INTO RolePermissionMappings (
+                            RoleID, PermissionChapterID, AssetID, ResourceType, ActionType
+                        ) VALUES (%s, %s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE
+                        ResourceType = VALUES(ResourceType),
+                        ActionType = VALUES(ActionType)
+                    """, permissions_to_create)
 
                     await conn.commit()
+                    permission_cache.invalidate(asset_id)
                     return {
                         "status": "success",
                         "message": "公司基本表創建成功",
@@ -2228,57 +2310,139 @@ async def delete_asset(data: dict):
         raise HTTPException(status_code=500, detail=f"刪除資產時發生錯誤: {str(e)}")
 
 
+# 資產列表分頁設定
+ASSET_PAGE_MAX_LIMIT = 200
+ASSET_TYPES = ('report', 'standard_template', 'company_info')
+ASSET_STATUSES = ('editing', 'archived')
+
+
+def encode_keyset_cursor(timestamp: datetime, row_id: bytes) -> str:
+    """將最後一筆資料的 (時間, ID) 編碼成下一頁的游標，例如資產的 (UpdatedAt, AssetID)"""
+    return f"{timestamp.isoformat()}_{row_id.hex()}"
+
+
+def decode_keyset_cursor(cursor: str) -> tuple:
+    """
+    解析游標分頁的游標
+
+    Returns:
+        tuple: (時間, ID bytes)
+
+    Raises:
+        ValueError: 游標格式錯誤
+    """
+    updated_at, asset_id = cursor.rsplit("_", 1)
+    return datetime.fromisoformat(updated_at), uuid.UUID(asset_id).bytes
+
+
 # 取得組織資產
 @app.get("/api/organizations/get_organization_assets")
-async def get_organization_assets(organization_id: str):
+async def get_organization_assets(
+    organization_id: str,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    asset_type: Optional[str] = None,
+    status: Optional[str] = None,
+    include_total: bool = False
+):
+    """
+    取得組織的資產列表，依更新時間由新到舊排序
+
+    Args:
+        organization_id: 組織ID
+        limit: 每頁筆數 (最多 ASSET_PAGE_MAX_LIMIT)，未提供時返回所有資產
+        cursor: 上一頁返回的 nextCursor，以 (UpdatedAt, AssetID) 定位下一頁
+        asset_type: 只列出指定類型的資產 (report / standard_template / company_info)
+        status: 只列出指定狀態的資產 (editing / archived)
+        include_total: 是否返回符合條件的總筆數 (建議只在第一頁要求)
+
+    Returns:
+        dict: data 為資產列表，nextCursor 為下一頁的游標 (沒有下一頁時為 None)
+    """
     try:
         # 獲取組織ID並轉換為BINARY(16)格式
         organization_id_bytes = uuid.UUID(organization_id).bytes
     except (ValueError, AttributeError):
         raise HTTPException(status_code=400, detail="無效的組織ID格式")
 
-    async with db_pool.acquire() as conn:
+    if limit is not None and not 1 <= limit <= ASSET_PAGE_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit 必須介於 1 到 {ASSET_PAGE_MAX_LIMIT}")
+    if asset_type is not None and asset_type not in ASSET_TYPES:
+        raise HTTPException(status_code=400, detail="無效的資產類型")
+    if status is not None and status not in ASSET_STATUSES:
+        raise HTTPException(status_code=400, detail="無效的資產狀態")
+
+    # 篩選條件 (只依狀態篩選時使用 idx_active_assets，依資產類型篩選時使用 idx_asset_type_status)
+    conditions = "oa.OrganizationID = %s AND oa.IsDeleted = FALSE"
+    params = [organization_id_bytes]
+    if status is not None:
+        conditions += " AND oa.Status = %s"
+        params.append(status)
+    if asset_type is not None:
+        conditions += " AND oa.AssetType = %s"
+        params.append(asset_type)
+
+    # 游標條件 (UpdatedAt, AssetID) < 上一頁最後一筆
+    page_conditions = conditions
+    page_params = list(params)
+    if cursor:
+        try:
+            cursor_updated_at, cursor_asset_id = decode_keyset_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="無效的分頁游標")
+        page_conditions += " AND (oa.UpdatedAt < %s OR (oa.UpdatedAt = %s AND oa.AssetID < %s))"
+        page_params += [cursor_updated_at, cursor_updated_at, cursor_asset_id]
+
+    async with db_pool.acquire_read() as conn:
         async with conn.cursor() as cur:
             try:
-                # 開始事務
-                await conn.begin()
-
-                # 查詢組織的所有未刪除的資產
-                await cur.execute("""
+                # 查詢組織的未刪除資產，並同時 JOIN 創建者信息 (多取一筆以判斷是否有下一頁)
+                await cur.execute(f"""
                     SELECT 
-                        AssetID,
-                        AssetName,
-                        AssetType,
-                        Status,
-                        UpdatedAt,
-                        CreatorID,
-                        CreatedAt
-                    FROM OrganizationAssets
-                    WHERE OrganizationID = %s 
-                    AND IsDeleted = FALSE
-                    ORDER BY UpdatedAt DESC
-                """, (organization_id_bytes,))
+                        oa.AssetID,
+                        oa.AssetName,
+                        oa.AssetType,
+                        oa.Status,
+                        oa.UpdatedAt,
+                        oa.CreatorID,
+                        oa.CreatedAt,
+                        u.UserName,
+                        u.AvatarUrl
+                    FROM OrganizationAssets oa
+                    LEFT JOIN Users u ON u.UserID = oa.CreatorID
+                    WHERE {page_conditions}
+                    ORDER BY oa.UpdatedAt DESC, oa.AssetID DESC
+                    {"LIMIT %s" if limit is not None else ""}
+                """, page_params + ([limit + 1] if limit is not None else []))
 
                 assets = await cur.fetchall()
+
+                next_cursor = None
+                if limit is not None and len(assets) > limit:
+                    assets = assets[:limit]
+                    next_cursor = encode_keyset_cursor(assets[-1][4], assets[-1][0])
+
+                # 總筆數只在要求時計算 (篩選欄位皆在 idx_active_assets / idx_asset_type_status 中，只掃描組織的索引項目，不讀取資料列)
+                total = None
+                if include_total:
+                    await cur.execute(f"""
+                        SELECT COUNT(*)
+                        FROM OrganizationAssets oa
+                        WHERE {conditions}
+                    """, params)
+                    total = (await cur.fetchone())[0]
                 
                 # 格式化資產列表
                 asset_list = []
                 for asset in assets:
-                    # 獲取創建者信息
+                    # 創建者信息
                     creator_info = None
-                    if asset[5]:  # 如果有創建者ID
-                        await cur.execute("""
-                            SELECT UserName, AvatarUrl
-                            FROM Users
-                            WHERE UserID = %s
-                        """, (asset[5],))
-                        creator = await cur.fetchone()
-                        if creator:
-                            creator_info = {
-                                "id": uuid.UUID(bytes=asset[5]).hex,
-                                "name": creator[0],
-                                "avatarUrl": creator[1] or DEFAULT_USER_AVATAR
-                            }
+                    if asset[5] and asset[7] is not None:
+                        creator_info = {
+                            "id": uuid.UUID(bytes=asset[5]).hex,
+                            "name": asset[7],
+                            "avatarUrl": asset[8] or DEFAULT_USER_AVATAR
+                        }
 
                     asset_list.append({
                         "assetID": uuid.UUID(bytes=asset[0]).hex,
@@ -2290,14 +2454,16 @@ async def get_organization_assets(organization_id: str):
                         "createdAt": asset[6].isoformat() if asset[6] else None
                     })
 
-                await conn.commit()
-                return {
+                response_data = {
                     "status": "success",
-                    "data": asset_list
+                    "data": asset_list,
+                    "nextCursor": next_cursor
                 }
+                if include_total:
+                    response_data["total"] = total
+                return response_data
 
             except Exception as e:
-                await conn.rollback()
                 raise HTTPException(status_code=500, detail=f"獲取組織資產失敗: {str(e)}")
 
 
@@ -2410,6 +2576,7 @@ async def create_standard_template(data: dict):
                     ))
 
                     await conn.commit()
+                    permission_cache.invalidate(asset_id)
                     return {
                         "status": "success",
                         "message": "準則模板創建成功",
@@ -2453,12 +2620,9 @@ async def get_standard_template(data: dict):
         except ValueError:
             raise HTTPException(status_code=400, detail="無效的ID格式")
 
-        async with db_pool.acquire() as conn:
+        async with db_pool.acquire_read() as conn:
             async with conn.cursor() as cur:
                 try:
-                    # 開始事務
-                    await conn.begin()
-
                     # 從 organizationassets 表獲取資產資訊
                     await cur.execute("""
                         SELECT 
@@ -2471,7 +2635,6 @@ async def get_standard_template(data: dict):
                         FROM OrganizationAssets
                         WHERE AssetID = %s
                         AND OrganizationID = %s
-                        FOR UPDATE
                     """, (asset_id_binary, organization_id_binary))
 
                     asset = await cur.fetchone()
@@ -2499,11 +2662,11 @@ async def get_standard_template(data: dict):
                         raise HTTPException(status_code=400, detail="資產內容解析失敗")
 
                     # 驗證權限
-                    has_permission = await check_block_permission(
+                    allowed = await check_block_permission(
                         cur, permission_id_binary, role_ids, asset_id_binary
                     )
                     
-                    if not has_permission:
+                    if not allowed:
                         raise HTTPException(status_code=403, detail="權限不足")
 
                     # 從 reportcontentblocks 表獲取區塊內容
@@ -2518,44 +2681,16 @@ async def get_standard_template(data: dict):
                             status
                         FROM ReportContentBlocks
                         WHERE BlockID = %s AND AssetID = %s
-                        FOR UPDATE
                     """, (block_id_binary, asset_id_binary))
 
                     block = await cur.fetchone()
                     if not block:
                         raise HTTPException(status_code=404, detail="找不到區塊內容")
 
-                    # 獲取最後修改者的信息
-                    modified_by_info = None
-                    if block[2]:  # ModifiedBy
-                        await cur.execute("""
-                            SELECT UserName, AvatarUrl
-                            FROM Users
-                            WHERE UserID = %s
-                        """, (block[2],))
-                        modifier = await cur.fetchone()
-                        if modifier:
-                            modified_by_info = {
-                                "id": uuid.UUID(bytes=block[2]).hex,
-                                "name": modifier[0],
-                                "avatarUrl": modifier[1] or DEFAULT_USER_AVATAR
-                            }
-
-                    # 獲取鎖定者的信息
-                    locked_by_info = None
-                    if block[4]:  # LockedBy
-                        await cur.execute("""
-                            SELECT UserName, AvatarUrl
-                            FROM Users
-                            WHERE UserID = %s
-                        """, (block[4],))
-                        locker = await cur.fetchone()
-                        if locker:
-                            locked_by_info = {
-                                "id": uuid.UUID(bytes=block[4]).hex,
-                                "name": locker[0],
-                                "avatarUrl": locker[1] or DEFAULT_USER_AVATAR
-                            }
+                    # 一次獲取最後修改者與鎖定者的信息
+                    users = await user_directory.get_many(cur, [block[2], block[4]])
+                    modified_by_info = users.get(block[2])
+                    locked_by_info = users.get(block[4])
 
                     # 構建回應數據
                     response_data = {
@@ -2577,11 +2712,9 @@ async def get_standard_template(data: dict):
                         }
                     }
 
-                    await conn.commit()
                     return response_data
 
                 except Exception as e:
-                    await conn.rollback()
                     raise HTTPException(status_code=500, detail=f"獲取準則模板失敗: {str(e)}")
 
     except ValueError as e:
@@ -2628,10 +2761,10 @@ async def save_standard_template(data: dict):
                     await conn.begin()
 
                     # 檢查權限
-                    has_permission = await check_block_permission(
-                        cur, permission_chapter_id_binary, role_ids, asset_id_binary
+                    allowed = await check_block_permission(
+                        cur, permission_chapter_id_binary, role_ids, asset_id_binary, for_update=True
                     )
-                    if not has_permission:
+                    if not allowed:
                         raise HTTPException(status_code=403, detail="權限不足")
 
                     # 檢查資產是否存在且屬於該組織
@@ -2832,6 +2965,13 @@ async def create_report(data: dict):
                         raise HTTPException(status_code=404, detail="公司基本资料不存在")
 
                     company_info_content = json.loads(company_info[0])
+
+                    # 獲取組織中"一般"角色的RoleID (用於默認權限映射)
+                    await cur.execute(
+                        "SELECT RoleID FROM Roles WHERE OrganizationID = %s AND RoleName = '一般'",
+                        (organization_id,)
+                    )
+                    general_role_ids = [row[0] for row in await cur.fetchall()]
                     
                     # 創建新的報告書資產
                     new_asset_id = uuid.uuid4().bytes
@@ -2882,48 +3022,48 @@ async def create_report(data: dict):
                         )
                     )
 
-                    # 然後創建內容塊和權限映射
+                    # 然後批量創建內容塊和權限映射
+                    blocks_to_create = []
+                    permissions_to_create = []
                     for chapter in new_chapters:
                         for sub_chapter in chapter['subChapters']:
                             block_id = uuid.UUID(sub_chapter['BlockID']).bytes
                             permission_id = uuid.UUID(sub_chapter['access_permissions']).bytes
-                            
-                            # 創建內容塊
-                            await cur.execute(
-                                """
-                                INSERT INTO ReportContentBlocks 
-                                (BlockID, AssetID, content) 
-                                VALUES (%s, %s, %s)
-                                """,
-                                (
-                                    block_id,
-                                    new_asset_id,
-                                    json.dumps({
-                                        'BlockID': sub_chapter['BlockID'],
-                                        'subChapterTitle': sub_chapter['subChapterTitle'],
-                                        'content': {
-                                            'text': '',
-                                            'images': [],
-                                            'guidelines': {},
-                                            'comments': []
-                                        }
-                                    })
-                                )
-                            )
-                            
-                            # 創建默認權限映射
-                            await cur.execute(
-                                """
-                                INSERT INTO RolePermissionMappings 
-                                (RoleID, PermissionChapterID, AssetID, ResourceType, ActionType)
-                                SELECT RoleID, %s, %s, 'report', 'read_write'
-                                FROM Roles 
-                                WHERE OrganizationID = %s AND RoleName = '一般'
-                                """,
-                                (permission_id, new_asset_id, organization_id)
-                            )
+
+                            # 內容塊
+                            blocks_to_create.append((
+                                block_id,
+                                new_asset_id,
+                                json.dumps({
+                                    'BlockID': sub_chapter['BlockID'],
+                                    'subChapterTitle': sub_chapter['subChapterTitle'],
+                                    'content': {
+                                        'text': '',
+                                        'images': [],
+                                        'guidelines': {},
+                                        'comments': []
+                                    }
+                                })
+                            ))
+
+                            # 默認權限映射
+                            for role_id in general_role_ids:
+                                permissions_to_create.append((role_id, permission_id, new_asset_id, 'report', 'read_write'))
+
+                    await bulk_insert(cur, """
+                        INSERT INTO ReportContentBlocks 
+                        (BlockID, AssetID, content) 
+                        VALUES (%s, %s, %s)
+                    """, blocks_to_create)
+
+                    await bulk_insert(cur, """
+                        INSERT INTO RolePermissionMappings 
+                        (RoleID, PermissionChapterID, AssetID, ResourceType, ActionType)
+                        VALUES (%s, %s, %s, %s, %s)
+                    """, permissions_to_create)
 
                     await conn.commit()
+                    permission_cache.invalidate(new_asset_id)
 
                     # 新增報告書_公司資料_對應表
                     await cur.execute(
@@ -2970,12 +3110,9 @@ async def get_report_data(data: dict):
         except ValueError:
             raise HTTPException(status_code=400, detail="無效的ID格式")
 
-        async with db_pool.acquire() as conn:
+        async with db_pool.acquire_read() as conn:
             async with conn.cursor() as cur:
                 try:
-                    # 開始事務
-                    await conn.begin()
-
                     # 查詢資產基本信息
                     await cur.execute("""
                         SELECT 
@@ -2992,7 +3129,6 @@ async def get_report_data(data: dict):
                         AND OrganizationID = %s 
                         AND IsDeleted = FALSE
                         AND AssetType = 'report'
-                        FOR UPDATE
                     """, (asset_id_binary, organization_id_binary))
 
                     asset = await cur.fetchone()
@@ -3000,20 +3136,7 @@ async def get_report_data(data: dict):
                         raise HTTPException(status_code=404, detail="找不到該報告書或報告書已被刪除")
 
                     # 獲取創建者信息
-                    creator_info = None
-                    if asset[6]:  # CreatorID
-                        await cur.execute("""
-                            SELECT UserName, AvatarUrl
-                            FROM Users
-                            WHERE UserID = %s
-                        """, (asset[6],))
-                        creator = await cur.fetchone()
-                        if creator:
-                            creator_info = {
-                                "id": uuid.UUID(bytes=asset[6]).hex,
-                                "name": creator[0],
-                                "avatarUrl": creator[1] or DEFAULT_USER_AVATAR
-                            }
+                    creator_info = await user_directory.get(cur, asset[6])
 
                     # 解析報告書內容
                     content = json.loads(asset[5]) if asset[5] else {}
@@ -3071,14 +3194,11 @@ async def get_report_data(data: dict):
                         }
                     }
 
-                    await conn.commit()
                     return response_data
 
                 except json.JSONDecodeError:
-                    await conn.rollback()
                     raise HTTPException(status_code=500, detail="報告書內容格式錯誤")
                 except Exception as e:
-                    await conn.rollback()
                     raise HTTPException(status_code=500, detail=f"獲取報告書資料失敗: {str(e)}")
 
     except ValueError as e:
@@ -3104,88 +3224,33 @@ async def get_report_block_data(data: dict):
         except ValueError:
             raise HTTPException(status_code=400, detail="無效的區塊ID格式")
 
-        async with db_pool.acquire() as conn:
+        async with db_pool.acquire_read() as conn:
             async with conn.cursor() as cur:
                 try:
-                    # 開始事務
-                    await conn.begin()
-
-                    # 查詢區塊內容和相關信息
-                    await cur.execute("""
-                        SELECT 
-                            content,
-                            LastModified,
-                            ModifiedBy,
-                            IsLocked,
-                            LockedBy,
-                            LockedAt,
-                            status,
-                            AssetID
-                        FROM ReportContentBlocks
-                        WHERE BlockID = %s
-                        FOR UPDATE
-                    """, (block_id_binary,))
-
-                    block = await cur.fetchone()
-                    if not block:
-                        raise HTTPException(status_code=404, detail="找不到指定的區塊")
-
-                    # 獲取最後修改者的信息
-                    modified_by_info = None
-                    if block[2]:  # ModifiedBy
-                        await cur.execute("""
-                            SELECT UserName, AvatarUrl
-                            FROM Users
-                            WHERE UserID = %s
-                        """, (block[2],))
-                        modifier = await cur.fetchone()
-                        if modifier:
-                            modified_by_info = {
-                                "id": uuid.UUID(bytes=block[2]).hex,
-                                "name": modifier[0],
-                                "avatarUrl": modifier[1] or DEFAULT_USER_AVATAR
-                            }
-
-                    # 獲取鎖定者的信息
-                    locked_by_info = None
-                    if block[4]:  # LockedBy
-                        await cur.execute("""
-                            SELECT UserName, AvatarUrl
-                            FROM Users
-                            WHERE UserID = %s
-                        """, (block[4],))
-                        locker = await cur.fetchone()
-                        if locker:
-                            locked_by_info = {
-                                "id": uuid.UUID(bytes=block[4]).hex,
-                                "name": locker[0],
-                                "avatarUrl": locker[1] or DEFAULT_USER_AVATAR
-                            }
+                    # 查詢區塊內容和相關信息 (單一查詢同時取得修改者與鎖定者)
+                    block_data = await get_block_content(cur, block_id_binary)
 
                     # 構建回應數據
                     response_data = {
                         "status": "success",
                         "data": {
                             "blockID": block_id,
-                            "assetID": uuid.UUID(bytes=block[7]).hex if block[7] else None,
-                            "content": json.loads(block[0]) if block[0] else None,
-                            "lastModified": block[1].isoformat() if block[1] else None,
-                            "modifiedBy": modified_by_info,
-                            "isLocked": block[3],
-                            "lockedBy": locked_by_info,
-                            "lockedAt": block[5].isoformat() if block[5] else None,
-                            "blockStatus": block[6]
+                            "assetID": block_data["assetID"],
+                            "content": block_data["content"],
+                            "lastModified": block_data["lastModified"],
+                            "modifiedBy": block_data["modifiedBy"],
+                            "isLocked": block_data["isLocked"],
+                            "lockedBy": block_data["lockedBy"],
+                            "lockedAt": block_data["lockedAt"],
+                            "blockStatus": block_data["status"]
                         }
                     }
 
-                    await conn.commit()
                     return response_data
 
                 except json.JSONDecodeError:
-                    await conn.rollback()
                     raise HTTPException(status_code=500, detail="區塊內容格式錯誤")
                 except Exception as e:
-                    await conn.rollback()
                     raise HTTPException(status_code=500, detail=f"獲取區塊內容失敗: {str(e)}")
 
     except ValueError as e:
@@ -3196,6 +3261,85 @@ async def get_report_block_data(data: dict):
         raise HTTPException(status_code=500, detail=f"處理請求時發生錯誤: {str(e)}")
 
 
+# 一次取得多個報告書Block內容 (整個章節或整份報告書)
+@app.post("/api/report/get_report_blocks_data")
+async def get_report_blocks_data(data: dict):
+    """
+    一次取得多個區塊的內容，取代逐一呼叫 /api/report/get_report_block_data
+    
+    Args:
+        data: 包含以下字段的字典：
+            - asset_id: 資產ID(UUID)，報告書或公司基本表
+            - roleID: 角色ID列表(JSON格式或逗號分隔字串)
+            - block_ids: (可選) 區塊ID列表
+            - chapter_title: (可選) 章節標題，未提供 block_ids 時取得該章節的所有區塊
+            
+    Returns:
+        dict: blocks 依大綱順序排列的區塊內容，deniedBlockIDs 為權限不足的區塊
+    """
+    try:
+        asset_id = data.get("asset_id")
+        role_ids = data.get("roleID")
+        block_ids = data.get("block_ids")
+        chapter_title = data.get("chapter_title")
+
+        if not all([asset_id, role_ids]):
+            raise HTTPException(status_code=400, detail="缺少必要參數")
+
+        # 將逗號分隔的字符串轉換為列表
+        if isinstance(role_ids, str):
+            role_ids = role_ids.split(',')
+        if not isinstance(role_ids, list):
+            raise HTTPException(status_code=400, detail="roleID 必須是列表")
+        if block_ids is not None and not isinstance(block_ids, list):
+            raise HTTPException(status_code=400, detail="block_ids 必須是列表")
+
+        try:
+            asset_id_binary = uuid.UUID(asset_id).bytes
+            for role_id in role_ids:
+                uuid.UUID(role_id)
+            requested_block_ids = [uuid.UUID(block_id).hex for block_id in block_ids] if block_ids else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="無效的ID格式")
+
+        async with db_pool.acquire_read() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    SELECT Content
+                    FROM OrganizationAssets
+                    WHERE AssetID = %s AND IsDeleted = FALSE
+                """, (asset_id_binary,))
+                asset = await cur.fetchone()
+                if not asset:
+                    raise HTTPException(status_code=404, detail="找不到指定的資產")
+
+                # 由大綱取得區塊與其章節權限
+                outline_blocks = collect_outline_blocks(json.loads(asset[0]) if asset[0] else {}, chapter_title)
+                if requested_block_ids is not None:
+                    requested = set(requested_block_ids)
+                    outline_blocks = [block for block in outline_blocks if block[0] in requested]
+
+                try:
+                    blocks, denied_block_ids = await get_permitted_block_contents(
+                        cur, asset_id_binary, outline_blocks, role_ids
+                    )
+                except json.JSONDecodeError:
+                    raise HTTPException(status_code=500, detail="區塊內容格式錯誤")
+
+        return {
+            "status": "success",
+            "data": {
+                "blocks": [blocks[block_id] for block_id, _ in outline_blocks if block_id in blocks],
+                "deniedBlockIDs": denied_block_ids
+            }
+        }
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"處理請求時發生錯誤: {str(e)}")
+
+
 # 更新報告書Block內容
 @app.post("/api/report/update_report_block_data")
 async def update_report_block_data(data: dict):
@@ -3222,7 +3366,6 @@ async def update_report_block_data(data: dict):
         except json.JSONDecodeError:
             raise HTTPException(status_code=400, detail="內容必須是有效的JSON格式")
 
-        # 使用全局的 db_pool
         async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 # 檢查區塊是否被鎖定
@@ -3428,9 +3571,7 @@ async def update_report_outline_add_chapter_title(data: dict):
         except ValueError:
             raise HTTPException(status_code=400, detail="無效的 UUID 格式")
 
-        # 修正非同步調用
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 # 檢查資產是否存在
                 await cur.execute(
@@ -3509,8 +3650,7 @@ async def rename_chapter_title(data: dict):
             raise HTTPException(status_code=400, detail="無效的 asset_id 格式")
 
         # 獲取資料庫連接
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 # 從資料庫獲取資產內容
                 await cur.execute("""
@@ -3577,8 +3717,7 @@ async def delete_report_outline(data: dict):
         asset_id_binary = uuid.UUID(asset_id).bytes
 
         # 獲取資料庫連接
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                     # 獲取資產內容
                     await cur.execute("""
@@ -3643,7 +3782,11 @@ async def delete_report_outline(data: dict):
                         WHERE AssetID = %s
                     """, (json.dumps(content), current_time, asset_id_binary))
 
+                    # 刪除的章節可能包含審核階段的權限，重新計算審核收件匣
+                    await refresh_review_inbox(cur, asset_id=asset_id_binary)
+
                     await conn.commit()
+                    permission_cache.invalidate(asset_id_binary)
 
                     return {
                         "status": "success",
@@ -3681,8 +3824,7 @@ async def add_subchapter(data: dict):
         current_time = datetime.now()
 
         # 獲取資料庫連接
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 # 將字符串ID轉換為二進制格式
                 asset_id_binary = bytes.fromhex(asset_id)
@@ -3759,6 +3901,7 @@ async def add_subchapter(data: dict):
                     )
 
                 await conn.commit()
+                permission_cache.invalidate(asset_id_binary)
 
                 return {
                     "status": "success",
@@ -3794,8 +3937,7 @@ async def rename_subchapter(data: dict):
             raise HTTPException(status_code=400, detail="缺少必要參數")
         
         # 獲取資料庫連接
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 try:
                     # 開始交易
@@ -3888,8 +4030,7 @@ async def delete_subchapter(data: dict):
             raise HTTPException(status_code=400, detail="缺少必要參數")
 
         # 獲取資料庫連接
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 # 將 asset_id 轉換為 bytes
                 asset_id_binary = bytes.fromhex(asset_id.replace('-', ''))
@@ -3945,8 +4086,11 @@ async def delete_subchapter(data: dict):
                         "DELETE FROM RolePermissionMappings WHERE PermissionChapterID = %s",
                         (permission_id_binary,)
                     )
+                    # 刪除的權限可能包含審核階段的權限，重新計算審核收件匣
+                    await refresh_review_inbox(cur, asset_id=asset_id_binary)
 
                 await conn.commit()
+                permission_cache.invalidate(asset_id_binary)
 
                 return {"status": "success", "message": "子章節已成功刪除"}
 
@@ -3976,8 +4120,7 @@ async def add_company_info_chapter(data: dict):
             raise HTTPException(status_code=400, detail="章節等級必須是 1, 2, 或 3")
 
         # 獲取資料庫連接
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 # 將 asset_id 轉換為 bytes
                 asset_id_binary = bytes.fromhex(asset_id.replace('-', ''))
@@ -4165,6 +4308,7 @@ async def add_company_info_chapter(data: dict):
                 )
 
                 await conn.commit()
+                permission_cache.invalidate(asset_id_binary)
 
                 return {"status": "success", "message": "章節新增成功"}
 
@@ -4193,8 +4337,7 @@ async def delete_company_info_chapter(data: dict):
             raise HTTPException(status_code=400, detail="章節等級必須是 1, 2, 或 3")
 
         # 獲取資料庫連接
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 # 將 asset_id 轉換為 bytes
                 asset_id_binary = bytes.fromhex(asset_id.replace('-', ''))
@@ -4376,7 +4519,11 @@ async def delete_company_info_chapter(data: dict):
                     (json.dumps(content), asset_id_binary)
                 )
 
+                # 刪除的章節可能包含審核階段的權限，重新計算審核收件匣
+                await refresh_review_inbox(cur, asset_id=asset_id_binary)
+
                 await conn.commit()
+                permission_cache.invalidate(asset_id_binary)
 
                 return {"status": "success", "message": "章節刪除成功"}
 
@@ -4406,8 +4553,7 @@ async def edit_company_info_chapter_title(data: dict):
             raise HTTPException(status_code=400, detail="章節等級必須是 1, 2, 或 3")
 
         # 獲取資料庫連接
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 # 將 asset_id 轉換為 bytes
                 asset_id_binary = bytes.fromhex(asset_id.replace('-', ''))
@@ -4614,67 +4760,465 @@ async def generate_text(data: dict):
         if not all([company_info_assetID, chapter_title, sub_chapter_title]):
             raise HTTPException(status_code=400, detail="缺少必要參數")
 
-        # 獲取資料庫連接
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                # 將 company_info_assetID 轉換為 bytes
-                asset_id_binary = bytes.fromhex(company_info_assetID.replace('-', ''))
+        # async_job 為 true 時建立背景工作並立即返回工作ID，結果以 /api/jobs/status 查詢
+        if data.get("async_job"):
+            job_id = await enqueue_job(db_pool, "generate_text", {
+                "company_info_assetID": company_info_assetID,
+                "chapter_title": chapter_title,
+                "sub_chapter_title": sub_chapter_title
+            })
+            return {"status": "success", "data": {"job_id": job_id}}
 
-                # 從 organizationassets 獲取資產內容
-                await cur.execute(
-                    "SELECT Content, Category FROM OrganizationAssets WHERE AssetID = %s AND IsDeleted = FALSE",
-                    (asset_id_binary,)
-                )
-                result = await cur.fetchone()
-                if not result:
-                    raise HTTPException(status_code=404, detail="找不到指定的資產")
+        # 讀取階段：讀取資料後即歸還資料庫連線
+        category, prompt = await load_generate_text_prompt(company_info_assetID, chapter_title, sub_chapter_title)
 
-                assets_content = json.loads(result[0])
-                category = result[1]
-                # 尋找對應的章節和子章節
-                target_sub_sub_chapters = None
-                for chapter in assets_content.get("chapters", []):
-                    if chapter["chapterTitle"] == chapter_title:
-                        for sub_chapter in chapter.get("subChapters", []):
-                            if sub_chapter["subChapterTitle"] == sub_chapter_title:
-                                target_sub_sub_chapters = sub_chapter.get("subSubChapters", [])
-                                break
-                        break
+        # 呼叫模型階段：等待 LLM 期間不佔用資料庫連線
+        text = await call_generate_text_model(category, chapter_title, sub_chapter_title, prompt)
 
-                if not target_sub_sub_chapters:
-                    raise HTTPException(status_code=404, detail="找不到指定的章節或子章節")
+        return {"status": "success", "text": text}
 
-                # 生成輸出文字
-                output_text = ""
-                for sub_sub_chapter in target_sub_sub_chapters:
-                    block_id = sub_sub_chapter["BlockID"]
-                    block_id_binary = bytes.fromhex(block_id.replace('-', ''))
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"錯誤詳情: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"處理請求時發生錯誤: {str(e)}")
 
-                    # 從 reportcontentblocks 獲取區塊內容
-                    await cur.execute(
-                        "SELECT content FROM ReportContentBlocks WHERE BlockID = %s",
-                        (block_id_binary,)
+
+# 讀取生成報告書文字所需的資料
+async def load_generate_text_prompt(company_info_assetID: str, chapter_title: str, sub_chapter_title: str) -> tuple:
+    """
+    從公司基本資料中取得指定子章節底下所有區塊的文字，組成 LLM 的輸入
+
+    Args:
+        company_info_assetID: 公司基本資料的資產ID
+        chapter_title: 章節標題
+        sub_chapter_title: 子章節標題
+
+    Returns:
+        tuple: (產業類別, 輸入文字)
+    """
+    async with db_pool.acquire_read() as conn:
+        async with conn.cursor() as cur:
+            # 將 company_info_assetID 轉換為 bytes
+            asset_id_binary = bytes.fromhex(company_info_assetID.replace('-', ''))
+
+            # 從 organizationassets 獲取資產內容
+            await cur.execute(
+                "SELECT Content, Category FROM OrganizationAssets WHERE AssetID = %s AND IsDeleted = FALSE",
+                (asset_id_binary,)
+            )
+            result = await cur.fetchone()
+            if not result:
+                raise HTTPException(status_code=404, detail="找不到指定的資產")
+
+            assets_content = json.loads(result[0])
+            category = result[1]
+            # 尋找對應的章節和子章節
+            target_sub_sub_chapters = None
+            for chapter in assets_content.get("chapters", []):
+                if chapter["chapterTitle"] == chapter_title:
+                    for sub_chapter in chapter.get("subChapters", []):
+                        if sub_chapter["subChapterTitle"] == sub_chapter_title:
+                            target_sub_sub_chapters = sub_chapter.get("subSubChapters", [])
+                            break
+                    break
+
+            if not target_sub_sub_chapters:
+                raise HTTPException(status_code=404, detail="找不到指定的章節或子章節")
+
+            # 一次取得子章節底下所有區塊的內容
+            blocks = await get_block_contents(
+                cur, [uuid.UUID(sub_sub_chapter["BlockID"]).bytes for sub_sub_chapter in target_sub_sub_chapters]
+            )
+
+    # 生成輸出文字
+    output_text = ""
+    for sub_sub_chapter in target_sub_sub_chapters:
+        block = blocks.get(uuid.UUID(sub_sub_chapter["BlockID"]).hex)
+        if block:
+            text_content = (block["content"] or {}).get("content", {}).get("text", "")
+            output_text += f"{sub_sub_chapter['subSubChapterTitle']}:{text_content}\n\n"
+    return category, output_text.strip()
+
+
+# 呼叫 LLM 生成報告書文字 (不使用資料庫連線)
+async def call_generate_text_model(category: str, chapter_title: str, sub_chapter_title: str, prompt: str, api_key_index: int = None) -> str:
+    """
+    以範例報告書為參考，呼叫 LLM 生成子章節的文字
+
+    Args:
+        category: 產業類別
+        chapter_title: 章節標題
+        sub_chapter_title: 子章節標題
+        prompt: 公司基本資料組成的輸入文字
+        api_key_index: 起始使用的 API 密鑰索引，None 表示使用預設密鑰
+
+    Returns:
+        str: 清理後的生成文字
+    """
+    # 建立物件
+    generator = GeminiGenerator(api_keys, model_name, config, base_url, max_retry)
+    if api_key_index is not None:
+        generator.current_api_key = api_keys[api_key_index % len(api_keys)]
+    # 獲取訓練數據
+    messages = await generator.get_messages(category, chapter_title, sub_chapter_title, SAMPLE_REPORT_SOURCE)
+    response = await generator.generate_text(messages, prompt)
+    if response is None:
+        raise Exception("LLM 未返回結果")
+    return response.content.replace("*   ", "").replace("*", "")
+
+
+class StreamTextCleaner:
+    """
+    串流文字的 "*" 清理 (與一次性生成的 .replace("*   ", "").replace("*", "") 結果相同)
+
+    片段結尾若是尚未完整的 "*   "，先保留到下一個片段再處理。
+    """
+
+    def __init__(self):
+        self._pending = ""
+
+    @staticmethod
+    def _clean(text):
+        return text.replace("*   ", "").replace("*", "")
+
+    def feed(self, text):
+        text = self._pending + text
+        self._pending = ""
+        index = text.rfind("*")
+        if index != -1 and len(text) - index < 4 and text[index + 1:].strip(" ") == "":
+            self._pending = text[index:]
+            text = text[:index]
+        return self._clean(text)
+
+    def flush(self):
+        text = self._pending
+        self._pending = ""
+        return self._clean(text)
+
+
+# 生成報告書文字 (串流)
+@app.post("/api/report/generate_text_stream")
+async def generate_text_stream(data: dict, request: Request):
+    """
+    以 Server-Sent Events 逐段回傳生成的報告書文字
+
+    事件格式:
+        data: {"text": "..."}          生成的文字片段
+        event: done                    生成完成
+        event: error                   生成失敗，data 為 {"detail": "..."}
+    """
+    try:
+        # 獲取必要參數
+        company_info_assetID = data.get("company_info_assetID")
+        chapter_title = data.get("chapter_title")
+        sub_chapter_title = data.get("sub_chapter_title")
+
+        if not all([company_info_assetID, chapter_title, sub_chapter_title]):
+            raise HTTPException(status_code=400, detail="缺少必要參數")
+
+        # 讀取資料後即歸還資料庫連線，串流期間不佔用連線
+        category, prompt = await load_generate_text_prompt(company_info_assetID, chapter_title, sub_chapter_title)
+
+        # 建立物件
+        generator = GeminiGenerator(api_keys, model_name, config, base_url, max_retry)
+        # 獲取訓練數據
+        messages = await generator.get_messages(category, chapter_title, sub_chapter_title, SAMPLE_REPORT_SOURCE)
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"錯誤詳情: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"處理請求時發生錯誤: {str(e)}")
+
+    async def event_stream():
+        cleaner = StreamTextCleaner()
+        stream = generator.generate_text_stream(messages, prompt)
+        try:
+            async for delta in stream:
+                # 客戶端中斷連線時停止生成
+                if await request.is_disconnected():
+                    print("客戶端已中斷連線，停止生成")
+                    return
+                text = cleaner.feed(delta)
+                if text:
+                    yield f"data: {json.dumps({'text': text}, ensure_ascii=False)}\n\n"
+            text = cleaner.flush()
+            if text:
+                yield f"data: {json.dumps({'text': text}, ensure_ascii=False)}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            print(f"錯誤詳情: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'detail': f'生成文字失敗: {str(e)}'}, ensure_ascii=False)}\n\n"
+        finally:
+            # 關閉上游的 LLM 串流請求
+            await stream.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# 整份報告書生成時同時進行的章節數
+REPORT_GENERATION_CONCURRENCY = int(os.getenv("report_generation_concurrency", len(api_keys) * 2))
+# 整份報告書生成工作的最大執行次數 (重試會重新生成所有章節)
+REPORT_GENERATION_MAX_ATTEMPTS = int(os.getenv("report_generation_max_attempts", 2))
+
+
+async def load_report_generation_tasks(report_id_binary: bytes, organization_id_binary: bytes, user_id_binary: bytes) -> tuple:
+    """
+    一次讀取報告書、公司基本資料與其所有區塊，組成每個子章節的生成工作
+
+    Returns:
+        tuple: (產業類別, 生成工作列表)，使用者對章節沒有 read_write 權限時 permitted 為 False
+    """
+    async with db_pool.acquire_read() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                SELECT Content
+                FROM OrganizationAssets
+                WHERE AssetID = %s AND OrganizationID = %s
+                AND AssetType = 'report' AND IsDeleted = FALSE
+            """, (report_id_binary, organization_id_binary))
+            report = await cur.fetchone()
+            if not report:
+                raise HTTPException(status_code=404, detail="找不到該報告書或報告書已被刪除")
+            report_content = json.loads(report[0])
+
+            company_info_id_binary = uuid.UUID(report_content['company_info_assetID']).bytes
+            await cur.execute("""
+                SELECT Content, Category
+                FROM OrganizationAssets
+                WHERE AssetID = %s AND AssetType = 'company_info' AND IsDeleted = FALSE
+            """, (company_info_id_binary,))
+            company_info = await cur.fetchone()
+            if not company_info:
+                raise HTTPException(status_code=404, detail="找不到報告書對應的公司基本資料")
+            company_info_content = json.loads(company_info[0])
+            category = company_info[1]
+
+            # 一次取得公司基本資料的所有區塊
+            await cur.execute("""
+                SELECT BlockID, content
+                FROM ReportContentBlocks
+                WHERE AssetID = %s
+            """, (company_info_id_binary,))
+            company_blocks = {row[0]: json.loads(row[1]) if row[1] else {} for row in await cur.fetchall()}
+
+            # 取得使用者在組織中的角色與報告書的權限索引，生成前一次判斷所有章節的寫入權限
+            await cur.execute("""
+                SELECT RoleID
+                FROM UserRoles
+                WHERE UserID = %s AND OrganizationID = %s
+            """, (user_id_binary, organization_id_binary))
+            role_ids_binary = {row[0] for row in await cur.fetchall()}
+            permission_index = await permission_cache.get_index(report_id_binary)
+
+    # 依 (章節標題, 子章節標題) 組出公司基本資料的輸入文字
+    prompts = {}
+    for chapter in company_info_content.get("chapters", []):
+        for sub_chapter in chapter.get("subChapters", []):
+            output_text = ""
+            for sub_sub_chapter in sub_chapter.get("subSubChapters", []):
+                block_content = company_blocks.get(bytes.fromhex(sub_sub_chapter["BlockID"].replace('-', '')), {})
+                text_content = block_content.get("content", {}).get("text", "")
+                output_text += f"{sub_sub_chapter['subSubChapterTitle']}:{text_content}\n\n"
+            prompts.setdefault((chapter["chapterTitle"], sub_chapter["subChapterTitle"]), output_text.strip())
+
+    tasks = []
+    for chapter in report_content.get("chapters", []):
+        for sub_chapter in chapter.get("subChapters", []):
+            key = (chapter["chapterTitle"], sub_chapter["subChapterTitle"])
+            if key in prompts:
+                permission_id = sub_chapter.get("access_permissions")
+                tasks.append({
+                    "chapterTitle": key[0],
+                    "subChapterTitle": key[1],
+                    "blockID": sub_chapter["BlockID"],
+                    "prompt": prompts[key],
+                    "permitted": bool(permission_id) and has_permission(
+                        permission_index, uuid.UUID(permission_id).bytes, role_ids_binary, actions=("read_write",)
                     )
-                    block_result = await cur.fetchone()
-                    if block_result:
-                        block_content = json.loads(block_result[0])
-                        text_content = block_content.get("content", {}).get("text", "")
-                        output_text += f"{sub_sub_chapter['subSubChapterTitle']}:{text_content}\n\n"
-                output_text = output_text.strip()
+                })
+    return category, tasks
 
-                
-                # 建立物件
-                generator = GeminiGenerator(api_keys, model_name, config, base_url, max_retry)
-                # 獲取訓練數據
-                url = "https://4090p8001.huanna.live/API/Sample_Report.json"
-                messages = generator.get_messages(category, chapter_title, sub_chapter_title, url)
 
-                prompt = output_text
-                # print(messages)
-                response = await generator.generate_text(messages, prompt)
+async def save_generated_text(block_id: str, text: str, user_id_binary: bytes) -> bool:
+    """
+    將生成的文字寫回報告書區塊，區塊被其他用戶鎖定時不覆寫
+
+    Returns:
+        bool: 是否已寫入
+    """
+    block_id_binary = uuid.UUID(block_id).bytes
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            try:
+                await conn.begin()
+                await cur.execute("""
+                    SELECT content, IsLocked, LockedBy
+                    FROM ReportContentBlocks
+                    WHERE BlockID = %s
+                    FOR UPDATE
+                """, (block_id_binary,))
+                block = await cur.fetchone()
+                if not block or (block[1] and block[2] != user_id_binary):
+                    await conn.rollback()
+                    return False
+
+                block_content = json.loads(block[0]) if block[0] else {}
+                block_content.setdefault("content", {})["text"] = text
+                await cur.execute("""
+                    UPDATE ReportContentBlocks
+                    SET content = %s,
+                        LastModified = CURRENT_TIMESTAMP(6),
+                        ModifiedBy = %s,
+                        version = version + 1
+                    WHERE BlockID = %s
+                """, (json.dumps(block_content), user_id_binary, block_id_binary))
+                await conn.commit()
+                return True
+            except Exception:
+                await conn.rollback()
+                raise
 
-                return {"status": "success", "text": response.content.replace("*   ", "").replace("*", "")}
+
+# 背景工作：生成整份報告書 (由 /api/report/generate_all_chapters 建立，進度以 report_job_progress 回報)
+@job_handler("generate_all_chapters")
+async def generate_all_chapters_job(payload: dict) -> dict:
+    """整份報告書生成工作：讀取資料一次後，以有限的並行數生成所有子章節並寫回報告書"""
+    report_id_binary = uuid.UUID(payload["asset_id"]).bytes
+    organization_id_binary = uuid.UUID(payload["organization_id"]).bytes
+    user_id_binary = uuid.UUID(payload["user_id"]).bytes
+
+    try:
+        category, tasks = await load_report_generation_tasks(report_id_binary, organization_id_binary, user_id_binary)
+    except HTTPException as e:
+        raise Exception(e.detail)
+
+    progress = {
+        "assetID": payload["asset_id"],
+        "total": len(tasks),
+        "completed": 0,
+        "failed": 0,
+        "skipped": 0,
+        "running": [],
+        "results": []
+    }
+    # 依序寫入進度，避免較舊的進度覆寫較新的進度
+    progress_lock = asyncio.Lock()
+
+    async def save_progress():
+        async with progress_lock:
+            await report_job_progress(progress)
+
+    # 沒有寫入權限的章節不生成，直接標記為略過
+    for task in tasks:
+        if not task["permitted"]:
+            progress["results"].append({
+                "chapterTitle": task["chapterTitle"],
+                "subChapterTitle": task["subChapterTitle"],
+                "blockID": task["blockID"],
+                "status": "skipped",
+                "error": "權限不足"
+            })
+            progress["skipped"] += 1
+    tasks = [task for task in tasks if task["permitted"]]
+    await save_progress()
+
+    semaphore = asyncio.Semaphore(REPORT_GENERATION_CONCURRENCY)
+
+    async def generate_one(index, task):
+        async with semaphore:
+            progress["running"].append(task["subChapterTitle"])
+            try:
+                # 依序分配起始的 API 密鑰，讓各章節分散到不同密鑰
+                text = await call_generate_text_model(
+                    category, task["chapterTitle"], task["subChapterTitle"], task["prompt"], api_key_index=index
+                )
+                saved = await save_generated_text(task["blockID"], text, user_id_binary)
+                progress["results"].append({
+                    "chapterTitle": task["chapterTitle"],
+                    "subChapterTitle": task["subChapterTitle"],
+                    "blockID": task["blockID"],
+                    "status": "completed" if saved else "skipped"
+                })
+                if saved:
+                    progress["completed"] += 1
+                else:
+                    progress["skipped"] += 1
+            except Exception as e:
+                print(f"生成章節 {task['subChapterTitle']} 失敗: {str(e)}")
+                progress["results"].append({
+                    "chapterTitle": task["chapterTitle"],
+                    "subChapterTitle": task["subChapterTitle"],
+                    "blockID": task["blockID"],
+                    "status": "failed",
+                    "error": str(e)
+                })
+                progress["failed"] += 1
+            finally:
+                progress["running"].remove(task["subChapterTitle"])
+            try:
+                await save_progress()
+            except Exception as e:
+                print(f"回報整份報告書生成進度失敗: {str(e)}")
+
+    await asyncio.gather(*(generate_one(index, task) for index, task in enumerate(tasks)))
+    progress["status"] = "completed" if progress["failed"] == 0 else "completed_with_errors"
+    return progress
+
+
+# 生成整份報告書 (建立背景工作並立即返回工作ID)
+@app.post("/api/report/generate_all_chapters")
+async def generate_all_chapters(data: dict):
+    try:
+        # 獲取必要參數
+        asset_id = data.get("asset_id")
+        organization_id = data.get("organization_id")
+        user_id = data.get("user_id")
+
+        if not all([asset_id, organization_id, user_id]):
+            raise HTTPException(status_code=400, detail="缺少必要參數")
+
+        try:
+            report_id_binary = uuid.UUID(asset_id).bytes
+            organization_id_binary = uuid.UUID(organization_id).bytes
+            user_id_binary = uuid.UUID(user_id).bytes
+        except ValueError:
+            raise HTTPException(status_code=400, detail="無效的ID格式")
+
+        # 確認使用者屬於報告書所屬的組織
+        async with db_pool.acquire_read() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    SELECT
+                        EXISTS (
+                            SELECT 1 FROM OrganizationAssets
+                            WHERE AssetID = %s AND OrganizationID = %s
+                            AND AssetType = 'report' AND IsDeleted = FALSE
+                        ),
+                        EXISTS (
+                            SELECT 1 FROM OrganizationMembers
+                            WHERE OrganizationID = %s AND UserID = %s
+                        )
+                """, (report_id_binary, organization_id_binary, organization_id_binary, user_id_binary))
+                report_exists, is_member = await cur.fetchone()
+
+        if not report_exists:
+            raise HTTPException(status_code=404, detail="找不到該報告書或報告書已被刪除")
+        if not is_member:
+            raise HTTPException(status_code=403, detail="您不是該組織的成員")
+
+        job_id = await enqueue_job(db_pool, "generate_all_chapters", {
+            "asset_id": asset_id,
+            "organization_id": organization_id,
+            "user_id": user_id
+        }, max_attempts=REPORT_GENERATION_MAX_ATTEMPTS)
+
+        return {"status": "success", "data": {"job_id": job_id}}
 
     except HTTPException as e:
         raise e
@@ -4683,6 +5227,43 @@ async def generate_text(data: dict):
         raise HTTPException(status_code=500, detail=f"處理請求時發生錯誤: {str(e)}")
 
 
+# 取得整份報告書生成進度 (與 /api/jobs/status 相同的背景工作，以原本的格式返回)
+@app.post("/api/report/generate_all_chapters_status")
+async def generate_all_chapters_status(data: dict):
+    job_id = data.get("job_id")
+    if not job_id:
+        raise HTTPException(status_code=400, detail="缺少必要參數")
+
+    try:
+        job = await get_job(db_pool, job_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="無效的工作ID格式")
+    if not job or job["jobType"] != "generate_all_chapters":
+        raise HTTPException(status_code=404, detail="找不到指定的生成工作")
+
+    progress = job["result"] or job["progress"] or {}
+    total = progress.get("total", 0)
+    done = progress.get("completed", 0) + progress.get("failed", 0) + progress.get("skipped", 0)
+    return {
+        "status": "success",
+        "data": {
+            "jobID": job["jobID"],
+            "assetID": progress.get("assetID"),
+            "status": progress.get("status", "completed") if job["status"] == "completed" else job["status"],
+            "total": total,
+            "completed": progress.get("completed", 0),
+            "failed": progress.get("failed", 0),
+            "skipped": progress.get("skipped", 0),
+            "progress": round(done / total * 100, 1) if total else 0,
+            "running": progress.get("running", []) if job["status"] == "running" else [],
+            "results": progress.get("results", []),
+            "error": job["error"] if job["status"] == "failed" else None,
+            "createdAt": job["createdAt"],
+            "finishedAt": job["finishedAt"]
+        }
+    }
+
+
 # 更新檢驗結果
 @app.post("/api/report/update_verification_result")
 async def update_verification_result(data: dict):
@@ -4699,8 +5280,7 @@ async def update_verification_result(data: dict):
             raise HTTPException(status_code=400, detail="缺少必要參數")
 
         # 獲取資料庫連接
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 try:
                     # 開始事務
@@ -4775,6 +5355,36 @@ async def update_verification_result(data: dict):
         raise HTTPException(status_code=500, detail=f"處理請求時發生錯誤: {str(e)}")
 
 
+# 根據文字生成 Mermaid 語法與圖片
+async def generate_mermaid_image_data(text: str) -> dict:
+    """
+    透過 LLM 將文字轉換成 Mermaid 語法並渲染成圖片
+
+    Returns:
+        dict: 包含 image_url, mermaid_code, cached
+    """
+    gemini = GeminiGenerator(api_keys, model_name, config, base_url, max_retry)
+    reference_data = await gemini.llm_to_mermaid(text)
+    if reference_data is None:
+        raise Exception("LLM 未返回結果")
+    choice = reference_data.choices[0]
+    message = choice.message
+    content = message.content
+    
+    # 清理 Mermaid 語法
+    content = content.replace("```mermaid", "").replace("```", "")
+    content = content.replace("(", "").replace(")", "")
+    
+    # 生成圖片 (相同的圖表直接使用快取中的圖片)
+    image_filename, cache_hit = await image_cache.get_or_render(content, format="png")
+
+    return {
+        "image_url": f"{IMAGE_BASE_URL}/{image_filename}",
+        "mermaid_code": content,
+        "cached": cache_hit
+    }
+
+
 # 根據文字生成圖片(Mermaid)
 @app.post("/api/report/generate_mermaid_image")
 async def generate_mermaid_image(data: dict):
@@ -4788,44 +5398,21 @@ async def generate_mermaid_image(data: dict):
         if not text:
             raise HTTPException(status_code=400, detail="文本內容不能為空")
 
+        # async_job 為 true 時建立背景工作並立即返回工作ID，結果以 /api/jobs/status 查詢
+        if data.get("async_job"):
+            job_id = await enqueue_job(db_pool, "generate_mermaid_image", {"text": text})
+            return {"status": "success", "data": {"job_id": job_id}}
+
         # 生成圖片
         try:
-            gemini = GeminiGenerator(api_keys, model_name, config, base_url, max_retry)
-            reference_data = await gemini.llm_to_mermaid(text)
-            choice = reference_data.choices[0]
-            message = choice.message
-            content = message.content
-            
-            # 清理 Mermaid 語法
-            content = content.replace("```mermaid", "").replace("```", "")
-            content = content.replace("(", "").replace(")", "")
-            
-            # 生成圖片唯一碼
-            unique_id = str(uuid.uuid4())
-            output_filename = f"./images/{unique_id}.png"
-            
-            # 確保輸出目錄存在
-            os.makedirs("./images", exist_ok=True)
-            
-            # 生成圖片
-            try:
-                mermaid_to_image(content, output_filename, format="png")
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"生成圖片失敗: {str(e)}")
-
-            # 構建圖片URL
-            # image_url = f"http://localhost:8000/images/{unique_id}.png"
-            image_url = f"https://4090p8001.huanna.live/images/9d5ced66-2019-4ad2-8d39-5f659ac13223.png"
-            
+            image_data = await generate_mermaid_image_data(text)
             return {
                 "status": "success",
                 "message": "圖片已生成",
-                "data": {
-                    "image_url": image_url,
-                    "mermaid_code": content
-                }
+                "data": image_data
             }
-            
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="圖片生成忙碌中，請稍後再試")
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"生成 Mermaid 圖表失敗: {str(e)}")
             
@@ -4847,8 +5434,7 @@ async def get_report_info(data: dict):
         organization_id_binary = bytes.fromhex(organization_id.replace('-', ''))
 
         # 獲取資料庫連接
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cur:
                 # 獲取報告書資訊
                 query = """
@@ -4898,8 +5484,7 @@ async def get_report_chapters(data: dict):
         return {"status": "error", "message": "缺少資產ID"}
     
     try:
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 # 將字符串格式的UUID轉換為二進制
                 asset_id_binary = uuid.UUID(asset_id).bytes
@@ -4952,8 +5537,7 @@ async def get_approver_groups(data: dict):
         # 將傳入的 organization_id 轉換為 UUID 格式的 bytes
         org_id_bytes = uuid.UUID(organization_id).bytes
 
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 # 查詢該組織下的所有角色
                 query = """
@@ -5005,8 +5589,7 @@ async def save_workflow_stage(data: dict):
         # 將字符串格式的UUID轉換為二進制
         asset_id_binary = uuid.UUID(asset_id).bytes
 
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 # 使用 AssetID 和 ChapterName 查詢 workflowinstances 表，看是否已經存在實例並且 Status 為 審核中。
                 await cur.execute("SELECT Status FROM WorkflowInstances WHERE AssetID = %s AND ChapterName = %s", (asset_id_binary, chapter_name))
@@ -5046,7 +5629,9 @@ async def save_workflow_stage(data: dict):
 
                 # 如果 stage_settings 為空，則僅刪除相關設定並返回
                 if not stage_settings:
+                    await refresh_review_inbox(cur, asset_id=asset_id_binary)
                     await conn.commit()
+                    permission_cache.invalidate(asset_id_binary)
                     return {"status": "success", "message": "已成功刪除該章節的所有審核設定"}
 
                 # 插入新的工作流程階段
@@ -5075,7 +5660,9 @@ async def save_workflow_stage(data: dict):
                         """, (role_id, permission_chapter_id, asset_id_binary, 
                               "stage", "read_write"))
 
+                await refresh_review_inbox(cur, asset_id=asset_id_binary)
                 await conn.commit()
+                permission_cache.invalidate(asset_id_binary)
                 
         return {"status": "success", "message": "工作流程階段保存成功"}
 
@@ -5100,8 +5687,7 @@ async def get_workflow_stage(data: dict):
         # 將字符串格式的UUID轉換為二進制
         asset_id_binary = uuid.UUID(asset_id).bytes
 
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 # 查詢工作流程階段
                 await cur.execute("""
@@ -5168,8 +5754,7 @@ async def create_workflow_instance(data: dict):
         raise HTTPException(status_code=400, detail="缺少必要參數")
 
     # 連接資料庫
-    pool = await get_db_pool()
-    async with pool.acquire() as conn:
+    async with db_pool.acquire() as conn:
         async with conn.cursor() as cur:
             try:
                 asset_binary = bytes.fromhex(asset_id.replace('-', ''))
@@ -5291,8 +5876,7 @@ async def create_workflow_submit_data(data: dict):
     # 已改成前端處理
 
     # 連接資料庫
-    pool = await get_db_pool()
-    async with pool.acquire() as conn:
+    async with db_pool.acquire() as conn:
         async with conn.cursor() as cur:
             try:
                 # 生成新的 UUID 作為 BlockVersionID
@@ -5357,8 +5941,7 @@ async def create_workflow_submit_record(data: dict):
         raise HTTPException(status_code=400, detail="缺少必要參數")
 
     # 連接資料庫
-    pool = await get_db_pool()
-    async with pool.acquire() as conn:
+    async with db_pool.acquire() as conn:
         async with conn.cursor() as cur:
             try:
                 # 轉換 UUID 為 binary
@@ -5400,6 +5983,7 @@ async def create_workflow_submit_record(data: dict):
                 if workflow_instance_id_result:
                     # 如果存在，則更新 workflowstageinstances 的 WorkflowStageID 為 第一階段
                     await cur.execute("UPDATE WorkflowStageInstances SET WorkflowStageID = %s WHERE WorkflowInstanceID = %s", (workflow_stage_binary, workflow_instance_binary))
+                    await refresh_review_inbox(cur, workflow_instance_id=workflow_instance_binary)
                     await conn.commit()
                     return {
                         "status": "success",
@@ -5437,6 +6021,7 @@ async def create_workflow_submit_record(data: dict):
                     user_binary,
                     block_version_binary
                 ))
+                await refresh_review_inbox(cur, workflow_instance_id=workflow_instance_binary)
 
                 await conn.commit()
 
@@ -5461,12 +6046,81 @@ async def create_workflow_submit_record(data: dict):
                 raise HTTPException(status_code=500, detail=f"建立送審記錄失敗: {str(e)}")
 
 
+# 審核收件匣設定 (啟用後待審核列表改由 ReviewInbox 資料表讀取)
+REVIEW_INBOX_ENABLED = os.getenv("review_inbox_enabled", "false").lower() in ("1", "true")
+REVIEW_PAGE_MAX_LIMIT = 200
+
+
+# 更新審核收件匣的輔助函數
+async def refresh_review_inbox(
+    cur,
+    workflow_instance_id: bytes = None,
+    asset_id: bytes = None,
+    organization_id: bytes = None
+) -> None:
+    """
+    重新計算指定範圍內的審核收件匣 (ReviewInbox)，須在寫入審核流程或角色的同一個交易中呼叫
+
+    每位可審核目前階段的使用者，對每個審核中的流程實例有一筆資料。
+    未啟用 review_inbox_enabled 時不做任何事。
+
+    Args:
+        cur: 數據庫游標
+        workflow_instance_id: 只重新計算此審核流程實例 (送審、審核時)
+        asset_id: 重新計算此資產的所有流程實例 (修改審核流程設定時)
+        organization_id: 重新計算此組織的所有流程實例 (修改成員角色時)
+    """
+    if not REVIEW_INBOX_ENABLED:
+        return
+
+    if workflow_instance_id is not None:
+        column, value = "WorkflowInstanceID", workflow_instance_id
+    elif asset_id is not None:
+        column, value = "AssetID", asset_id
+    elif organization_id is not None:
+        column, value = "OrganizationID", organization_id
+    else:
+        raise ValueError("必須指定審核收件匣的更新範圍")
+
+    await cur.execute(f"DELETE FROM ReviewInbox WHERE {column} = %s", (value,))
+    await cur.execute(f"""
+        INSERT INTO ReviewInbox (
+            UserID, WorkflowInstanceID, OrganizationID, AssetID,
+            WorkflowStageID, SubmitterID, BlockVersionID, SubmittedAt
+        )
+        SELECT DISTINCT
+            ur.UserID, wi.WorkflowInstanceID, wi.OrganizationID, wi.AssetID,
+            wsi.WorkflowStageID, wsi.SubmitterID, wsi.BlockVersionID, wsi.SubmittedAt
+        FROM WorkflowStageInstances wsi
+        JOIN WorkflowInstances wi ON wsi.WorkflowInstanceID = wi.WorkflowInstanceID
+        JOIN WorkflowStages ws ON wsi.WorkflowStageID = ws.WorkflowStageID
+        JOIN RolePermissionMappings rpm ON rpm.PermissionChapterID = ws.PermissionChapterID
+            AND rpm.ResourceType = 'stage'
+        JOIN UserRoles ur ON ur.RoleID = rpm.RoleID
+        WHERE wi.{column} = %s
+    """, (value,))
+
+
 # 獲取待審核列表
 @app.post("/api/report/get_pending_reviews")
 async def get_pending_reviews(data: dict):
+    """
+    獲取使用者可審核的送審項目，依送審時間由新到舊排序
+
+    Args:
+        data: 包含以下字段的字典：
+            - userID: 用戶ID(UUID)
+            - limit: (可選) 每頁筆數，未提供時返回所有待審核項目
+            - cursor: (可選) 上一頁返回的 nextCursor
+
+    Returns:
+        dict: data 為待審核列表，nextCursor 為下一頁的游標 (沒有下一頁時為 None)
+    """
     try:
         # 獲取必要參數
         user_id = data.get("userID")
+        limit = data.get("limit")
+        cursor = data.get("cursor")
         if not user_id:
             raise HTTPException(status_code=400, detail="缺少必要參數")
 
@@ -5476,107 +6130,110 @@ async def get_pending_reviews(data: dict):
         except ValueError:
             raise HTTPException(status_code=400, detail="無效的用戶ID格式")
 
+        if limit is not None and (not isinstance(limit, int) or not 1 <= limit <= REVIEW_PAGE_MAX_LIMIT):
+            raise HTTPException(status_code=400, detail=f"limit 必須介於 1 到 {REVIEW_PAGE_MAX_LIMIT}")
+
+        if REVIEW_INBOX_ENABLED:
+            # 由審核收件匣讀取 (依使用者索引直接取出一頁)
+            prefix = "ri"
+            query = """
+                SELECT 
+                    ri.WorkflowInstanceID,
+                    ri.AssetID,
+                    wi.ChapterName,
+                    ri.WorkflowStageID,
+                    ri.SubmitterID,
+                    ri.BlockVersionID,
+                    ri.SubmittedAt,
+                    oa.AssetName,
+                    u.UserName as SubmitterName
+                FROM ReviewInbox ri
+                JOIN WorkflowInstances wi ON ri.WorkflowInstanceID = wi.WorkflowInstanceID
+                JOIN OrganizationAssets oa ON ri.AssetID = oa.AssetID
+                JOIN Users u ON ri.SubmitterID = u.UserID
+                WHERE ri.UserID = %s
+            """
+        else:
+            # 單一查詢：目前階段的章節權限屬於使用者任一角色的送審項目
+            prefix = "wsi"
+            query = """
+                SELECT 
+                    wi.WorkflowInstanceID,
+                    wi.AssetID,
+                    wi.ChapterName,
+                    wsi.WorkflowStageID,
+                    wsi.SubmitterID,
+                    wsi.BlockVersionID,
+                    wsi.SubmittedAt,
+                    oa.AssetName,
+                    u.UserName as SubmitterName
+                FROM WorkflowStageInstances wsi
+                JOIN WorkflowStages ws ON wsi.WorkflowStageID = ws.WorkflowStageID
+                JOIN WorkflowInstances wi ON wsi.WorkflowInstanceID = wi.WorkflowInstanceID
+                JOIN OrganizationAssets oa ON wi.AssetID = oa.AssetID
+                JOIN Users u ON wsi.SubmitterID = u.UserID
+                WHERE EXISTS (
+                    SELECT 1
+                    FROM UserRoles ur
+                    JOIN RolePermissionMappings rpm ON rpm.RoleID = ur.RoleID
+                    WHERE ur.UserID = %s
+                    AND rpm.ResourceType = 'stage'
+                    AND rpm.PermissionChapterID = ws.PermissionChapterID
+                )
+            """
+        params = [user_id_binary]
+
+        # 游標條件 (SubmittedAt, WorkflowInstanceID) < 上一頁最後一筆
+        if cursor:
+            try:
+                cursor_submitted_at, cursor_instance_id = decode_keyset_cursor(cursor)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="無效的分頁游標")
+            query += f"""
+                AND ({prefix}.SubmittedAt < %s
+                     OR ({prefix}.SubmittedAt = %s AND {prefix}.WorkflowInstanceID < %s))
+            """
+            params += [cursor_submitted_at, cursor_submitted_at, cursor_instance_id]
+
+        query += f" ORDER BY {prefix}.SubmittedAt DESC, {prefix}.WorkflowInstanceID DESC"
+        if limit is not None:
+            # 多取一筆以判斷是否有下一頁
+            query += " LIMIT %s"
+            params.append(limit + 1)
+
         # 連接資料庫
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire_read() as conn:
             async with conn.cursor() as cur:
                 try:
-                    # 開始事務
-                    await conn.begin()
-
-                    # 1. 獲取用戶的所有角色
-                    await cur.execute("""
-                        SELECT DISTINCT ur.RoleID
-                        FROM UserRoles ur
-                        WHERE ur.UserID = %s
-                    """, (user_id_binary,))
-                    role_ids = await cur.fetchall()
-                    # print("role_ids", role_ids)
-                    
-                    if not role_ids:
-                        return {"status": "success", "data": []}
-
-                    # 2. 獲取這些角色對應的審核權限
-                    role_ids_list = [role[0] for role in role_ids]
-                    placeholders = ', '.join(['%s'] * len(role_ids_list))
-                    
-                    await cur.execute(f"""
-                        SELECT DISTINCT rpm.PermissionChapterID
-                        FROM RolePermissionMappings rpm
-                        WHERE rpm.RoleID IN ({placeholders})
-                        AND rpm.ResourceType = 'stage'
-                    """, tuple(role_ids_list))
-                    
-                    permission_chapters = await cur.fetchall()
-                    # print("permission_chapters", permission_chapters)
-                    
-                    if not permission_chapters:
-                        return {"status": "success", "data": []}
-
-                    # 3. 獲取對應的工作流程階段
-                    permission_chapters_list = [pc[0] for pc in permission_chapters]
-                    placeholders = ', '.join(['%s'] * len(permission_chapters_list))
-                    
-                    await cur.execute(f"""
-                        SELECT DISTINCT ws.WorkflowStageID
-                        FROM WorkflowStages ws
-                        WHERE ws.PermissionChapterID IN ({placeholders})
-                    """, tuple(permission_chapters_list))
-                    
-                    workflow_stages = await cur.fetchall()
-                    
-                    if not workflow_stages:
-                        return {"status": "success", "data": []}
-
-                    # 4. 獲取待審核的實例
-                    workflow_stages_list = [ws[0] for ws in workflow_stages]
-                    placeholders = ', '.join(['%s'] * len(workflow_stages_list))
-                    
-                    await cur.execute(f"""
-                        SELECT 
-                            wi.WorkflowInstanceID,
-                            wi.AssetID,
-                            wi.ChapterName,
-                            wsi.WorkflowStageID,
-                            wsi.SubmitterID,
-                            wsi.BlockVersionID,
-                            wsi.SubmittedAt,
-                            oa.AssetName,
-                            u.UserName as SubmitterName
-                        FROM WorkflowStageInstances wsi
-                        JOIN WorkflowInstances wi ON wsi.WorkflowInstanceID = wi.WorkflowInstanceID
-                        JOIN OrganizationAssets oa ON wi.AssetID = oa.AssetID
-                        JOIN Users u ON wsi.SubmitterID = u.UserID
-                        WHERE wsi.WorkflowStageID IN ({placeholders})
-                        ORDER BY wsi.SubmittedAt DESC
-                    """, tuple(workflow_stages_list))
-                    
+                    await cur.execute(query, params)
                     reviews = await cur.fetchall()
-                    
-                    # 格式化返回數據
-                    review_list = []
-                    for review in reviews:
-                        review_list.append({
-                            "title": f"{review[7]} - {review[2]}", # AssetName - ChapterName
-                            "workflow_instance_id": uuid.UUID(bytes=review[0]).hex,
-                            "workflow_stage_id": uuid.UUID(bytes=review[3]).hex,
-                            "block_version_id": uuid.UUID(bytes=review[5]).hex,
-                            "submitter": review[8],  # SubmitterName
-                            "submitted_at": review[6].isoformat() if review[6] else None
-                        })
-
-                    await conn.commit()
-                    # print("review_list", review_list)
-                    return {
-                        "status": "success",
-                        "data": review_list
-                    }
-
                 except Exception as e:
-                    await conn.rollback()
                     print(f"數據庫操作失敗: {str(e)}")
                     raise HTTPException(status_code=500, detail=f"獲取待審核列表失敗: {str(e)}")
 
+        next_cursor = None
+        if limit is not None and len(reviews) > limit:
+            reviews = reviews[:limit]
+            next_cursor = encode_keyset_cursor(reviews[-1][6], reviews[-1][0])
+
+        # 格式化返回數據
+        review_list = []
+        for review in reviews:
+            review_list.append({
+                "title": f"{review[7]} - {review[2]}", # AssetName - ChapterName
+                "workflow_instance_id": uuid.UUID(bytes=review[0]).hex,
+                "workflow_stage_id": uuid.UUID(bytes=review[3]).hex,
+                "block_version_id": uuid.UUID(bytes=review[5]).hex,
+                "submitter": review[8],  # SubmitterName
+                "submitted_at": review[6].isoformat() if review[6] else None
+            })
+
+        return {
+            "status": "success",
+            "data": review_list,
+            "nextCursor": next_cursor
+        }
+
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -5584,6 +6241,32 @@ async def get_pending_reviews(data: dict):
         raise HTTPException(status_code=500, detail=f"處理請求時發生錯誤: {str(e)}")
 
 
+# 重建組織的審核收件匣 (啟用 review_inbox_enabled 時用於初始化既有的審核流程)
+@app.post("/api/report/rebuild_review_inbox")
+async def rebuild_review_inbox(data: dict):
+    organization_id = data.get("organization_id")
+    if not organization_id:
+        raise HTTPException(status_code=400, detail="缺少必要參數")
+    if not REVIEW_INBOX_ENABLED:
+        raise HTTPException(status_code=400, detail="未啟用審核收件匣")
+
+    try:
+        organization_id_binary = uuid.UUID(organization_id).bytes
+    except ValueError:
+        raise HTTPException(status_code=400, detail="無效的組織ID格式")
+
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            try:
+                await refresh_review_inbox(cur, organization_id=organization_id_binary)
+                await conn.commit()
+            except Exception as e:
+                await conn.rollback()
+                raise HTTPException(status_code=500, detail=f"重建審核收件匣失敗: {str(e)}")
+
+    return {"status": "success", "message": "審核收件匣已重建"}
+
+
 # 取得送審資料
 @app.post("/api/report/get_submitted_data")
 async def get_submitted_data(data: dict):
@@ -5593,8 +6276,7 @@ async def get_submitted_data(data: dict):
             return {"status": "error", "message": "缺少必要參數 workflowInstanceID"}
 
         # 連接資料庫
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 # 查詢最新的 WorkflowStageInstance
                 query = """
@@ -5649,8 +6331,7 @@ async def submit_review(data: dict):
             raise HTTPException(status_code=400, detail="無效的審核動作")
 
         # 連接資料庫
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
 
                 workflow_instance_id_binary = bytes.fromhex(workflow_instance_id.replace('-', ''))
@@ -5707,6 +6388,7 @@ async def submit_review(data: dict):
                         SET WorkflowStageID = NULL, LastUpdatedAt = CURRENT_TIMESTAMP
                         WHERE WorkflowInstanceID = %s
                     """, (workflow_instance_id_binary,))
+                    await refresh_review_inbox(cur, workflow_instance_id=workflow_instance_id_binary)
                     await conn.commit()
                     return {"message": "已退回修改", "status": "rejected"}
 
@@ -5723,6 +6405,7 @@ async def submit_review(data: dict):
                 # 如果沒有下一個階段，完成審核流程
                 if not next_stage and review_action == 'approved':
                     await complete_review(conn, workflow_instance_id_binary)
+                    await refresh_review_inbox(cur, workflow_instance_id=workflow_instance_id_binary)
                     await conn.commit()
                     return {"message": "審核流程已完成", "status": "completed"}
 
@@ -5734,6 +6417,7 @@ async def submit_review(data: dict):
                             LastUpdatedAt = CURRENT_TIMESTAMP
                         WHERE WorkflowInstanceID = %s
                     """, (next_stage[0], workflow_instance_id_binary))
+                    await refresh_review_inbox(cur, workflow_instance_id=workflow_instance_id_binary)
 
                 await conn.commit()
 
@@ -5784,8 +6468,7 @@ async def get_review_progress(data: dict):
         workflow_instance_id_bin = bytes.fromhex(workflow_instance_id.replace('-', ''))
 
         # 連接資料庫
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cur:
                 # 1. 查詢當前工作流實例的基本信息
                 await cur.execute("""
@@ -5856,8 +6539,7 @@ async def get_review_logs(data: dict):
         workflow_instance_id_bin = bytes.fromhex(workflow_instance_id.replace('-', ''))
 
         # 連接資料庫
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cur:
                 # 構建查詢 SQL
                 query = """
@@ -5920,8 +6602,7 @@ async def get_review_content(data: dict):
 
     # 連接資料庫
     try:
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 await cur.execute("SELECT SubmittedContent FROM ContentBlockVersions WHERE BlockVersionID = %s", (block_version_id_bin,))
                 content = await cur.fetchone()
@@ -5944,8 +6625,7 @@ async def get_workflow_instance_id(data: dict):
         # 將 UUID 字符串轉換為二進制格式
         asset_id_bin = bytes.fromhex(asset_id.replace('-', ''))
 
-        pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with db_pool.acquire() as conn:
             async with conn.cursor() as cur:
                 # 查詢最新的工作流實例
                 query = """
@@ -6006,6 +6686,82 @@ async def get_hint(data: dict):
     return {"status": "success", "data": {"hint": hint}}
 
 
+# 背景工作：生成報告書文字
+@job_handler("generate_text")
+async def generate_text_job(payload: dict) -> dict:
+    chapter_title = payload["chapter_title"]
+    sub_chapter_title = payload["sub_chapter_title"]
+    category, prompt = await load_generate_text_prompt(payload["company_info_assetID"], chapter_title, sub_chapter_title)
+    return {"text": await call_generate_text_model(category, chapter_title, sub_chapter_title, prompt)}
+
+
+# 背景工作：根據文字生成圖片(Mermaid)
+@job_handler("generate_mermaid_image")
+async def generate_mermaid_image_job(payload: dict) -> dict:
+    return await generate_mermaid_image_data(payload["text"])
+
+
+# 建立背景工作
+@app.post("/api/jobs/submit")
+async def submit_job(data: dict):
+    job_type = data.get("job_type")
+    payload = data.get("payload")
+    max_attempts = data.get("max_attempts", 3)
+
+    if not all([job_type, isinstance(payload, dict)]):
+        raise HTTPException(status_code=400, detail="缺少必要參數")
+    if job_type not in JOB_TYPES:
+        raise HTTPException(status_code=400, detail=f"不支援的工作類型: {job_type}")
+    if not isinstance(max_attempts, int) or isinstance(max_attempts, bool) or not 1 <= max_attempts <= JOB_MAX_ATTEMPTS_LIMIT:
+        raise HTTPException(status_code=400, detail=f"max_attempts 必須是 1 到 {JOB_MAX_ATTEMPTS_LIMIT} 的整數")
+
+    try:
+        job_id = await enqueue_job(db_pool, job_type, payload, max_attempts)
+        return {"status": "success", "data": {"job_id": job_id}}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"建立背景工作失敗: {str(e)}")
+
+
+# 取得背景工作狀態與結果
+@app.post("/api/jobs/status")
+async def get_job_status(data: dict):
+    job_id = data.get("job_id")
+    if not job_id:
+        raise HTTPException(status_code=400, detail="缺少必要參數")
+
+    try:
+        job = await get_job(db_pool, job_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="無效的工作ID格式")
+    if not job:
+        raise HTTPException(status_code=404, detail="找不到指定的背景工作")
+    return {"status": "success", "data": job}
+
+
+# 取得資料庫連接池使用狀況
+@app.get("/api/system/db_pool_metrics")
+async def get_db_pool_metrics():
+    return {"status": "success", "data": db_pool.metrics()}
+
+
+# 取得權限索引快取使用狀況
+@app.get("/api/system/permission_cache_metrics")
+async def get_permission_cache_metrics():
+    return {"status": "success", "data": permission_cache.metrics()}
+
+
+# 取得使用者名稱與頭像快取使用狀況
+@app.get("/api/system/user_directory_metrics")
+async def get_user_directory_metrics():
+    return {"status": "success", "data": user_directory.metrics()}
+
+
+# 取得區塊鎖定租約使用狀況
+@app.get("/api/system/block_lock_metrics")
+async def get_block_lock_metrics():
+    return {"status": "success", "data": block_lock_manager.metrics()}
+
+
 
 if __name__ == "__main__":
     uvicorn.run("chatESG_FastAPI:app", host="0.0.0.0", port=8000, reload=True)
@@ -9,15 +9,23 @@ import jwt
 from datetime import datetime, timedelta, timezone
 import bcrypt
 import uvicorn
-import aiomysql
 import json
+import asyncio
 from contextlib import asynccontextmanager
 import uuid
 from dotenv import load_dotenv
 import os
+
+# 載入 .env 檔案 (rag_main、db_pool、job_queue 在匯入時讀取設定，須在匯入前載入)
+load_dotenv()
+
 # 準則驗證
-from rag_main import find_most_relevant_answer
+from rag_main import find_most_relevant_answers, retriever
 from ESG_Criteria_Assessment import Gemini_ESG_Criteria_Assessment
+# 資料庫連接池
+from db_pool import DatabasePool
+# 背景工作佇列
+from job_queue import job_handler, enqueue_job, JobWorker
 
 # 資料庫配置
 DB_CONFIG = {
@@ -41,24 +49,35 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 DEFAULT_USER_AVATAR = "https://raw.githubusercontent.com/wade0426/ChatESG_new/refs/heads/main/userPhoto/user-icons.png"
 DEFAULT_ORGANIZATION_LOGO = "https://raw.githubusercontent.com/wade0426/ChatESG_new/refs/heads/main/userPhoto/organization.png"
 
-# 資料庫連接池
-async def get_db_pool():
-    pool = await aiomysql.create_pool(**DB_CONFIG)
-    return pool
+# 資料庫連接池配置
+DB_POOL_CONFIG = {
+    'minsize': int(os.getenv("db_pool_minsize", 5)),
+    'maxsize': int(os.getenv("db_pool_maxsize", 20)),
+    'pool_recycle': int(os.getenv("db_pool_recycle", 3600)),
+    'health_check_interval': int(os.getenv("db_pool_health_check_interval", 30)),
+    'acquire_timeout': int(os.getenv("db_pool_acquire_timeout", 10)),
+    'long_hold_threshold': float(os.getenv("db_pool_long_hold_threshold", 5))
+}
+
+# 全域共用的資料庫連接池
+db_pool = DatabasePool(DB_CONFIG, **DB_POOL_CONFIG)
 
-# 全域變數儲存連接池
-db_pool = None
+# 背景工作程序 (只處理本服務註冊的準則檢驗工作，工作由準則檢驗 API 的 async_job 或 chatESG_FastAPI 的 /api/jobs/submit 建立)
+JOB_WORKERS = int(os.getenv("job_workers", 1))
+job_worker = JobWorker(db_pool, JOB_WORKERS)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 啟動時執行
-    global db_pool
-    db_pool = await get_db_pool()
+    await db_pool.init()
+    # 開啟向量資料庫並預熱嵌入模型
+    await asyncio.to_thread(retriever.warmup)
+    if JOB_WORKERS > 0:
+        await job_worker.start()
     yield
     # 關閉時執行
-    if db_pool:
-        db_pool.close()
-        await db_pool.wait_closed()
+    await job_worker.stop()
+    await db_pool.close()
 
 # 創建 FastAPI 應用
 app = FastAPI(lifespan=lifespan)
@@ -146,6 +165,12 @@ async def gri_verification_criteria_by_chapter(data: dict):
 
         if not all([esg_report]):
             raise HTTPException(status_code=400, detail="缺少必要參數")
+
+        # async_job 為 true 時建立背景工作並立即返回工作ID，結果以 chatESG_FastAPI 的 /api/jobs/status 查詢
+        if data.get("async_job"):
+            payload = {key: value for key, value in data.items() if key != "async_job"}
+            job_id = await enqueue_job(db_pool, "gri_verification_criteria_by_chapter", payload)
+            return {"status": "success", "data": {"job_id": job_id}}
         
         # 建立物件
         ESG_Criteria_Assessment = Gemini_ESG_Criteria_Assessment(api_keys, model_name, config, base_url, max_retry)
@@ -178,8 +203,9 @@ async def gri_verification_criteria_by_chapter(data: dict):
 
         # 使用集合未涵蓋的準則
         uncovered_standards = set()
+        # 已經涵蓋、需要查詢的準則
+        covered_criteria = []
         # criteria_lst 是這篇報告書的 GRI 準則清單
-        rag_content = ""
         for criteria in criteria_lst:
             # 將 criteria 轉換成 GRI 405
             # criteria = GRI 405-1 董事會性別多樣性
@@ -193,10 +219,13 @@ async def gri_verification_criteria_by_chapter(data: dict):
             # print(f"gri_code: {gri_code}")
             if gri_code in covered_standards_list:
                 print(f"已經涵蓋的準則: {gri_code}")
-                content, source, score = find_most_relevant_answer(criteria)
-                rag_content+=f"{content}\n"
+                covered_criteria.append(criteria)
             else:
                 uncovered_standards.add(gri_code)
+
+        # 一次批次查詢所有涵蓋的準則 (重複的段落只保留一次)
+        answers = await asyncio.to_thread(find_most_relevant_answers, covered_criteria)
+        rag_content = "".join(f"{content}\n" for content, source, score in answers)
         
         # 輸出未涵蓋的準則
         for gri_code in uncovered_standards:
@@ -243,6 +272,16 @@ async def gri_verification_criteria_by_chapter(data: dict):
         raise HTTPException(status_code=500, detail=f"處理請求時發生錯誤: {str(e)}")
 
 
+# 背景工作：準則檢驗 (參數與 /api/report/gri_verification_criteria_by_chapter 相同)
+@job_handler("gri_verification_criteria_by_chapter")
+async def gri_verification_criteria_by_chapter_job(payload: dict) -> dict:
+    try:
+        response = await gri_verification_criteria_by_chapter(payload)
+    except HTTPException as e:
+        raise Exception(e.detail)
+    return response["data"]
+
+
 
 if __name__ == "__main__":
     uvicorn.run("chatESG_FastAPI_v2:app", host="0.0.0.0", port=8002, reload=True)
\ No newline at end of file
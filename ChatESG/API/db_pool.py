@@ -0,0 +1,237 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+import aiomysql
+
+
+def load_db_config() -> tuple:
+    """
+    從環境變數 (.env) 讀取資料庫連線設定，API 與效能測試腳本共用
+
+    Returns:
+        tuple: (db_config, read_db_config)，未設定 db_read_host 時 read_db_config 為 None
+    """
+    db_config = {
+        'host': os.getenv("db_host", "localhost"),
+        'port': int(os.getenv("db_port", 3306)),
+        'user': os.getenv("db_user", "root"),
+        'password': os.getenv("db_password", ""),
+        'db': os.getenv("db_name", "chatesg_new"),
+        'charset': 'utf8mb4'
+    }
+    # 唯讀副本 (設定 db_read_host 後，唯讀查詢會導向副本，未設定則使用主資料庫)
+    read_db_config = {
+        **db_config,
+        'host': os.getenv("db_read_host"),
+        'port': int(os.getenv("db_read_port", db_config['port']))
+    } if os.getenv("db_read_host") else None
+    return db_config, read_db_config
+
+
+class DatabasePool:
+    """
+    全域共用的 aiomysql 連接池
+
+    所有 API 共用同一個連接池，由 FastAPI 的 lifespan 負責建立與關閉，
+    避免每次請求都重新建立連接池而造成連線洩漏。
+
+    功能:
+    - 最小 / 最大連線數設定
+    - 閒置連線回收 (pool_recycle)
+    - 取出連線時的健康檢查 (閒置過久的連線先 ping，必要時自動重連)
+    - 連接池飽和度統計 (等待時間、使用中連線數、飽和次數)
+    - 連線佔用統計 (每次借出的佔用時間、長時間佔用次數、平均佔用率)
+    - 唯讀連線 (一致性快照讀取、不加鎖，可選擇導向唯讀副本)
+    """
+
+    def __init__(self, db_config: dict, minsize=5, maxsize=20, pool_recycle=3600,
+                 health_check_interval=30, acquire_timeout=10, read_db_config: dict = None,
+                 long_hold_threshold=5):
+        """
+        Args:
+            db_config: 資料庫連線設定 (host, port, user, password, db, charset)
+            minsize: 連接池最小連線數
+            maxsize: 連接池最大連線數
+            pool_recycle: 連線閒置超過此秒數即回收重建，-1 表示不回收
+            health_check_interval: 連線閒置超過此秒數時，取出前先 ping 檢查
+            acquire_timeout: 等待可用連線的最長秒數
+            read_db_config: 唯讀副本的連線設定，None 表示唯讀查詢也使用主資料庫
+            long_hold_threshold: 連線佔用超過此秒數即記錄為長時間佔用 (例如持有連線等待 LLM)
+        """
+        self.db_config = db_config
+        self.read_db_config = read_db_config
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.pool_recycle = pool_recycle
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self.long_hold_threshold = long_hold_threshold
+        self._pool = None
+        self._read_pool = None
+        self._lock = asyncio.Lock()
+
+        # 統計資料
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._waiting = 0
+        self._acquire_count = 0
+        self._saturated_count = 0
+        self._timeout_count = 0
+        self._health_check_failures = 0
+        self._total_wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._total_hold_time = 0.0
+        self._max_hold_time = 0.0
+        self._long_hold_count = 0
+        self._started_at = time.monotonic()
+
+    async def init(self):
+        """建立連接池 (重複呼叫不會重複建立)"""
+        async with self._lock:
+            if self._pool is None:
+                self._pool = await aiomysql.create_pool(
+                    minsize=self.minsize,
+                    maxsize=self.maxsize,
+                    pool_recycle=self.pool_recycle,
+                    **self.db_config
+                )
+            if self.read_db_config and self._read_pool is None:
+                self._read_pool = await aiomysql.create_pool(
+                    minsize=self.minsize,
+                    maxsize=self.maxsize,
+                    pool_recycle=self.pool_recycle,
+                    **self.read_db_config
+                )
+        return self._pool
+
+    async def close(self):
+        """關閉連接池並等待所有連線釋放"""
+        for pool in (self._pool, self._read_pool):
+            if pool is not None:
+                pool.close()
+                await pool.wait_closed()
+        self._pool = None
+        self._read_pool = None
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        從連接池取出一條連線，離開時自動歸還
+
+        使用方式:
+            async with db_pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    ...
+        """
+        if self._pool is None:
+            await self.init()
+        async with self._acquire_from(self._pool) as conn:
+            yield conn
+
+    @asynccontextmanager
+    async def acquire_read(self):
+        """
+        取出一條唯讀連線，並開啟一致性快照的唯讀交易，離開時自動結束交易並歸還
+
+        只用於純查詢的 API：查詢不使用 FOR UPDATE，不會對資料列加鎖，
+        因此不會和正在編輯同一份報告書的寫入交易互相阻塞。
+        有設定唯讀副本時，查詢會導向副本。
+
+        使用方式:
+            async with db_pool.acquire_read() as conn:
+                async with conn.cursor() as cur:
+                    ...
+        """
+        if self._pool is None:
+            await self.init()
+        pool = self._read_pool or self._pool
+        async with self._acquire_from(pool) as conn:
+            await conn.query("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY")
+            try:
+                yield conn
+            finally:
+                # 唯讀交易沒有需要保存的變更，直接結束快照
+                await conn.rollback()
+
+    @asynccontextmanager
+    async def _acquire_from(self, pool):
+        """從指定的連接池取出連線並記錄統計資料"""
+        # 取出前記錄連接池是否已經飽和
+        if pool.freesize == 0 and pool.size >= pool.maxsize:
+            self._saturated_count += 1
+
+        self._waiting += 1
+        start_time = time.monotonic()
+        try:
+            conn = await asyncio.wait_for(pool.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._timeout_count += 1
+            raise
+        finally:
+            self._waiting -= 1
+
+        wait_time = time.monotonic() - start_time
+        self._acquire_count += 1
+        self._total_wait_time += wait_time
+        self._max_wait_time = max(self._max_wait_time, wait_time)
+
+        try:
+            await self._health_check(conn)
+        except Exception:
+            await pool.release(conn)
+            raise
+
+        self._in_use += 1
+        self._peak_in_use = max(self._peak_in_use, self._in_use)
+        hold_start = time.monotonic()
+        try:
+            yield conn
+        finally:
+            self._in_use -= 1
+            hold_time = time.monotonic() - hold_start
+            self._total_hold_time += hold_time
+            self._max_hold_time = max(self._max_hold_time, hold_time)
+            if hold_time >= self.long_hold_threshold:
+                self._long_hold_count += 1
+            await pool.release(conn)
+
+    async def _health_check(self, conn):
+        """閒置過久的連線先 ping 一次，斷線時自動重連"""
+        idle_time = asyncio.get_running_loop().time() - conn.last_usage
+        if idle_time < self.health_check_interval:
+            return
+        try:
+            await conn.ping(reconnect=True)
+        except Exception:
+            self._health_check_failures += 1
+            raise
+
+    def metrics(self) -> dict:
+        """取得連接池目前的使用狀況與飽和度統計"""
+        size = self._pool.size if self._pool else 0
+        freesize = self._pool.freesize if self._pool else 0
+        elapsed = time.monotonic() - self._started_at
+        return {
+            "readReplica": self._read_pool is not None,
+            "minsize": self.minsize,
+            "maxsize": self.maxsize,
+            "size": size,
+            "freesize": freesize,
+            "inUse": self._in_use,
+            "peakInUse": self._peak_in_use,
+            "waiting": self._waiting,
+            "saturation": round(self._in_use / self.maxsize, 3) if self.maxsize else 0,
+            "acquireCount": self._acquire_count,
+            "saturatedCount": self._saturated_count,
+            "timeoutCount": self._timeout_count,
+            "healthCheckFailures": self._health_check_failures,
+            "avgWaitMs": round(self._total_wait_time / self._acquire_count * 1000, 3) if self._acquire_count else 0,
+            "maxWaitMs": round(self._max_wait_time * 1000, 3),
+            "avgHoldMs": round(self._total_hold_time / self._acquire_count * 1000, 3) if self._acquire_count else 0,
+            "maxHoldMs": round(self._max_hold_time * 1000, 3),
+            "longHoldCount": self._long_hold_count,
+            # 啟動以來平均同時佔用的連線數佔最大連線數的比例
+            "avgOccupancy": round(self._total_hold_time / (elapsed * self.maxsize), 4) if elapsed and self.maxsize else 0
+        }
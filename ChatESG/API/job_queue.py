@@ -0,0 +1,310 @@
+import asyncio
+import contextvars
+import json
+import os
+import socket
+import traceback
+import uuid
+
+
+# 已註冊的工作處理函數 (工作類型 -> async 函數)
+JOB_HANDLERS = {}
+
+# 目前執行中的工作 (資料庫連接池, 工作ID, 領取標識)，供處理函數回報進度
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+# 重試設定
+JOB_RETRY_BASE_DELAY = int(os.getenv("job_retry_base_delay", 10))  # 第一次重試前等待的秒數，之後每次加倍
+JOB_RUNNING_TIMEOUT = int(os.getenv("job_running_timeout", 600))  # 執行超過此秒數視為工作程序已中斷，重新排入佇列
+JOB_REQUEUE_INTERVAL = int(os.getenv("job_requeue_interval", 60))  # 檢查執行過久工作的間隔秒數
+JOB_HEARTBEAT_INTERVAL = int(os.getenv("job_heartbeat_interval", max(1, JOB_RUNNING_TIMEOUT // 4)))  # 執行中的工作更新 LockedAt 的間隔秒數
+JOB_MAX_ATTEMPTS_LIMIT = int(os.getenv("job_max_attempts_limit", 10))  # 建立工作時可指定的最大執行次數上限
+
+
+def job_handler(job_type: str):
+    """
+    註冊背景工作處理函數
+
+    使用方式:
+        @job_handler("generate_text")
+        async def handle_generate_text(payload: dict) -> dict:
+            ...
+    """
+    def decorator(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+
+async def enqueue_job(db_pool, job_type: str, payload: dict, max_attempts: int = 3) -> str:
+    """
+    建立背景工作
+
+    Args:
+        db_pool: 資料庫連接池
+        job_type: 工作類型
+        payload: 工作參數
+        max_attempts: 最大執行次數 (包含第一次)
+
+    Returns:
+        str: 工作ID
+    """
+    job_id = uuid.uuid4()
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                INSERT INTO BackgroundJobs (JobID, JobType, Payload, MaxAttempts)
+                VALUES (%s, %s, %s, %s)
+            """, (job_id.bytes, job_type, json.dumps(payload, ensure_ascii=False), max_attempts))
+        await conn.commit()
+    return job_id.hex
+
+
+async def report_job_progress(progress: dict):
+    """
+    在處理函數中回報目前的進度，可由 get_job 的 progress 取得
+
+    不在背景工作中呼叫時不做任何事；工作已被重新領取時不會寫入。
+    """
+    current_job = _current_job.get()
+    if current_job is None:
+        return
+    db_pool, job_id, claim_id = current_job
+    progress_json = json.dumps(progress, ensure_ascii=False)
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                UPDATE BackgroundJobs
+                SET Progress = %s
+                WHERE JobID = %s AND LockedBy = %s
+            """, (progress_json, job_id, claim_id))
+        await conn.commit()
+
+
+async def get_job(db_pool, job_id: str):
+    """
+    取得背景工作的狀態與結果，找不到時返回 None
+    """
+    async with db_pool.acquire_read() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                SELECT JobType, Status, Result, ErrorMessage, Attempts, MaxAttempts, CreatedAt, LockedAt, FinishedAt, Progress
+                FROM BackgroundJobs
+                WHERE JobID = %s
+            """, (uuid.UUID(job_id).bytes,))
+            job = await cur.fetchone()
+    if not job:
+        return None
+    return {
+        "jobID": job_id,
+        "jobType": job[0],
+        "status": job[1],
+        "result": json.loads(job[2]) if job[2] else None,
+        "error": job[3],
+        "attempts": job[4],
+        "maxAttempts": job[5],
+        "createdAt": job[6].isoformat() if job[6] else None,
+        "startedAt": job[7].isoformat() if job[7] else None,
+        "finishedAt": job[8].isoformat() if job[8] else None,
+        "progress": json.loads(job[9]) if job[9] else None
+    }
+
+
+class JobWorker:
+    """
+    背景工作程序
+
+    從 BackgroundJobs 取出待執行的工作並交給對應的處理函數。
+    - 以 UPDATE ... LIMIT 1 搭配唯一的領取標識取出工作，多個工作程序不會重複執行同一個工作
+    - 執行期間定期更新 LockedAt，執行較久的工作不會被視為中斷；寫入結果時需符合領取標識，逾時被重新領取後舊的執行結果不會覆寫
+    - 失敗時依指數退避延後重試，超過最大執行次數則標記為失敗
+    - 定期將執行過久 (工作程序中斷) 的工作重新排入佇列，已用完執行次數的工作標記為失敗
+    """
+
+    def __init__(self, db_pool, concurrency=1, poll_interval=1.0, job_types=None):
+        """
+        Args:
+            db_pool: 資料庫連接池
+            concurrency: 同時執行的工作數
+            poll_interval: 佇列為空時的輪詢間隔秒數
+            job_types: 只處理這些類型的工作，None 表示處理所有已註冊的類型
+        """
+        self.db_pool = db_pool
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.job_types = job_types
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks = []
+        self._stopping = False
+
+    def _handled_types(self):
+        return list(self.job_types or JOB_HANDLERS.keys())
+
+    async def _requeue_stale_jobs(self):
+        """將執行過久的工作重新排入佇列，已用完執行次數的工作標記為失敗"""
+        async with self.db_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    UPDATE BackgroundJobs
+                    SET Status = 'failed', LockedBy = NULL, FinishedAt = NOW(6),
+                        ErrorMessage = '工作程序逾時，已達最大執行次數'
+                    WHERE Status = 'running'
+                    AND LockedAt < NOW(6) - INTERVAL %s SECOND
+                    AND Attempts >= MaxAttempts
+                """, (JOB_RUNNING_TIMEOUT,))
+                await cur.execute("""
+                    UPDATE BackgroundJobs
+                    SET Status = 'pending', LockedBy = NULL, LockedAt = NULL,
+                        ErrorMessage = '工作程序逾時，重新排入佇列'
+                    WHERE Status = 'running'
+                    AND LockedAt < NOW(6) - INTERVAL %s SECOND
+                    AND Attempts < MaxAttempts
+                """, (JOB_RUNNING_TIMEOUT,))
+            await conn.commit()
+
+    async def _claim_job(self):
+        """領取一個待執行的工作，沒有工作時返回 None"""
+        job_types = self._handled_types()
+        if not job_types:
+            return None
+        claim_id = f"{self.worker_id}:{uuid.uuid4().hex[:8]}"
+        placeholders = ", ".join(["%s"] * len(job_types))
+        async with self.db_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(f"""
+                    UPDATE BackgroundJobs
+                    SET Status = 'running', LockedBy = %s, LockedAt = NOW(6), Attempts = Attempts + 1
+                    WHERE Status = 'pending'
+                    AND RunAfter <= NOW(6)
+                    AND JobType IN ({placeholders})
+                    ORDER BY CreatedAt ASC
+                    LIMIT 1
+                """, (claim_id, *job_types))
+                await conn.commit()
+                if cur.rowcount == 0:
+                    return None
+                await cur.execute("""
+                    SELECT JobID, JobType, Payload, Attempts, MaxAttempts
+                    FROM BackgroundJobs
+                    WHERE LockedBy = %s AND Status = 'running'
+                """, (claim_id,))
+                job = await cur.fetchone()
+            await conn.commit()
+        return (*job, claim_id) if job else None
+
+    async def _heartbeat(self, job_id: bytes, claim_id: str):
+        """執行期間定期更新 LockedAt，工作已被重新領取時停止"""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                async with self.db_pool.acquire() as conn:
+                    async with conn.cursor() as cur:
+                        await cur.execute("""
+                            UPDATE BackgroundJobs
+                            SET LockedAt = NOW(6)
+                            WHERE JobID = %s AND LockedBy = %s AND Status = 'running'
+                        """, (job_id, claim_id))
+                        renewed = cur.rowcount > 0
+                    await conn.commit()
+            except Exception as e:
+                print(f"更新背景工作執行時間失敗: {e}")
+                continue
+            if not renewed:
+                print(f"背景工作 {uuid.UUID(bytes=job_id).hex} 已被重新領取，此次執行的結果將不會寫入")
+                return
+
+    async def _finish_job(self, job_id: bytes, claim_id: str, result: str):
+        async with self.db_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    UPDATE BackgroundJobs
+                    SET Status = 'completed', Result = %s, ErrorMessage = NULL,
+                        LockedBy = NULL, FinishedAt = NOW(6)
+                    WHERE JobID = %s AND LockedBy = %s
+                """, (result, job_id, claim_id))
+                if cur.rowcount == 0:
+                    print(f"背景工作 {uuid.UUID(bytes=job_id).hex} 已被重新領取，捨棄此次執行的結果")
+            await conn.commit()
+
+    async def _fail_job(self, job_id: bytes, claim_id: str, attempts: int, max_attempts: int, error: str):
+        """記錄失敗，尚有重試次數時延後重新排入佇列 (工作已被重新領取時不寫入)"""
+        async with self.db_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                if attempts < max_attempts:
+                    delay = JOB_RETRY_BASE_DELAY * (2 ** (attempts - 1))
+                    await cur.execute("""
+                        UPDATE BackgroundJobs
+                        SET Status = 'pending', ErrorMessage = %s, LockedBy = NULL, LockedAt = NULL,
+                            RunAfter = NOW(6) + INTERVAL %s SECOND
+                        WHERE JobID = %s AND LockedBy = %s
+                    """, (error, delay, job_id, claim_id))
+                else:
+                    await cur.execute("""
+                        UPDATE BackgroundJobs
+                        SET Status = 'failed', ErrorMessage = %s, LockedBy = NULL, FinishedAt = NOW(6)
+                        WHERE JobID = %s AND LockedBy = %s
+                    """, (error, job_id, claim_id))
+                if cur.rowcount == 0:
+                    print(f"背景工作 {uuid.UUID(bytes=job_id).hex} 已被重新領取，捨棄此次執行的錯誤")
+            await conn.commit()
+
+    async def _run_job(self, job):
+        job_id, job_type, payload, attempts, max_attempts, claim_id = job
+        print(f"開始執行背景工作 {uuid.UUID(bytes=job_id).hex} ({job_type})，第 {attempts} 次")
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, claim_id))
+        token = _current_job.set((self.db_pool, job_id, claim_id))
+        try:
+            result = await JOB_HANDLERS[job_type](json.loads(payload))
+            # 結果無法轉為 JSON 時視為執行失敗
+            result = json.dumps(result, ensure_ascii=False)
+        except Exception as e:
+            traceback.print_exc()
+            await self._fail_job(job_id, claim_id, attempts, max_attempts, str(e))
+        else:
+            await self._finish_job(job_id, claim_id, result)
+        finally:
+            _current_job.reset(token)
+            heartbeat.cancel()
+
+    async def _loop(self):
+        while not self._stopping:
+            try:
+                job = await self._claim_job()
+            except Exception as e:
+                print(f"領取背景工作失敗: {e}")
+                job = None
+            if job is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            try:
+                await self._run_job(job)
+            except Exception as e:
+                # 寫入結果失敗時工作維持 running，由 _requeue_stale_jobs 逾時後重新排入佇列
+                print(f"記錄背景工作結果失敗: {e}")
+
+    async def _requeue_loop(self):
+        while not self._stopping:
+            await asyncio.sleep(JOB_REQUEUE_INTERVAL)
+            try:
+                await self._requeue_stale_jobs()
+            except Exception as e:
+                print(f"重新排入逾時工作失敗: {e}")
+
+    async def start(self):
+        """啟動工作程序 (在目前的事件迴圈中執行)"""
+        try:
+            await self._requeue_stale_jobs()
+        except Exception as e:
+            print(f"重新排入逾時工作失敗: {e}")
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._loop()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._requeue_loop()))
+        print(f"背景工作程序已啟動: {self.worker_id}，並行數 {self.concurrency}，工作類型 {self._handled_types()}")
+
+    async def stop(self):
+        """停止領取新工作，並取消執行中的迴圈"""
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
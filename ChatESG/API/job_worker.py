@@ -0,0 +1,29 @@
+# 獨立的背景工作程序
+# 與 API 共用同一個 BackgroundJobs 佇列，可在其他機器上執行以分擔 AI 工作
+# 使用方式 (在 API 目錄下執行，需要 .env):
+#   python job_worker.py --app chatESG_FastAPI --concurrency 4
+#   python job_worker.py --app chatESG_FastAPI_v2 --concurrency 2
+
+import argparse
+import asyncio
+import importlib
+import os
+
+
+async def main(app_module, concurrency):
+    # 載入 API 模組以註冊工作處理函數，並沿用其 lifespan 建立連接池與工作程序
+    os.environ["job_workers"] = str(concurrency)
+    module = importlib.import_module(app_module)
+    async with module.lifespan(module.app):
+        await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="執行 BackgroundJobs 佇列中的背景工作")
+    parser.add_argument("--app", default="chatESG_FastAPI", help="註冊工作處理函數的 API 模組")
+    parser.add_argument("--concurrency", type=int, default=1, help="同時執行的工作數")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.app, args.concurrency))
+    except KeyboardInterrupt:
+        pass
@@ -1,13 +1,22 @@
 import subprocess
 import os
 import platform
-import codecs
 import uuid
 import asyncio
+import tempfile
+import hashlib
+import re
+from functools import lru_cache
 from dotenv import load_dotenv
 import os
 import json
 
+# 常駐瀏覽器渲染 (選用套件，未安裝時改用 mmdc)
+try:
+    from playwright.async_api import async_playwright
+except ImportError:
+    async_playwright = None
+
 # 載入 .env 檔案
 load_dotenv()
 
@@ -18,13 +27,24 @@ config = dict(json.loads(config))
 base_url = os.getenv("base_url")
 max_retry = int(os.getenv("max_retry"))
 
+# Mermaid 渲染設定
+mermaid_max_workers = int(os.getenv("mermaid_max_workers", 2))  # 同時執行的 mmdc 數量
+mermaid_max_queue = int(os.getenv("mermaid_max_queue", 20))  # 最多排隊等待的渲染工作數
+mermaid_queue_timeout = int(os.getenv("mermaid_queue_timeout", 30))  # 排隊等待的最長秒數
+mermaid_render_timeout = int(os.getenv("mermaid_render_timeout", 60))  # 單次渲染的最長秒數
+mermaid_renderer = os.getenv("mermaid_renderer", "browser")  # browser: 常駐瀏覽器渲染, mmdc: 每張圖啟動一次 Mermaid CLI
+mermaid_image_dir = os.getenv("mermaid_image_dir", "./images")  # 圖片輸出目錄
+mermaid_image_cache_max_mb = int(os.getenv("mermaid_image_cache_max_mb", 500))  # 圖片快取的容量上限 (MB)
+mermaid_js_source = os.getenv("mermaid_js_source")  # mermaid.js 的本機路徑或網址，未設定時使用本機的 mermaid.min.js (不需要對外網路)
+
 
 from ai_generate import GeminiGenerator
 
 
+@lru_cache(maxsize=1)
 def find_mmdc_path():
     """
-    找到 mmdc 執行檔的完整路徑
+    找到 mmdc 執行檔的完整路徑 (結果會被快取，只會搜尋一次)
     """
     if platform.system() == "Windows":
         # Windows 系統下的預設路徑
@@ -48,6 +68,425 @@ def find_mmdc_path():
     return "mmdc"  # 如果都找不到，返回預設命令
 
 
+@lru_cache(maxsize=1)
+def find_mermaid_js():
+    """
+    找到本機的 mermaid.min.js (結果會被快取，只會搜尋一次)
+
+    依序搜尋 API/static、專案的 node_modules，以及 Mermaid CLI (mmdc) 安裝目錄下的 node_modules。
+    只有設定 mermaid_js_source 時才會使用指定的路徑或 CDN 網址。
+
+    Returns:
+        str: mermaid.min.js 的路徑或網址，找不到時返回 None
+    """
+    if mermaid_js_source:
+        return mermaid_js_source
+
+    api_dir = os.path.dirname(os.path.abspath(__file__))
+    candidates = [
+        os.path.join(api_dir, "static", "mermaid.min.js"),
+        os.path.join(api_dir, "..", "node_modules", "mermaid", "dist", "mermaid.min.js")
+    ]
+    # mmdc 安裝時會一併安裝 mermaid，從 mmdc 的實際路徑往上層尋找
+    directory = os.path.dirname(os.path.realpath(find_mmdc_path()))
+    while True:
+        candidates.append(os.path.join(directory, "node_modules", "mermaid", "dist", "mermaid.min.js"))
+        candidates.append(os.path.join(
+            directory, "node_modules", "@mermaid-js", "mermaid-cli", "node_modules", "mermaid", "dist", "mermaid.min.js"
+        ))
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return os.path.normpath(candidate)
+    return None
+
+
+def build_mmdc_command(input_file, output_file, format="png", theme="default"):
+    """構建 Mermaid CLI 命令"""
+    command = [
+        find_mmdc_path(),  # 使用完整路徑
+        "-i", input_file,
+        "-o", output_file,
+        "-t", theme
+    ]
+    if format == "svg":
+        command.append("-s")
+    return command
+
+
+def write_temp_mmd(mermaid_code):
+    """將 Mermaid 語法寫入每個工作獨立的臨時檔案，返回檔案路徑"""
+    with tempfile.NamedTemporaryFile("w", suffix=".mmd", encoding="utf-8", delete=False) as tmp_file:
+        tmp_file.write(mermaid_code)
+        return tmp_file.name
+
+
+class MermaidRenderPool:
+    """
+    非同步 Mermaid 渲染池
+
+    - 每個渲染工作使用獨立的臨時檔案，同時渲染不會互相覆蓋
+    - 以非同步子程序執行 mmdc，不會阻塞事件迴圈
+    - 限制同時執行的 mmdc 數量，超過時排隊等待
+    - 排隊數量與等待時間都有上限，超過時拋出 asyncio.TimeoutError
+    """
+
+    def __init__(self, max_workers=2, max_queue=20, queue_timeout=30, render_timeout=60):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.render_timeout = render_timeout
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._waiting = 0
+
+    async def render(self, mermaid_code, output_file, format="png", theme="default"):
+        """
+        渲染 Mermaid 語法並輸出圖片
+
+        Args:
+            mermaid_code: 字串，Mermaid 語法。
+            output_file: 字串，輸出圖片檔案名稱 (包含副檔名)。
+            format: 字串，圖片格式，可以是 "png" 或 "svg"。
+            theme: 字串，Mermaid 主題 (default / forest / dark / neutral)。
+
+        Raises:
+            asyncio.TimeoutError: 排隊已滿、排隊逾時或渲染逾時
+            RuntimeError: mmdc 執行失敗
+        """
+        if self._waiting >= self.max_queue:
+            raise asyncio.TimeoutError("Mermaid 渲染佇列已滿")
+
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        finally:
+            self._waiting -= 1
+
+        temp_mmd_filename = write_temp_mmd(mermaid_code)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *build_mmdc_command(temp_mmd_filename, output_file, format, theme),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=self.render_timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise
+
+            if process.returncode != 0:
+                raise RuntimeError(f"執行 Mermaid CLI 時發生錯誤: {stderr.decode('utf-8', errors='ignore')}")
+
+            print(f"Mermaid 圖片已儲存為: {output_file}")
+        finally:
+            self._semaphore.release()
+            # 清理臨時檔案 (無論成功或失敗都刪除)
+            os.remove(temp_mmd_filename)
+
+
+# 全域共用的渲染池
+render_pool = MermaidRenderPool(mermaid_max_workers, mermaid_max_queue, mermaid_queue_timeout, mermaid_render_timeout)
+
+
+# 渲染頁面的 HTML (背景與 mmdc 預設相同為白色)
+RENDER_PAGE_HTML = """
+<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"></head>
+<body style="margin:0; background:white;">
+    <div id="container" style="display:inline-block;"></div>
+</body>
+</html>
+"""
+
+
+class MermaidBrowserRenderer:
+    """
+    常駐的 Mermaid 瀏覽器渲染服務
+
+    啟動時開啟一個無頭瀏覽器並預先載入 mermaid.js 到多個頁面，
+    之後每張圖只需在已就緒的頁面中呼叫 mermaid.render()，不需要每次重新啟動瀏覽器。
+    瀏覽器中斷時由 schedule_restart 在背景重新啟動，期間改用 mmdc 渲染。
+    """
+
+    def __init__(self, pages=2, queue_timeout=30, render_timeout=60, mermaid_js=None):
+        self.page_count = pages
+        self.queue_timeout = queue_timeout
+        self.render_timeout = render_timeout
+        self.mermaid_js = mermaid_js
+        self._playwright = None
+        self._browser = None
+        self._pages = None
+        self._render_count = 0
+        self._restart_task = None
+
+    @property
+    def started(self):
+        return self._browser is not None
+
+    @property
+    def connected(self):
+        """瀏覽器是否仍在執行"""
+        return self._browser is not None and self._browser.is_connected()
+
+    async def _new_page(self):
+        """建立已載入 mermaid.js 的頁面"""
+        page = await self._browser.new_page()
+        await page.set_content(RENDER_PAGE_HTML)
+        if os.path.exists(self.mermaid_js):
+            await page.add_script_tag(path=self.mermaid_js)
+        else:
+            # 只有明確設定 mermaid_js_source 為網址時才會從網路載入
+            await page.add_script_tag(url=self.mermaid_js)
+        await page.evaluate("() => mermaid.initialize({ startOnLoad: false })")
+        return page
+
+    async def start(self):
+        """啟動瀏覽器並建立頁面池"""
+        if self.started:
+            return
+        if async_playwright is None:
+            raise RuntimeError("未安裝 playwright，無法使用瀏覽器渲染")
+        self.mermaid_js = self.mermaid_js or find_mermaid_js()
+        if not self.mermaid_js:
+            raise RuntimeError("找不到本機的 mermaid.min.js，請安裝 Mermaid CLI 或設定 mermaid_js_source")
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=True)
+        self._pages = asyncio.Queue()
+        for _ in range(self.page_count):
+            self._pages.put_nowait(await self._new_page())
+        print(f"Mermaid 瀏覽器渲染已啟動，頁面數: {self.page_count}")
+
+    async def close(self):
+        """關閉瀏覽器 (瀏覽器已中斷時也可以呼叫)"""
+        browser, self._browser = self._browser, None
+        playwright, self._playwright = self._playwright, None
+        if browser is not None:
+            try:
+                await browser.close()
+            except Exception as e:
+                print(f"關閉 Mermaid 渲染瀏覽器失敗: {e}")
+        if playwright is not None:
+            try:
+                await playwright.stop()
+            except Exception as e:
+                print(f"關閉 playwright 失敗: {e}")
+
+    async def _restart(self):
+        await self.close()
+        try:
+            await self.start()
+        except Exception as e:
+            print(f"Mermaid 瀏覽器重新啟動失敗，繼續使用 mmdc: {e}")
+            await self.close()
+
+    def schedule_restart(self):
+        """在背景重新啟動已中斷的瀏覽器 (同時只會有一個重新啟動工作)"""
+        if self._restart_task is None or self._restart_task.done():
+            print("Mermaid 渲染瀏覽器已中斷，重新啟動中，期間改用 mmdc")
+            self._restart_task = asyncio.create_task(self._restart())
+
+    async def _render_on_page(self, page, mermaid_code, output_file, format, theme):
+        self._render_count += 1
+        svg = await page.evaluate(
+            """async ([id, code, theme]) => {
+                mermaid.initialize({ startOnLoad: false, theme: theme });
+                const { svg } = await mermaid.render(id, code);
+                document.getElementById("container").innerHTML = svg;
+                return svg;
+            }""",
+            [f"graph{self._render_count}", mermaid_code, theme]
+        )
+        if format == "svg":
+            with open(output_file, "w", encoding="utf-8") as file:
+                file.write(svg)
+        else:
+            await page.locator("#container svg").screenshot(path=output_file)
+
+    async def render(self, mermaid_code, output_file, format="png", theme="default"):
+        """
+        渲染 Mermaid 語法並輸出圖片
+
+        Args:
+            mermaid_code: 字串，Mermaid 語法。
+            output_file: 字串，輸出圖片檔案名稱 (包含副檔名)。
+            format: 字串，圖片格式，可以是 "png" 或 "svg"。
+            theme: 字串，Mermaid 主題 (default / forest / dark / neutral)。
+
+        Raises:
+            asyncio.TimeoutError: 等待頁面逾時或渲染逾時
+            RuntimeError: Mermaid 語法錯誤或渲染失敗
+        """
+        page = await asyncio.wait_for(self._pages.get(), timeout=self.queue_timeout)
+        try:
+            await asyncio.wait_for(
+                self._render_on_page(page, mermaid_code, output_file, format, theme),
+                timeout=self.render_timeout
+            )
+            print(f"Mermaid 圖片已儲存為: {output_file}")
+        except asyncio.TimeoutError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Mermaid 渲染失敗: {e}")
+        finally:
+            # 頁面已損壞時重新建立，避免影響後續的渲染
+            if page.is_closed():
+                try:
+                    page = await self._new_page()
+                except Exception as e:
+                    print(f"重新建立 Mermaid 渲染頁面失敗: {e}")
+                    page = None
+            if page is not None:
+                self._pages.put_nowait(page)
+
+
+# 全域共用的瀏覽器渲染服務
+browser_renderer = MermaidBrowserRenderer(mermaid_max_workers, mermaid_queue_timeout, mermaid_render_timeout)
+
+
+async def start_mermaid_renderer():
+    """啟動常駐的瀏覽器渲染服務，失敗時改用 mmdc 渲染"""
+    if mermaid_renderer != "browser":
+        return
+    try:
+        await browser_renderer.start()
+    except Exception as e:
+        print(f"Mermaid 瀏覽器渲染啟動失敗，改用 mmdc: {e}")
+        await browser_renderer.close()
+
+
+async def close_mermaid_renderer():
+    await browser_renderer.close()
+
+
+async def mermaid_to_image_async(mermaid_code, output_file="output.png", format="png", theme="default"):
+    """
+    將 Mermaid 語法轉換成圖片 (非同步版本)
+
+    已啟動常駐瀏覽器渲染時使用瀏覽器渲染，否則透過 mmdc 渲染池執行。
+
+    Args:
+        mermaid_code: 字串，Mermaid 語法。
+        output_file: 字串，輸出圖片檔案名稱 (包含副檔名)。預設為 "output.png"。
+        format: 字串，圖片格式，可以是 "png" 或 "svg"。預設為 "png"。
+        theme: 字串，Mermaid 主題。預設為 "default"。
+    """
+    if browser_renderer.started:
+        if browser_renderer.connected:
+            try:
+                await browser_renderer.render(mermaid_code, output_file, format, theme)
+                return
+            except Exception:
+                # 瀏覽器仍在執行表示是語法錯誤或渲染逾時，直接拋出
+                if browser_renderer.connected:
+                    raise
+        # 瀏覽器已中斷，重新啟動並改用 mmdc 完成此次渲染
+        browser_renderer.schedule_restart()
+    await render_pool.render(mermaid_code, output_file, format, theme)
+
+
+class MermaidImageCache:
+    """
+    以內容雜湊定址的 Mermaid 圖片快取
+
+    圖片以 (Mermaid 語法, 格式, 主題) 的 SHA-256 命名，相同的圖表直接返回既有的檔案，
+    不會再次渲染。快取目錄超過容量上限時，依最後使用時間刪除最久未使用的圖片 (LRU)。
+    圖片目錄中也有報告書上傳的圖片，清除時只會刪除快取建立的 (SHA-256 命名的) 圖片。
+    """
+
+    # 快取建立的圖片檔名 (SHA-256 + 副檔名)
+    CACHE_FILENAME_PATTERN = re.compile(r"^[0-9a-f]{64}\.(png|svg)$")
+
+    def __init__(self, image_dir="./images", max_bytes=500 * 1024 * 1024):
+        self.image_dir = image_dir
+        self.max_bytes = max_bytes
+        # 相同圖表同時請求時只渲染一次
+        self._rendering = {}
+
+    @staticmethod
+    def make_key(mermaid_code, format="png", theme="default"):
+        content = f"{format}\n{theme}\n{mermaid_code}".encode("utf-8")
+        return hashlib.sha256(content).hexdigest()
+
+    async def get_or_render(self, mermaid_code, format="png", theme="default"):
+        """
+        取得圖表圖片的檔名，快取中沒有時才進行渲染
+
+        Returns:
+            tuple: (圖片檔名, 是否命中快取)
+        """
+        filename = f"{self.make_key(mermaid_code, format, theme)}.{format}"
+        file_path = os.path.join(self.image_dir, filename)
+
+        if os.path.exists(file_path):
+            # 更新最後使用時間 (LRU 依此排序)
+            os.utime(file_path)
+            return filename, True
+
+        # 已有相同的圖表正在渲染，等待其完成即可
+        if filename in self._rendering:
+            await asyncio.shield(self._rendering[filename])
+            return filename, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._rendering[filename] = future
+        try:
+            os.makedirs(self.image_dir, exist_ok=True)
+            # 先輸出到暫存檔再改名，避免其他請求讀到未完成的圖片
+            temp_path = os.path.join(self.image_dir, f".{uuid.uuid4().hex}.{format}")
+            try:
+                await mermaid_to_image_async(mermaid_code, temp_path, format, theme)
+                os.replace(temp_path, file_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            future.set_result(filename)
+        except Exception as e:
+            future.set_exception(e)
+            # 避免沒有其他等待者時出現 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            del self._rendering[filename]
+
+        self.evict()
+        return filename, False
+
+    def evict(self):
+        """快取圖片超過容量上限時，刪除最久未使用的快取圖片 (不計入、不刪除其他圖片)"""
+        entries = []
+        total_bytes = 0
+        with os.scandir(self.image_dir) as iterator:
+            for entry in iterator:
+                if entry.is_file() and self.CACHE_FILENAME_PATTERN.match(entry.name):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total_bytes += stat.st_size
+
+        if total_bytes <= self.max_bytes:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total_bytes -= size
+            except OSError:
+                pass
+
+
+# 全域共用的圖片快取
+image_cache = MermaidImageCache(mermaid_image_dir, mermaid_image_cache_max_mb * 1024 * 1024)
+
+
 def mermaid_to_image(mermaid_code, output_file="output.png", format="png"):
     """
     將 Mermaid 語法轉換成圖片。
@@ -57,23 +496,11 @@ def mermaid_to_image(mermaid_code, output_file="output.png", format="png"):
         output_file: 字串，輸出圖片檔案名稱 (包含副檔名)。預設為 "output.png"。
         format: 字串，圖片格式，可以是 "png" 或 "svg"。預設為 "png"。
     """
-    # 獲取 mmdc 的完整路徑
-    mmdc_path = find_mmdc_path()
-
-    # 創建一個臨時檔案來存放 Mermaid 語法，使用 UTF-8 編碼
-    with codecs.open(os.path.join(os.getcwd(), "temp.mmd"), 'w', encoding='utf-8') as tmp_file:
-        tmp_file.write(mermaid_code)
-        temp_mmd_filename = tmp_file.name
+    # 創建一個獨立的臨時檔案來存放 Mermaid 語法，使用 UTF-8 編碼
+    temp_mmd_filename = write_temp_mmd(mermaid_code)
 
     # 構建 Mermaid CLI 命令
-    command = [
-        mmdc_path,  # 使用完整路徑
-        "-i", temp_mmd_filename,
-        "-o", output_file
-    ]
-
-    if format == "svg":
-        command.append("-s")
+    command = build_mmdc_command(temp_mmd_filename, output_file, format)
 
     try:
         # 執行 Mermaid CLI 命令
@@ -0,0 +1,100 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import bcrypt
+
+
+# 密碼雜湊設定
+password_hash_workers = int(os.getenv("password_hash_workers", min(4, os.cpu_count() or 1)))  # 同時計算 bcrypt 的數量
+password_hash_max_queue = int(os.getenv("password_hash_max_queue", 100))  # 最多排隊等待的數量
+password_hash_queue_timeout = int(os.getenv("password_hash_queue_timeout", 10))  # 排隊等待的最長秒數
+password_hash_executor = os.getenv("password_hash_executor", "thread")  # thread / process
+
+
+def hash_password(password: str, rounds: int) -> str:
+    salt = bcrypt.gensalt(rounds=rounds)
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+
+class PasswordHasher:
+    """
+    非同步密碼雜湊
+
+    bcrypt 每次約需數百毫秒的 CPU 時間，直接在事件迴圈中執行會阻塞所有 API。
+    - 在獨立的執行緒池 (bcrypt 計算時會釋放 GIL) 或程序池中計算
+    - 限制同時計算的數量，避免大量登入佔滿所有 CPU
+    - 排隊數量與等待時間都有上限，超過時拋出 asyncio.TimeoutError
+    """
+
+    def __init__(self, max_workers=4, max_queue=100, queue_timeout=10, executor="thread"):
+        """
+        Args:
+            max_workers: 同時計算 bcrypt 的數量
+            max_queue: 最多排隊等待的數量
+            queue_timeout: 排隊等待的最長秒數
+            executor: thread 使用執行緒池，process 使用程序池
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.executor_type = executor
+        self._executor = None
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._waiting = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.executor_type == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self._waiting >= self.max_queue:
+            raise asyncio.TimeoutError("密碼雜湊佇列已滿")
+
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        finally:
+            self._waiting -= 1
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self._semaphore.release()
+
+    async def hash(self, password: str, rounds: int) -> str:
+        """
+        計算密碼的 bcrypt 雜湊
+
+        Raises:
+            asyncio.TimeoutError: 排隊已滿或排隊逾時
+        """
+        return await self._run(hash_password, password, rounds)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        驗證密碼是否與 bcrypt 雜湊相符
+
+        Raises:
+            asyncio.TimeoutError: 排隊已滿或排隊逾時
+        """
+        return await self._run(check_password, plain_password, hashed_password)
+
+    def close(self):
+        """關閉執行緒池 / 程序池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# 全域共用的密碼雜湊
+password_hasher = PasswordHasher(password_hash_workers, password_hash_max_queue, password_hash_queue_timeout, password_hash_executor)
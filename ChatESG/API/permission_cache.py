@@ -0,0 +1,141 @@
+import os
+import time
+from collections import OrderedDict
+
+
+# 權限索引快取設定
+PERMISSION_CACHE_TTL = int(os.getenv("permission_cache_ttl", 300))  # 快取有效秒數 (多個 API 程序時，其他程序的寫入最多延遲此秒數生效)
+PERMISSION_CACHE_MAX_ASSETS = int(os.getenv("permission_cache_max_assets", 1000))  # 最多快取的資產數
+
+
+class PermissionIndexCache:
+    """
+    資產權限索引快取
+
+    每個資產的 RolePermissionMappings 整理成
+    {章節權限識別標籤: {角色ID: 操作類型}}，權限檢查只需要字典查詢。
+    - 以 LRU 方式保留最近使用的資產，並設有 TTL
+    - 寫入 RolePermissionMappings 的 API 在 commit 後呼叫 invalidate
+    - 每個資產有世代編號，查詢期間若被 invalidate，查詢結果不會寫入快取
+    - 未命中時以獨立的主資料庫連線讀取 (不使用呼叫端的一致性快照)，
+      世代編號在讀取開始前取得，快照早於寫入時一定能偵測到 invalidate
+    """
+
+    def __init__(self, db_pool, ttl=PERMISSION_CACHE_TTL, max_assets=PERMISSION_CACHE_MAX_ASSETS):
+        """
+        Args:
+            db_pool: 資料庫連接池
+            ttl: 快取有效秒數
+            max_assets: 最多快取的資產數
+        """
+        self.db_pool = db_pool
+        self.ttl = ttl
+        self.max_assets = max_assets
+        self._entries = OrderedDict()  # 資產ID -> (到期時間, 權限索引)
+        self._generations = {}  # 資產ID -> 世代編號
+        self._global_generation = 0
+
+        # 統計資料
+        self.hits = 0
+        self.misses = 0
+
+    def _generation(self, asset_id: bytes):
+        return (self._global_generation, self._generations.get(asset_id, 0))
+
+    @staticmethod
+    async def load_index(cur, asset_id: bytes) -> dict:
+        """
+        從資料庫讀取資產的權限索引 (不使用快取)
+
+        Args:
+            cur: 數據庫游標
+            asset_id: 資產ID (UUID bytes)
+
+        Returns:
+            dict: {章節權限識別標籤(bytes): {角色ID(bytes): 操作類型}}
+        """
+        await cur.execute("""
+            SELECT PermissionChapterID, RoleID, ActionType
+            FROM RolePermissionMappings
+            WHERE AssetID = %s
+        """, (asset_id,))
+        index = {}
+        for permission_chapter_id, role_id, action_type in await cur.fetchall():
+            index.setdefault(permission_chapter_id, {})[role_id] = action_type
+        return index
+
+    async def get_index(self, asset_id: bytes) -> dict:
+        """
+        取得資產的權限索引，快取不存在或過期時從主資料庫讀取
+
+        Args:
+            asset_id: 資產ID (UUID bytes)
+
+        Returns:
+            dict: {章節權限識別標籤(bytes): {角色ID(bytes): 操作類型}}
+        """
+        entry = self._entries.get(asset_id)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(asset_id)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        # 先取得世代編號再開始讀取，讀取期間的 invalidate 都會使世代編號不同
+        generation = self._generation(asset_id)
+        async with self.db_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                index = await self.load_index(cur, asset_id)
+            await conn.commit()
+
+        # 查詢期間權限已被修改時不寫入快取，避免保留舊的權限
+        if self._generation(asset_id) == generation:
+            self._entries[asset_id] = (time.monotonic() + self.ttl, index)
+            self._entries.move_to_end(asset_id)
+            while len(self._entries) > self.max_assets:
+                self._entries.popitem(last=False)
+        return index
+
+    def invalidate(self, asset_id: bytes = None):
+        """
+        清除資產的權限索引
+
+        Args:
+            asset_id: 資產ID (UUID bytes)，None 表示清除所有資產 (例如刪除角色時)
+        """
+        if asset_id is None:
+            self._global_generation += 1
+            self._entries.clear()
+            self._generations.clear()
+        else:
+            self._generations[asset_id] = self._generations.get(asset_id, 0) + 1
+            self._entries.pop(asset_id, None)
+
+    def metrics(self) -> dict:
+        """取得快取統計資料"""
+        total = self.hits + self.misses
+        return {
+            "assets": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+def has_permission(index: dict, permission_chapter_id: bytes, role_ids: set, actions=("read", "read_write")) -> bool:
+    """
+    檢查角色是否擁有章節的指定權限
+
+    Args:
+        index: PermissionIndexCache 的權限索引
+        permission_chapter_id: 章節權限識別標籤 (UUID bytes)
+        role_ids: 用戶角色ID集合 (UUID bytes)
+        actions: 允許的操作類型
+
+    Returns:
+        bool: 是否有權限
+    """
+    roles = index.get(permission_chapter_id)
+    if not roles:
+        return False
+    return any(roles.get(role_id) in actions for role_id in role_ids)
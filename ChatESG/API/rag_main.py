@@ -2,6 +2,8 @@ import json
 import os
 import time
 import shutil
+import threading
+import torch
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
 from opencc import OpenCC
@@ -14,8 +16,80 @@ cc = OpenCC('t2s')
 ccs2t = OpenCC('s2t')
 
 model_name = "chuxin-llm/Chuxin-Embedding"
-model_kwargs = {'device': 'cuda'}
-embedding = HuggingFaceEmbeddings(model_name=model_name,model_kwargs=model_kwargs)
+
+# 嵌入模型設定
+# rag_embedding_device: auto / cuda / mps / cpu，auto 會自動偵測可用的 GPU
+# rag_embedding_backend: torch / int8 / onnx，int8 與 onnx 為 CPU 量化推論
+# rag_embedding_onnx_file: onnx 後端使用的模型檔 (例如 onnx/model_qint8_avx512_vnni.onnx)，未設定時自動匯出 ONNX 模型
+# rag_cpu_threads: CPU 推論使用的執行緒數，0 表示使用預設值
+EMBEDDING_DEVICE = os.getenv("rag_embedding_device", "auto")
+EMBEDDING_BACKEND = os.getenv("rag_embedding_backend", "torch")
+EMBEDDING_ONNX_FILE = os.getenv("rag_embedding_onnx_file", "")
+CPU_THREADS = int(os.getenv("rag_cpu_threads", 0))
+
+
+def detect_device(device="auto"):
+    """自動偵測可用的運算裝置"""
+    if device != "auto":
+        return device
+    if torch.cuda.is_available():
+        return "cuda"
+    if getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def create_embedding(device=EMBEDDING_DEVICE, backend=EMBEDDING_BACKEND, cpu_threads=CPU_THREADS):
+    """
+    建立嵌入模型
+
+    Args:
+        device (str): 運算裝置 (auto / cuda / mps / cpu)
+        backend (str): 推論後端
+            - torch: 原始模型
+            - int8: 以 PyTorch 動態量化將 Linear 層轉為 int8 (僅 CPU)
+            - onnx: 使用 sentence-transformers 的 ONNX 後端載入量化模型 (僅 CPU)
+        cpu_threads (int): CPU 推論使用的執行緒數，0 表示使用預設值
+
+    Returns:
+        HuggingFaceEmbeddings: 嵌入模型
+    """
+    device = detect_device(device)
+    if backend in ("int8", "onnx") and device != "cpu":
+        print(f"{backend} 後端僅支援 CPU，改用 CPU 推論")
+        device = "cpu"
+    if device == "cpu" and cpu_threads > 0:
+        torch.set_num_threads(cpu_threads)
+
+    model_kwargs = {'device': device}
+    if backend == "onnx":
+        model_kwargs['backend'] = "onnx"
+        model_kwargs['model_kwargs'] = {"provider": "CPUExecutionProvider"}
+        if EMBEDDING_ONNX_FILE:
+            model_kwargs['model_kwargs']['file_name'] = EMBEDDING_ONNX_FILE
+
+    embedding = HuggingFaceEmbeddings(model_name=model_name, model_kwargs=model_kwargs)
+
+    if backend == "int8":
+        # 動態量化：權重以 int8 儲存，推論時即時量化激活值
+        # _client (SentenceTransformer 模型) 為 langchain_huggingface 的內部屬性，版本更新時可能改名
+        if not isinstance(getattr(embedding, "_client", None), torch.nn.Module):
+            raise RuntimeError(
+                "int8 後端無法取得 HuggingFaceEmbeddings._client 模型，"
+                "目前的 langchain_huggingface 版本不支援，請改用 torch 或 onnx 後端"
+            )
+        embedding._client = torch.quantization.quantize_dynamic(
+            embedding._client, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+    print(f"嵌入模型已載入: device={device}, backend={backend}")
+    return embedding
+
+
+embedding = create_embedding()
+
+# 預設的向量資料庫路徑
+DEFAULT_DB_PATH = os.getenv("rag_db_path", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rag_file", "db"))
 
 # 定義 Document 類型
 class Document:
@@ -26,6 +100,37 @@ class Document:
     def __repr__(self):
         return f"Document(page_content={self.page_content}, metadata={self.metadata})"
 
+class GRIRetriever:
+    """
+    常駐的 GRI 準則檢索服務
+
+    向量資料庫只在第一次使用 (或服務啟動時) 開啟一次，之後的查詢都直接使用
+    已載入記憶體的索引，不會每次查詢都重新開啟資料庫。
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, embedding_function=embedding):
+        self.db_path = db_path
+        self.embedding_function = embedding_function
+        self.vectordb = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """開啟向量資料庫 (重複呼叫不會重複開啟)"""
+        if self.vectordb is None:
+            with self._lock:
+                if self.vectordb is None:
+                    self.vectordb = Chroma(persist_directory=self.db_path, embedding_function=self.embedding_function)
+        return self.vectordb
+
+    def warmup(self):
+        """開啟資料庫並執行一次查詢，預先載入嵌入模型與索引，避免第一個請求變慢"""
+        self.load().similarity_search_with_score(query=cc.convert("GRI 1 基礎"), k=1)
+
+
+# 全域共用的檢索服務
+retriever = GRIRetriever()
+
+
 def find_most_relevant_answer(question, vectordb=None):
     """
     輸入問題和向量資料庫，輸出最相關的解答
@@ -38,9 +143,8 @@ def find_most_relevant_answer(question, vectordb=None):
         tuple: (最相關文檔內容, 文檔來源, 相似度分數)
     """
     if vectordb is None:
-        # 指定預設的資料庫路徑
-        db_path = r"D:\\NTCUST\\Project\\ChatESG_new\\ChatESG\\API\\rag_file\\db"
-        vectordb = Chroma(persist_directory=db_path, embedding_function=embedding)
+        # 使用常駐的預設資料庫
+        vectordb = retriever.load()
     
     # 使用繁轉簡進行搜尋
     docs = vectordb.similarity_search_with_score(query=cc.convert(question), k=1)
@@ -54,6 +158,43 @@ def find_most_relevant_answer(question, vectordb=None):
     return content, source, score
 
 
+def find_most_relevant_answers(questions, vectordb=None, k=1):
+    """
+    批次查詢多個問題，輸出去除重複後的相關解答
+
+    所有問題在同一次模型推論中完成嵌入，再一次送出所有的 k-NN 查詢。
+
+    Args:
+        questions (list): 輸入的問題列表
+        vectordb: 向量資料庫實例，如果為None則使用常駐的預設資料庫
+        k (int): 每個問題取回的文檔數
+
+    Returns:
+        list: [(文檔內容, 文檔來源, 相似度分數)]，依第一次出現的順序排列，重複的文檔只保留分數最佳的一筆
+    """
+    if not questions:
+        return []
+    if vectordb is None:
+        vectordb = retriever.load()
+
+    # 使用繁轉簡進行搜尋，並一次完成所有問題的嵌入
+    query_embeddings = vectordb.embeddings.embed_documents([cc.convert(question) for question in questions])
+    results = vectordb._collection.query(
+        query_embeddings=query_embeddings,
+        n_results=k,
+        include=["documents", "metadatas", "distances"]
+    )
+
+    # 依文檔內容去除重複，保留距離最小 (最相關) 的分數
+    answers = {}
+    for documents, metadatas, distances in zip(results["documents"], results["metadatas"], results["distances"]):
+        for page_content, metadata, score in zip(documents, metadatas, distances):
+            if page_content not in answers or score < answers[page_content][2]:
+                answers[page_content] = (ccs2t.convert(page_content), metadata["source"], score)
+
+    return list(answers.values())
+
+
 if __name__ == "__main__":
 
     # 如果向量資料庫不存在，則建庫
@@ -0,0 +1,123 @@
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+
+# 使用者資料快取設定
+USER_DIRECTORY_TTL = int(os.getenv("user_directory_ttl", 300))  # 快取有效秒數 (多個 API 程序時，其他程序的修改最多延遲此秒數生效)
+USER_DIRECTORY_MAX_ENTRIES = int(os.getenv("user_directory_max_entries", 10000))  # 最多快取的使用者數
+
+
+class UserDirectoryCache:
+    """
+    使用者名稱與頭像快取
+
+    顯示建立者、修改者、鎖定者時只需要 UserName 與 AvatarUrl，
+    以 get_many 一次取得多個使用者，未快取的使用者以單一 IN 查詢讀取。
+    - 以 LRU 方式保留最近使用的使用者，並設有 TTL
+    - 修改使用者名稱或頭像的 API 在 commit 後呼叫 invalidate
+    - 每個使用者有世代編號，查詢期間若被 invalidate，查詢結果不會寫入快取
+    """
+
+    def __init__(self, default_avatar: str = None, ttl=USER_DIRECTORY_TTL, max_entries=USER_DIRECTORY_MAX_ENTRIES):
+        """
+        Args:
+            default_avatar: 使用者沒有頭像時使用的預設圖片
+            ttl: 快取有效秒數
+            max_entries: 最多快取的使用者數
+        """
+        self.default_avatar = default_avatar
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # 使用者ID -> (到期時間, (UserName, AvatarUrl))
+        self._generations = {}  # 使用者ID -> 世代編號
+
+        # 統計資料
+        self.hits = 0
+        self.misses = 0
+
+    def _profile(self, user_id: bytes, user) -> dict:
+        return {
+            "id": uuid.UUID(bytes=user_id).hex,
+            "name": user[0],
+            "avatarUrl": user[1] or self.default_avatar
+        }
+
+    async def get_many(self, cur, user_ids) -> dict:
+        """
+        一次取得多個使用者的名稱與頭像
+
+        Args:
+            cur: 數據庫游標
+            user_ids: 使用者ID (UUID bytes) 的可迭代物件，None 會被忽略
+
+        Returns:
+            dict: {使用者ID(bytes): {"id", "name", "avatarUrl"}}，不存在的使用者不會出現在結果中
+        """
+        users = {}
+        missing = []
+        now = time.monotonic()
+        for user_id in dict.fromkeys(user_id for user_id in user_ids if user_id):
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                users[user_id] = entry[1]
+                self.hits += 1
+            else:
+                missing.append(user_id)
+
+        if missing:
+            self.misses += len(missing)
+            generations = {user_id: self._generations.get(user_id, 0) for user_id in missing}
+            placeholders = ", ".join(["%s"] * len(missing))
+            await cur.execute(f"""
+                SELECT UserID, UserName, AvatarUrl
+                FROM Users
+                WHERE UserID IN ({placeholders})
+            """, missing)
+            expires_at = time.monotonic() + self.ttl
+            for user_id, user_name, avatar_url in await cur.fetchall():
+                users[user_id] = (user_name, avatar_url)
+                # 查詢期間資料已被修改時不寫入快取
+                if self._generations.get(user_id, 0) == generations.get(user_id):
+                    self._entries[user_id] = (expires_at, users[user_id])
+                    self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return {user_id: self._profile(user_id, user) for user_id, user in users.items()}
+
+    async def get(self, cur, user_id: bytes):
+        """
+        取得單一使用者的名稱與頭像，不存在時返回 None
+        """
+        if not user_id:
+            return None
+        return (await self.get_many(cur, [user_id])).get(user_id)
+
+    def peek(self, user_id: bytes):
+        """
+        只從快取取得使用者的名稱與頭像 (不查詢資料庫)，未快取或已過期時返回 None
+        """
+        entry = self._entries.get(user_id)
+        if not entry or entry[0] <= time.monotonic():
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return self._profile(user_id, entry[1])
+
+    def invalidate(self, user_id: bytes):
+        """清除使用者的快取資料"""
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        self._entries.pop(user_id, None)
+
+    def metrics(self) -> dict:
+        """取得快取統計資料"""
+        total = self.hits + self.misses
+        return {
+            "users": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
@@ -154,8 +154,9 @@ CREATE TABLE ReportContentBlocks (
     ModifiedBy BINARY(16) DEFAULT NULL COMMENT '內容修改者(UUID)',
     IsLocked BOOLEAN NOT NULL DEFAULT FALSE COMMENT '是否被鎖定',
     LockedBy BINARY(16) DEFAULT NULL COMMENT '鎖定者(UUID)',
-    LockedAt TIMESTAMP(6) NULL DEFAULT NULL COMMENT '鎖定時間',
+    LockedAt TIMESTAMP(6) NULL DEFAULT NULL COMMENT '鎖定時間 (最後一次續約時間，超過租約秒數未續約即視為過期)',
     version INT DEFAULT 1,
+    INDEX idx_block_lock (IsLocked, LockedAt), -- 鎖定清除程序依租約時間解除過期鎖定
     FOREIGN KEY (AssetID) REFERENCES OrganizationAssets(AssetID) ON DELETE CASCADE,
     FOREIGN KEY (ModifiedBy) REFERENCES Users(UserID) ON DELETE SET NULL,
     FOREIGN KEY (LockedBy) REFERENCES Users(UserID) ON DELETE SET NULL
@@ -211,6 +212,8 @@ ALTER TABLE OrganizationMembers ADD INDEX idx_membership_time (OrganizationID, C
 -- OrganizationAssets 表索引優化
 -- DROP INDEX idx_createdat_desc ON OrganizationAssets; -- 不需要這行，因為索引本來就不存在
 ALTER TABLE OrganizationAssets ADD INDEX idx_active_assets (OrganizationID, IsDeleted, Status); -- 優化活躍資產查詢
+ALTER TABLE OrganizationAssets ADD INDEX idx_asset_listing (OrganizationID, IsDeleted, UpdatedAt, AssetID); -- 資產列表依更新時間的游標分頁
+ALTER TABLE OrganizationAssets ADD INDEX idx_asset_type_status (OrganizationID, IsDeleted, AssetType, Status); -- 依資產類型 (及狀態) 篩選與計數
 ALTER TABLE OrganizationAssets ADD INDEX idx_industry_type (IndustryType); -- 為 IndustryType 欄位添加索引以優化查詢
 
 -- ReportContentBlocks 表索引優化
@@ -218,6 +221,8 @@ ALTER TABLE ReportContentBlocks
 ADD INDEX idx_lock_status (IsLocked, LockedBy, LockedAt), -- 鎖定狀態查詢
 ADD INDEX idx_content_state (status, IsLocked), -- 簡化現有索引，去掉較少使用的LastModified
 ADD INDEX idx_asset_content (AssetID, status); -- 資產內容查詢優化
+-- 已建立的資料庫需另外執行 (新建立的資料表已在 CREATE TABLE 中包含此索引)
+-- ALTER TABLE ReportContentBlocks ADD INDEX idx_block_lock (IsLocked, LockedAt);
 
 -- Roles 表索引優化
 ALTER TABLE Roles ADD INDEX idx_org_management (OrganizationID, RoleName, CreatedAt);
@@ -336,4 +341,51 @@ CREATE TABLE ContentBlockVersions (
     ModifiedBy BINARY(16) DEFAULT NULL COMMENT '內容修改者(UUID)',
     CreatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '版本創建時間',
     FOREIGN KEY (ModifiedBy) REFERENCES Users(UserID) ON DELETE SET NULL
-) COMMENT '區塊版本歷史資料表';
\ No newline at end of file
+) COMMENT '區塊版本歷史資料表';
+
+-- --------------------------------------------------------
+-- 審核收件匣資料表 (選用，設定 review_inbox_enabled=true 時使用)
+-- 預先計算每位使用者目前可審核的送審項目，由送審、審核、審核流程設定與角色變更的 API 維護
+-- --------------------------------------------------------
+CREATE TABLE ReviewInbox (
+    UserID BINARY(16) NOT NULL COMMENT '可審核的使用者(UUID)',
+    WorkflowInstanceID BINARY(16) NOT NULL COMMENT '審核流程實例(UUID)',
+    OrganizationID BINARY(16) NOT NULL COMMENT '所屬組織(UUID)',
+    AssetID BINARY(16) NOT NULL COMMENT '所屬資產(UUID)',
+    WorkflowStageID BINARY(16) NOT NULL COMMENT '目前的審核流程階段(UUID)',
+    SubmitterID BINARY(16) DEFAULT NULL COMMENT '送審者(UUID)',
+    BlockVersionID BINARY(16) COMMENT '送審內容',
+    SubmittedAt TIMESTAMP NULL DEFAULT NULL COMMENT '送審時間',
+    PRIMARY KEY (UserID, WorkflowInstanceID),
+    INDEX idx_inbox_user (UserID, SubmittedAt, WorkflowInstanceID), -- 依使用者分頁讀取收件匣
+    INDEX idx_inbox_instance (WorkflowInstanceID),
+    INDEX idx_inbox_asset (AssetID),
+    INDEX idx_inbox_organization (OrganizationID),
+    FOREIGN KEY (UserID) REFERENCES Users(UserID) ON DELETE CASCADE,
+    FOREIGN KEY (WorkflowInstanceID) REFERENCES WorkflowInstances(WorkflowInstanceID) ON DELETE CASCADE
+) COMMENT '審核收件匣資料表';
+
+-- --------------------------------------------------------
+-- 背景工作佇列資料表
+-- 記錄需要長時間執行的 AI 工作 (文字生成、準則檢驗、圖表生成)，由背景工作程序取出執行
+-- --------------------------------------------------------
+CREATE TABLE BackgroundJobs (
+    JobID BINARY(16) PRIMARY KEY COMMENT '工作唯一標識 (UUID)',
+    JobType VARCHAR(50) NOT NULL COMMENT '工作類型 (例如：generate_text, generate_mermaid_image)',
+    Payload JSON NOT NULL COMMENT '工作參數',
+    Status ENUM('pending', 'running', 'completed', 'failed') NOT NULL DEFAULT 'pending' COMMENT '工作狀態',
+    Result JSON NULL COMMENT '工作結果',
+    Progress JSON NULL COMMENT '執行中的進度 (由處理函數回報，例如整份報告書生成)',
+    ErrorMessage TEXT NULL COMMENT '最後一次執行的錯誤訊息',
+    Attempts INT UNSIGNED NOT NULL DEFAULT 0 COMMENT '已執行次數',
+    MaxAttempts INT UNSIGNED NOT NULL DEFAULT 3 COMMENT '最大執行次數',
+    RunAfter TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) COMMENT '最早可執行時間 (重試時延後)',
+    LockedBy VARCHAR(100) NULL COMMENT '執行中的工作程序標識',
+    LockedAt TIMESTAMP(6) NULL DEFAULT NULL COMMENT '最後一次心跳時間 (執行期間定期更新)',
+    CreatedAt TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) COMMENT '建立時間',
+    FinishedAt TIMESTAMP(6) NULL DEFAULT NULL COMMENT '完成時間',
+    INDEX idx_job_queue (Status, RunAfter, CreatedAt),
+    INDEX idx_job_locked (LockedBy)
+) COMMENT '背景工作佇列資料表';
+-- 已建立的資料庫需另外執行
+-- ALTER TABLE BackgroundJobs ADD COLUMN Progress JSON NULL COMMENT '執行中的進度 (由處理函數回報，例如整份報告書生成)' AFTER Result;